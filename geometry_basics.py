@@ -1,6 +1,10 @@
 import math
+from array import array
 
 class Point:
+    # Points are by far the most common objects, so we save memory by using slots
+    __slots__ = ("x", "y", "node_id", "dist")
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -23,6 +27,60 @@ class Point:
             return f"<x:{self.x} y:{self.y} dist:{self.dist:.6g}>"
         return f"<x:{self.x} y:{self.y}>"
 
+# PointArray
+#
+# Compact storage of a way, with coordinates, dist and node_id in parallel arrays. Used
+# when ways are stored or passed between processes. The merge and resolve code relies on
+# points being shared between ways and search structures, so there ways are always lists
+# of Point, created with to_points().
+#
+class PointArray:
+    __slots__ = ("xs", "ys", "dists", "node_ids")
+
+    def __init__(self, xs=None, ys=None, dists=None, node_ids=None):
+        self.xs = array('d') if xs is None else xs
+        self.ys = array('d') if ys is None else ys
+        self.dists = array('d', [-1] * len(self.xs)) if dists is None else dists
+        self.node_ids = array('q', [-1] * len(self.xs)) if node_ids is None else node_ids
+
+    @classmethod
+    def from_points(cls, points):
+        return cls(array('d', [ p.x for p in points ]),
+                   array('d', [ p.y for p in points ]),
+                   array('d', [ p.dist for p in points ]),
+                   array('q', [ p.node_id for p in points ]))
+
+    def to_points(self):
+        points = []
+        for x, y, dist, node_id in zip(self.xs, self.ys, self.dists, self.node_ids):
+            p = Point(x, y)
+            p.dist = dist
+            p.node_id = node_id
+            points.append(p)
+        return points
+
+    def append(self, p):
+        self.xs.append(p.x)
+        self.ys.append(p.y)
+        self.dists.append(p.dist)
+        self.node_ids.append(p.node_id)
+
+    def __len__(self):
+        return len(self.xs)
+
+    def __getitem__(self, i):
+        # note: returns a new Point each time
+        p = Point(self.xs[i], self.ys[i])
+        p.dist = self.dists[i]
+        p.node_id = self.node_ids[i]
+        return p
+
+    def __iter__(self):
+        return iter(self.to_points())
+
+    def bounds(self):
+        return min(self.xs), min(self.ys), max(self.xs), max(self.ys)
+
 def dist2d(p1, p2):
     dx = p2.x - p1.x
     dy = p2.y - p1.y
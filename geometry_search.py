@@ -1,10 +1,153 @@
 import logging
 
 from geometry_basics import *
-from twodimsearch import TwoDimSearch
+from twodimsearch import new_two_dim_search, get_search_backend
 
 _log = logging.getLogger("geometry")
 
+# SegmentGrid
+#
+# Uniform grid where each cell holds the ways that have a line segment passing through the cell.
+# With cell size equal to the search distance a range search touches at most 9 cells, and
+# long segments are found without inserting fill points along them.
+#
+class SegmentGrid:
+    def __init__(self, cell_size):
+        self._cell_size = float(cell_size)
+        self._cells = {} # (cell_x, cell_y) => set of ways
+        self._way_cells = {} # way => set of (cell_x, cell_y), for removal
+
+    def _cell_idx(self, v):
+        return int(math.floor(v / self._cell_size))
+
+    def _segment_cells(self, p1, p2):
+        # walk the columns covered by the segment, and for each column take the cells between
+        # the segment's min and max y inside that column
+        if p1.x > p2.x:
+            p1, p2 = p2, p1
+        cx1 = self._cell_idx(p1.x)
+        cx2 = self._cell_idx(p2.x)
+        if cx1 == cx2:
+            cy1 = self._cell_idx(min(p1.y, p2.y))
+            cy2 = self._cell_idx(max(p1.y, p2.y))
+            return [ (cx1, cy) for cy in range(cy1, cy2 + 1) ]
+        cells = []
+        slope = (p2.y - p1.y) / (p2.x - p1.x)
+        for cx in range(cx1, cx2 + 1):
+            x_start = max(p1.x, cx * self._cell_size)
+            x_end = min(p2.x, (cx + 1) * self._cell_size)
+            y_start = p1.y + (x_start - p1.x) * slope
+            y_end = p1.y + (x_end - p1.x) * slope
+            cy1 = self._cell_idx(min(y_start, y_end))
+            cy2 = self._cell_idx(max(y_start, y_end))
+            for cy in range(cy1, cy2 + 1):
+                cells.append((cx, cy))
+        return cells
+
+    def insert(self, p1, p2, way):
+        way_cells = self._way_cells.get(way)
+        if way_cells is None:
+            way_cells = set()
+            self._way_cells[way] = way_cells
+        for cell_key in self._segment_cells(p1, p2):
+            if cell_key in way_cells:
+                continue
+            way_cells.add(cell_key)
+            cell = self._cells.get(cell_key)
+            if cell is None:
+                self._cells[cell_key] = {way}
+            else:
+                cell.add(way)
+
+    def __len__(self):
+        return len(self._cells)
+
+    def remove_ref(self, way):
+        for cell_key in self._way_cells.pop(way, []):
+            cell = self._cells[cell_key]
+            cell.discard(way)
+            if len(cell) == 0:
+                del self._cells[cell_key]
+
+    def find_all_along_way(self, points):
+        # ways with a segment in the same cell as (or a neighbor cell to) any segment in 'points',
+        # which includes all ways that cross it
+        cells = set()
+        it = iter(points)
+        prev = next(it)
+        for p in it:
+            cells.update(self._segment_cells(prev, p))
+            prev = p
+        ways = set()
+        for cx, cy in cells:
+            for nx in (cx - 1, cx, cx + 1):
+                for ny in (cy - 1, cy, cy + 1):
+                    cell = self._cells.get((nx, ny))
+                    if cell is not None:
+                        ways.update(cell)
+        return ways
+
+    def find_all_within(self, point, distance):
+        ways = set()
+        cx1 = self._cell_idx(point.x - distance)
+        cx2 = self._cell_idx(point.x + distance)
+        cy1 = self._cell_idx(point.y - distance)
+        cy2 = self._cell_idx(point.y + distance)
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                cell = self._cells.get((cx, cy))
+                if cell is not None:
+                    ways.update(cell)
+        return ways
+
+# WaySegmentIndex
+#
+# Index over the line segments of a single way, bucketed on bounding box, used to quickly find
+# which segments another line segment may intersect.
+#
+class WaySegmentIndex:
+    def __init__(self, points, cell_size):
+        self._points = points
+        self._cell_size = float(cell_size)
+        self._cells = {} # (cell_x, cell_y) => list of segment indexes (index of the segment end point)
+        for idx in range(1, len(points)):
+            for cell_key in self._bbox_cells(points[idx-1], points[idx]):
+                cell = self._cells.get(cell_key)
+                if cell is None:
+                    self._cells[cell_key] = [ idx ]
+                else:
+                    cell.append(idx)
+
+    def _bbox_cells(self, p1, p2):
+        cx1 = int(math.floor(min(p1.x, p2.x) / self._cell_size))
+        cx2 = int(math.floor(max(p1.x, p2.x) / self._cell_size))
+        cy1 = int(math.floor(min(p1.y, p2.y) / self._cell_size))
+        cy2 = int(math.floor(max(p1.y, p2.y) / self._cell_size))
+        return [ (cx, cy) for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1) ]
+
+    # first_intersection()
+    #
+    # Intersection point with the first (in way order) segment crossing p-prev, or None
+    #
+    def first_intersection(self, p, prev):
+        candidates = set()
+        for cell_key in self._bbox_cells(p, prev):
+            cell = self._cells.get(cell_key)
+            if cell is not None:
+                candidates.update(cell)
+        minx = min(p.x, prev.x)
+        maxx = max(p.x, prev.x)
+        miny = min(p.y, prev.y)
+        maxy = max(p.y, prev.y)
+        for idx in sorted(candidates):
+            p1 = self._points[idx]
+            prev1 = self._points[idx-1]
+            if max(p1.x, prev1.x) < minx or min(p1.x, prev1.x) > maxx or max(p1.y, prev1.y) < miny or min(p1.y, prev1.y) > maxy:
+                continue
+            cp = line_intersection(p1, prev1, p, prev)
+            if cp is not None:
+                return cp
+        return None
 
 def snap_to_closest_way(ways, point):
     if len(ways) == 0:
@@ -28,20 +171,34 @@ class GeometrySearch:
 
     def __init__(self, max_segment_length, use_dist=False, perform_self_testing=False):
         self._maxseglen = max_segment_length
-        self._fillpoints = TwoDimSearch()
-        self._realpoints = TwoDimSearch()
+        self._realpoints = new_two_dim_search(max_segment_length)
+        if get_search_backend() == "grid":
+            # segments are stored in grid cells so we don't need fill points
+            self._segments = SegmentGrid(max_segment_length)
+            self._fillpoints = None
+        else:
+            self._segments = None
+            self._fillpoints = new_two_dim_search(max_segment_length)
         self._self_cross_points = {}
         self._rlid2startdist = {}
         self._use_dist = use_dist
         self._perform_self_testing = perform_self_testing
-
-    def insert(self, way):
+        self._modified_rlids = set() # RLIDs of ways that got new points, see get_modified_rlids()
+
+    # insert()
+    #
+    # Insert a way. When using dist, dist is set on the points of the way, unless keep_dist is
+    # set which is used for re-inserting ways that already have dist set (like ways from
+    # another database).
+    #
+    def insert(self, way, keep_dist=False):
         it = iter(way.way)
         first = next(it)
         prev = first
         if self._use_dist:
             self_points = {prev}
-            prev.dist = self._rlid2startdist.get(way.rlid, 0)
+            if not keep_dist:
+                prev.dist = self._rlid2startdist.get(way.rlid, 0)
         self._realpoints.insert(prev, way)
         for p in it:
             self._realpoints.insert(p, way)
@@ -52,41 +209,75 @@ class GeometrySearch:
                         self._self_cross_points[p].add(way)
                     else:
                         self._self_cross_points[p] = {way}
-                if p.dist != -1:
-                    _log.error(f"{way.way}")
-                    _log.error(f"{way}")
-                    raise RuntimeError("Expected way to not have set dist on points")
                 self_points.add(p)
-                p.dist = prev.dist + dist2d(prev, p)
-            line_length = dist2d(prev, p)
-            if line_length >= self._maxseglen:
-                seg_count = math.ceil(line_length / self._maxseglen)
-                x_delta = (p.x - prev.x) / float(seg_count)
-                y_delta = (p.y - prev.y) / float(seg_count)
-                for i in range(1, seg_count):
-                    self._fillpoints.insert(Point(prev.x + i * x_delta, prev.y + i * y_delta), way)
+                if not keep_dist:
+                    if p.dist != -1:
+                        _log.error(f"{way.way}")
+                        _log.error(f"{way}")
+                        raise RuntimeError("Expected way to not have set dist on points")
+                    p.dist = prev.dist + dist2d(prev, p)
+            if self._segments is not None:
+                self._segments.insert(prev, p, way)
+            else:
+                line_length = dist2d(prev, p)
+                if line_length >= self._maxseglen:
+                    seg_count = math.ceil(line_length / self._maxseglen)
+                    x_delta = (p.x - prev.x) / float(seg_count)
+                    y_delta = (p.y - prev.y) / float(seg_count)
+                    for i in range(1, seg_count):
+                        self._fillpoints.insert(Point(prev.x + i * x_delta, prev.y + i * y_delta), way)
             prev = p
         #print(len(self._realpoints), len(self._fillpoints))
 
         # rlid2startdist makes sure that if we have multiple segments per RLID the dist doesn't overlap
         if self._use_dist:
-            self._rlid2startdist[way.rlid] = math.ceil(way.way[-1].dist) + 1
+            self._rlid2startdist[way.rlid] = max(self._rlid2startdist.get(way.rlid, 0), math.ceil(way.way[-1].dist) + 1)
+
+    # get_modified_rlids()
+    #
+    # Get RLIDs of ways that have got new points inserted or have been extended since the last
+    # call to clear_modified_rlids()
+    #
+    def get_modified_rlids(self):
+        return self._modified_rlids
+
+    def clear_modified_rlids(self):
+        self._modified_rlids = set()
+
+    # get_stats()
+    #
+    # Get sizes of the search data structures, for statistics
+    #
+    def get_stats(self):
+        stats = { "real_points": len(self._realpoints) }
+        if self._segments is not None:
+            stats["segment_cells"] = len(self._segments)
+        else:
+            stats["fill_points"] = len(self._fillpoints)
+        return stats
 
     def insert_waydb(self, way_db):
         for ways in way_db.values():
             for way in ways:
                 self.insert(way)
 
+    # ways with line segments passing close to the point, which may not be found by searching
+    # for real points only
+    def _find_ways_along_segments(self, point):
+        if self._segments is not None:
+            return self._segments.find_all_within(point, self._maxseglen)
+        return self._fillpoints.find_all_within(point, self._maxseglen)
+
     def _snap_point_to_line(self, point, rlid=None):
         ways = self._realpoints.find_all_within(point, self._maxseglen)
         if rlid is None:
-            ways.update(self._fillpoints.find_all_within(point, self._maxseglen))
+            ways.update(self._find_ways_along_segments(point))
             return snap_to_closest_way(ways, point)
 
         # Only snap to specified RLID
         ref_ways = self._filter_reference_way(ways, rlid, allow_multiple_copies=True)
         if len(ref_ways) == 0:
-            ways = self._fillpoints.find_all_within(point, self._maxseglen)
+            ways = self._find_ways_along_segments(point)
             ref_ways = self._filter_reference_way(ways, rlid, allow_multiple_copies=True)
         return snap_to_closest_way(ref_ways, point)
 
@@ -105,6 +296,7 @@ class GeometrySearch:
             if dist1 >= min_distance and dist2 >= min_distance:
                 point.dist = prev.dist + dist1
                 way.way.insert(idx, point)
+                self._modified_rlids.add(way.rlid)
                 if self._perform_self_testing:
                     self._test_way_dist(way)
                 self._realpoints.insert(point, way)
@@ -235,6 +427,7 @@ class GeometrySearch:
         else:
             _log.debug("Extension does not connect to reference")
             return False
+        self._modified_rlids.add(ref_way.rlid)
         _log.debug(f"ref_way after extension: {ref_way.way}")
 
         # Get all ways with the same RLID (sometimes more than one)
@@ -279,7 +472,10 @@ class GeometrySearch:
             else:
                 break
         for w in removed_ways:
-            self._fillpoints.remove_ref(w)
+            if self._segments is not None:
+                self._segments.remove_ref(w)
+            else:
+                self._fillpoints.remove_ref(w)
 
         # Get points that may need their dist value updated
         update_map = {}
@@ -374,7 +570,7 @@ class GeometrySearch:
         ways = set()
         for point in points:
             ways.update(self._realpoints.find_all_within(point, self._maxseglen))
-            ways.update(self._fillpoints.find_all_within(point, self._maxseglen))
+            ways.update(self._find_ways_along_segments(point))
         return ways
 
     @staticmethod
@@ -405,10 +601,14 @@ class GeometrySearch:
         return self._realpoints[point]
 
     def find_crossing_ways(self, way, abort_at_first=False):
-        ways = set()
-        for p in way.way:
-            ways.update(self._realpoints.find_all_within(p, self._maxseglen))
-            ways.update(self._fillpoints.find_all_within(p, self._maxseglen))
+        if self._segments is not None:
+            ways = self._segments.find_all_along_way(way.way)
+        else:
+            ways = set()
+            for p in way.way:
+                ways.update(self._realpoints.find_all_within(p, self._maxseglen))
+                ways.update(self._find_ways_along_segments(p))
+        way_index = WaySegmentIndex(way.way, self._maxseglen)
         crossing = []
         for w in ways:
             if w == way:
@@ -416,19 +616,12 @@ class GeometrySearch:
             it = iter(w.way)
             prev = next(it)
             for p in it:
-                it1 = iter(way.way)
-                prev1 = next(it1)
-                match = False
-                for p1 in it1:
-                    cp = line_intersection(p1, prev1, p, prev)
-                    if cp is not None:
-                        match = True
-                        crossing.append((w, cp))
-                        if abort_at_first:
-                            return crossing
-                        break
-                    prev1 = p1
-                if match:
+                # first crossing segment in 'way' for each segment in 'w', and only the first for 'w'
+                cp = way_index.first_intersection(p, prev)
+                if cp is not None:
+                    crossing.append((w, cp))
+                    if abort_at_first:
+                        return crossing
                     break
                 prev = p
         return crossing
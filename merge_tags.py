@@ -8,7 +8,8 @@ _log = logging.getLogger("tags")
 
 def merge_tags(seg, src, data_src_name):
     way = seg.way
-    dst = seg.tags
+    dst = seg.mutable_tags()
+    tag_src = seg.mutable_tag_src()
     src_date = src.get("FRAN_DATUM", 0)
     fixmes = []
     for k, v in src.items():
@@ -18,11 +19,11 @@ def merge_tags(seg, src, data_src_name):
         if not k in dst:
             # new value
             dst[k] = v
-            seg.tag_src[k] = (data_src_name, src_date)
+            tag_src[k] = (data_src_name, src_date)
             continue
 
-        if k not in seg.tag_src:
-            seg.tag_src[k] = ("", 18000101)
+        if k not in tag_src:
+            tag_src[k] = ("", 18000101)
 
         ov = dst[k]
         if isinstance(ov, list):
@@ -34,8 +35,8 @@ def merge_tags(seg, src, data_src_name):
             if match:
                 continue
         elif ov == v:
-            if seg.tag_src[k][1] < src_date:
-                seg.tag_src[k] = (data_src_name, src_date)
+            if tag_src[k][1] < src_date:
+                tag_src[k] = (data_src_name, src_date)
             continue
 
         if k == "fixme":
@@ -78,21 +79,21 @@ def merge_tags(seg, src, data_src_name):
             "NVDB-Vagnummer": "NVDB-Gatunamn" # often conflicting value for LANKROLL
         }
         if not resolved:
-            if prio_layers.get(data_src_name, None) == seg.tag_src[k][0]:
+            if prio_layers.get(data_src_name, None) == tag_src[k][0]:
                 dst[k] = v
-                seg.tag_src[k] = (data_src_name, src_date)
+                tag_src[k] = (data_src_name, src_date)
                 resolved = True
                 solution = "prioritized layer"
-            elif prio_layers.get(seg.tag_src[k][0], None) == data_src_name:
+            elif prio_layers.get(tag_src[k][0], None) == data_src_name:
                 resolved = True
                 solution = "prioritized layer"
 
         # resolve by date, if possible
         if not resolved:
-            if seg.tag_src[k][1] != src_date:
-                if seg.tag_src[k][1] < src_date:
+            if tag_src[k][1] != src_date:
+                if tag_src[k][1] < src_date:
                     dst[k] = v
-                    seg.tag_src[k] = (data_src_name, src_date)
+                    tag_src[k] = (data_src_name, src_date)
                 solution = "date"
                 resolved = True
 
@@ -179,8 +180,8 @@ def merge_tags(seg, src, data_src_name):
         if fixme or solution not in ("list", "prioritized layer"):
             _log.warning(f"Conflicting value for key '{k}' ('{v}' and '{ov}', RLID {seg.rlid}). {res_str}")
 
-        if dst[k] == v and seg.tag_src[k][1] < src_date:
-            seg.tag_src[k] = (data_src_name, src_date)
+        if dst[k] == v and tag_src[k][1] < src_date:
+            tag_src[k] = (data_src_name, src_date)
 
     for v in fixmes:
         append_fixme_value(dst, v)
@@ -199,6 +200,7 @@ def append_tag_value(tags, k, v):
     current = tags[k]
     if isinstance(current, list):
         if not v in current:
-            current.append(v)
+            # new list rather than append, lists may be shared with other tags
+            tags[k] = current + [ v ]
     elif current != v:
         tags[k] = [ current, v ]
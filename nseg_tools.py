@@ -38,9 +38,9 @@ def reverse_way(way, directional_nodes):
         if p in directional_nodes:
             node = directional_nodes[p]
             if node.tags["direction"] == "backward":
-                node.tags["direction"] = "forward"
+                node.mutable_tags()["direction"] = "forward"
             elif node.tags["direction"] == "forward":
-                node.tags["direction"] = "backward"
+                node.mutable_tags()["direction"] = "backward"
 
     new_tags = {}
     for k, v in way.tags.items():
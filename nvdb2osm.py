@@ -1,38 +1,116 @@
 #!/usr/bin/env python3
 
 import argparse
-import hashlib
+import copy
 import logging
 import pathlib
 import zipfile
 import glob
+import math
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 import geopandas
+import pyogrio
 from sortedcontainers import SortedDict
 
 from process_and_resolve import *
-from tag_translations import TAG_TRANSLATIONS, process_tag_translations, preprocess_tags
-from nvdb_segment import NvdbSegment, NVDB_GEOMETRY_TAGS
-from shapely_utils import shapely_linestring_to_way
-from waydb import WayDatabase, print_progress
+from tag_translations import TAG_TRANSLATIONS, preprocess_tag_columns, process_tag_translations_columnar
+from nvdb_segment import NvdbSegment, NVDB_GEOMETRY_TAGS, pack_segments, unpack_segments
+from shapely_utils import shapely_linestring_to_way, shapely_geometries_to_ways
+from waydb import WayDatabase, SELF_TEST_MODES, print_progress
 from osmxml import waydb2osmxml, write_osmxml
 from nvdb_ti import time_interval_strings
 from splitosm import splitosm, read_geojson_with_polygons
+from nvdb_cache import file_md5, get_layer_cache_key, load_cached_layer, store_cached_layer, save_checkpoint, load_checkpoint
+from twodimsearch import SEARCH_BACKENDS, set_search_backend, get_search_backend
+from pipeline_stats import enable_stats, stats_enabled, stage, add_stage_counts, write_stats_report
 
 _log = logging.getLogger("nvdb2osm")
 
-# read_geometry_from_file()
+# Pipeline stages after which a checkpoint is saved (with --checkpoint_dir)
+CHECKPOINT_STAGES = [ "line_layers", "point_layers" ]
+
+# Reference geometry layer, which all other layers are merged into
+MASTER_GEOMETRY_NAME = "NVDB-Reflinjetillkomst"
+
+# Note the order how the layers are merged is in part important, see comments
+# So be careful if you re-order
+LINE_LAYER_NAMES = [
+    # We always do FunkVagklass and GCM_vagtyp/CykelVgsKat first, as experience tells us
+    # that if there is a problem with the reference geometry these layers will trigger it.
+    "NVDB-FunkVagklass", # all streets/roads
+    "NVDB-GCM_vagtyp",   # all footways/cycleways
+    "NVDB-CykelVgsKat",  # most often redundant, otherwise complements GCM_vagtyp
+
+    "AGGREGAT-Vagslag",
+    "AGGREGAT-KommunLanReg",
+
+    # just alphabetical order
+    "NVDB-Antal_korfalt2",
+    "NVDB-Barighet",
+    "NVDB-BegrAxelBoggiTryck",
+    "NVDB-BegrBruttovikt",
+    "NVDB-BegrFordBredd",
+    "NVDB-BegrFordLangd",
+    "NVDB-Bro_och_tunnel",
+    "NVDB-Cirkulationsplats",
+    "NVDB-Farjeled",
+    "NVDB-ForbjudenFardriktning",
+    "NVDB-Forbud_omkorn",
+    "NVDB-ForbudTrafik",
+    "NVDB-Gagata",
+    "NVDB-Gangfartsomrade",
+    "NVDB-Gatunamn",
+    #"NVDB-Gatutyp", replaced with AGGREGAT-Vagslag
+    "NVDB-GCM_belyst",
+    "NVDB-GCM_separation",
+    "NVDB-Hastighetsgrans",
+    "NVDB-Huvudled",
+    "NVDB-InskrTranspFarligtGods",
+    "NVDB-Kollektivkorfalt",
+    # "NVDB-Miljozon", experimental tags, excluding them for now
+    "NVDB-Motortrafikled",
+    "NVDB-Motorvag",
+    "NVDB-Ovrigt_vagnamn",
+    "NVDB-RekomVagFarligtGods",
+    "NVDB-Slitlager",
+    "NVDB-Tillganglighet",
+    "NVDB-Vagbredd",
+    "NVDB-Vagnummer",
+    "EVB-Driftbidrag_statligt",
+    "VIS-Funktionellt_priovagnat",
+    #"VIS-Omkorningsforbud", replaced by NVDB-Forbud_omkorn
+    "VIS-Slitlager"
+]
+
+POINT_LAYER_NAMES = [
+    "NVDB-Farthinder",
+    "NVDB-GCM_passage",
+    "NVDB-Hojdhinder45dm",
+    "NVDB-Korsning",
+    "NVDB-Stopplikt",
+    "NVDB-Vaghinder",
+    "NVDB-Vajningsplikt",
+    "VIS-Jarnvagskorsning",
+    "VIS-P_ficka",
+    "VIS-Rastplats",
+    "AGGREGAT-Plankorsning_vag_jarnvag"
+]
+
+# find_geometry_file()
 #
+# Find the file for a named layer in a directory or zip file. Returns the file name to
+# give to geopandas and the list of files on disk the layer is read from, or None if there
+# is no such layer.
 #
-def read_geometry_from_file(directory_or_zip, name):
-    gdf_filename = None
+def find_geometry_file(directory_or_zip, name):
     if zipfile.is_zipfile(directory_or_zip):
         zf = zipfile.ZipFile(directory_or_zip)
         files = [fn for fn in zf.namelist() if fn.endswith(name + ".shp") or fn.endswith(name + ".gpkg")]
         if len(files) > 0:
             filename = files[0]
-            gdf_filename = "zip://" + str(directory_or_zip) + "!" + filename
+            return "zip://" + str(directory_or_zip) + "!" + filename, [ str(directory_or_zip) ]
     else:
         if not os.path.isdir(directory_or_zip):
             _log.error(f"'{directory_or_zip}' is neither a directory or a zip file.")
@@ -44,80 +122,93 @@ def read_geometry_from_file(directory_or_zip, name):
             files = glob.glob(pattern)
         if len(files) > 0:
             filename = files[0]
-            gdf_filename = files[0]
+            # shapefiles come with sidecar files (.dbf etc) with the same base name
+            return filename, sorted(glob.glob(glob.escape(os.path.splitext(filename)[0]) + ".*"))
+    return None, None
 
+# read_geometry_from_file()
+#
+# Read a layer to a GeoDataFrame. If a bounding box (minx, miny, maxx, maxy) is given only
+# features intersecting it are read, filtered by GDAL (using the spatial index if the file
+# has one) so the rest of the file is never parsed.
+#
+def read_geometry_from_file(directory_or_zip, name, bbox=None):
+    gdf_filename, _ = find_geometry_file(directory_or_zip, name)
     if gdf_filename is None:
         _log.info(f"No file name *{name}.gpkg (or .shp) in {directory_or_zip}")
         return None
 
-    _log.info(f"Reading file {gdf_filename}")
-    gdf = geopandas.read_file(gdf_filename)
+    if bbox is None:
+        _log.info(f"Reading file {gdf_filename}")
+        gdf = geopandas.read_file(gdf_filename)
+    else:
+        _log.info(f"Reading file {gdf_filename} within bounding box {bbox}")
+        gdf = geopandas.read_file(gdf_filename, bbox=tuple(bbox))
     _log.info(f"done ({len(gdf)} segments)")
     return gdf
 
+# read_layer_bounds()
+#
+# Get bounding box of a layer from the file metadata, without reading the features.
+# Returns None if not available.
+#
+def read_layer_bounds(directory_or_zip, name):
+    gdf_filename, _ = find_geometry_file(directory_or_zip, name)
+    if gdf_filename is None:
+        return None
+    info = pyogrio.read_info(gdf_filename)
+    bounds = info.get("total_bounds", None)
+    if bounds is None:
+        return None
+    return list(bounds)
+
 # read_nvdb_geometry()
 #
 # Read a NVDB geometry file and apply tag translations.
 #
-def read_nvdb_geometry(directory_or_zip, name, tag_translations, nvdb_total_bounds):
-    gdf = read_geometry_from_file(directory_or_zip, name)
+def read_nvdb_geometry(directory_or_zip, name, tag_translations, nvdb_total_bounds, bbox=None):
+    gdf = read_geometry_from_file(directory_or_zip, name, bbox)
     if gdf is None:
         return []
     _log.info(f"Parsing {len(gdf)} segments...")
 
     # update global bounding box
-    bounds = gdf.total_bounds
-    if bounds[0] < nvdb_total_bounds[0]:
-        nvdb_total_bounds[0] = bounds[0]
-    if bounds[1] < nvdb_total_bounds[1]:
-        nvdb_total_bounds[1] = bounds[1]
-    if bounds[2] > nvdb_total_bounds[2]:
-        nvdb_total_bounds[2] = bounds[2]
-    if bounds[3] > nvdb_total_bounds[3]:
-        nvdb_total_bounds[3] = bounds[3]
+    merge_bounds(nvdb_total_bounds, gdf.total_bounds.tolist())
 
-    ways = []
-    all_tags = set()
-    skip_count = 0
-    last_print = 0
-    for index, row in gdf.iterrows():
-        if len(gdf) > 50:
-            last_print = print_progress(last_print, index, len(gdf), progress_text=f"Parsing {len(gdf)} segments")
-        way = row.to_dict()
-
-        preprocess_tags(way)
-
-        way.pop("TILL_DATUM", None)
-        restore_set = {}
-        for k in NVDB_GEOMETRY_TAGS:
-            if k in way:
-                restore_set[k] = way[k]
-                del way[k]
-        geometry = way["geometry"]
-        del way["geometry"]
-
-        if geometry is None:
-            _log.info(f"Skipping segment without geometry RLID {way['RLID']}")
-            skip_count += 1
-            continue
-
-        for k in way.keys():
-            if k not in all_tags:
-                all_tags.add(k)
+    # tags are preprocessed and translated column by column, much faster than row by row
+    columns = preprocess_tag_columns(gdf.drop(columns=gdf.geometry.name))
+    columns.pop("TILL_DATUM", None)
+    indexes = gdf.index.tolist()
 
-        process_tag_translations(way, tag_translations)
-
-        if geometry.geom_type == "Point":
-            points = Point(geometry.x, geometry.y)
-        else:
-            points = shapely_linestring_to_way(geometry)
-            if len(points) == 1:
-                _log.info(f"Skipping geometry (reduced) to one point {way}")
+    skip_count = 0
+    geometries = shapely_geometries_to_ways(gdf.geometry.values)
+    has_geometry = [ g is not None for g in geometries ]
+    if not all(has_geometry):
+        # after preprocessing, so RLID is found under its new name also for new format layers
+        for rlid, g in zip(columns["RLID"], geometries):
+            if g is None:
+                _log.info(f"Skipping segment without geometry RLID {rlid}")
                 skip_count += 1
-                continue
+        geometries = [ g for g in geometries if g is not None ]
+        indexes = [ index for index, keep in zip(indexes, has_geometry) if keep ]
+        columns = { k: [ v for v, keep in zip(values, has_geometry) if keep ] for k, values in columns.items() }
+
+    restore_columns = {}
+    for k in NVDB_GEOMETRY_TAGS:
+        if k in columns:
+            restore_columns[k] = columns.pop(k)
+    all_tags = set(columns.keys())
+    rows = process_tag_translations_columnar(columns, len(geometries), tag_translations)
 
+    ways = []
+    for idx, (way, points, index) in enumerate(zip(rows, geometries, indexes)):
+        if not isinstance(points, Point) and len(points) == 1:
+            _log.info(f"Skipping geometry (reduced) to one point {way}")
+            skip_count += 1
+            continue
         way["geometry"] = points
-        way.update(restore_set)
+        for k, values in restore_columns.items():
+            way[k] = values[idx]
         nvdbseg = NvdbSegment(way)
         nvdbseg.way_id = index
         ways.append(nvdbseg)
@@ -131,37 +222,169 @@ def read_nvdb_geometry(directory_or_zip, name, tag_translations, nvdb_total_boun
         _log.debug(f"  '{k}'")
     return ways
 
-# log_version()
+# read_nvdb_geometry_cached()
 #
-# Log a unique hash for the code used
+# Same as read_nvdb_geometry(), but if a cache directory is given parsed layers are stored
+# there and reused as long as the input file, bounding box and code are unchanged.
 #
-def log_version():
+def read_nvdb_geometry_cached(directory_or_zip, name, nvdb_total_bounds, cache_dir, bbox=None):
+    if cache_dir is None:
+        return read_nvdb_geometry(directory_or_zip, name, TAG_TRANSLATIONS[name], nvdb_total_bounds, bbox)
+    _, source_files = find_geometry_file(directory_or_zip, name)
+    if source_files is None:
+        return read_nvdb_geometry(directory_or_zip, name, TAG_TRANSLATIONS[name], nvdb_total_bounds, bbox)
 
-    def md5(fname):
-        hash_md5 = hashlib.md5()
-        with open(fname, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+    key = get_layer_cache_key(source_files, name, get_code_checksums(), bbox)
+    data = load_cached_layer(cache_dir, key)
+    if data is not None:
+        packed, bounds, ti_strings = data
+        merge_bounds(nvdb_total_bounds, bounds)
+        time_interval_strings.update(ti_strings)
+        return unpack_segments(packed)
+
+    bounds = [10000000, 10000000, 0, 0]
+    old_ti_strings = set(time_interval_strings)
+    ways = read_nvdb_geometry(directory_or_zip, name, TAG_TRANSLATIONS[name], bounds, bbox)
+    store_cached_layer(cache_dir, key, (pack_segments(ways), bounds, time_interval_strings - old_ti_strings))
+    merge_bounds(nvdb_total_bounds, bounds)
+    return ways
 
+# merge_bounds()
+#
+# Extend bounding box 'bounds' (minx, miny, maxx, maxy) to cover 'other_bounds'
+#
+def merge_bounds(bounds, other_bounds):
+    for i in (0, 1):
+        if other_bounds[i] < bounds[i]:
+            bounds[i] = other_bounds[i]
+    for i in (2, 3):
+        if other_bounds[i] > bounds[i]:
+            bounds[i] = other_bounds[i]
+
+# read_and_prepare_layer()
+#
+# Read a NVDB layer, translate tags and remove duplicates. This is independent of the way
+# database so it can run in a worker process, see LayerReader. If a bounding box is given
+# only features intersecting it are read. If a raw dump filename is given the layer is
+# written there as read, before duplicates are removed.
+#
+def read_and_prepare_layer(directory_or_zip, name, cache_dir=None, bbox=None, raw_dump_filename=None):
+    bounds = [10000000, 10000000, 0, 0]
+    old_ti_strings = set(time_interval_strings)
+    ways = read_nvdb_geometry_cached(directory_or_zip, name, bounds, cache_dir, bbox)
+    if raw_dump_filename is not None:
+        write_osmxml(ways, [], raw_dump_filename)
+    ways = find_overlapping_and_remove_duplicates(name, ways)
+    return ways, bounds, time_interval_strings - old_ti_strings
+
+def _prepare_layer_in_worker(directory_or_zip, name, cache_dir, bbox, raw_dump_filename):
+    ways, bounds, ti_strings = read_and_prepare_layer(directory_or_zip, name, cache_dir, bbox, raw_dump_filename)
+    return pack_segments(ways), bounds, ti_strings
+
+def _init_worker(loglevel, search_backend):
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=loglevel)
+    set_search_backend(search_backend)
+
+# LayerReader
+#
+# Provides read and preprocessed layers in a fixed order. With more than one job the upcoming
+# layers are read in worker processes while the main process merges the current one.
+# 'raw_dumps' maps layer names to filenames the layers are dumped to before preprocessing.
+#
+class LayerReader:
+
+    def __init__(self, directory_or_zip, names, nvdb_total_bounds, jobs=1, cache_dir=None, bbox=None, raw_dumps=None):
+        self._directory_or_zip = directory_or_zip
+        self._cache_dir = cache_dir
+        self._bbox = bbox
+        self._raw_dumps = {} if raw_dumps is None else raw_dumps
+        self._names = list(names)
+        self._next_idx = 0
+        self._nvdb_total_bounds = nvdb_total_bounds
+        self._jobs = jobs
+        self._pool = None
+        self._pending = {}
+        if jobs > 1:
+            self._pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                             initargs=(logging.getLogger().getEffectiveLevel(), get_search_backend()))
+            self._prefetch()
+
+    def _prefetch(self):
+        # keep a window of layers in flight, one more than the number of workers so that
+        # there is always a layer ready when the main process asks for the next one
+        window = self._names[self._next_idx:self._next_idx + self._jobs + 1]
+        for name in window:
+            if name not in self._pending:
+                self._pending[name] = self._pool.submit(_prepare_layer_in_worker, self._directory_or_zip, name, self._cache_dir, self._bbox, self._raw_dumps.get(name))
+
+    # get()
+    #
+    # Get the next layer, which must be given name (layers must be read in the order given
+    # to the constructor).
+    #
+    def get(self, name):
+        if self._next_idx >= len(self._names) or self._names[self._next_idx] != name:
+            raise RuntimeError(f"Layer {name} read out of order")
+        self._next_idx += 1
+        if self._pool is None:
+            ways, bounds, ti_strings = read_and_prepare_layer(self._directory_or_zip, name, self._cache_dir, self._bbox, self._raw_dumps.get(name))
+        else:
+            packed, bounds, ti_strings = self._pending.pop(name).result()
+            self._prefetch()
+            ways = unpack_segments(packed)
+
+        merge_bounds(self._nvdb_total_bounds, bounds)
+        time_interval_strings.update(ti_strings)
+        return ways
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+# get_code_checksums()
+#
+# Get MD5 checksum for each script file
+#
+def get_code_checksums():
     files = [ "geometry_basics.py", "merge_tags.py", "nvdb2osm.py", "nvdb_ti.py", "process_and_resolve.py", "shapely_utils.py", "twodimsearch.py",
-              "geometry_search.py", "nseg_tools.py", "nvdb_segment.py", "osmxml.py", "proj_xy.py", "tag_translations.py", "waydb.py"
+              "geometry_search.py", "nseg_tools.py", "nvdb_segment.py", "osmxml.py", "proj_xy.py", "tag_translations.py", "waydb.py",
+              "nvdb_cache.py", "pipeline_stats.py", "topology.py", "osmoutput.py", "osmpbf.py"
              ]
-    _log.info("Checksum for each script file (to be replaced with single version number when script is stable):")
+    checksums = {}
     for fname in files:
         path = os.path.join(os.path.dirname(__file__), fname)
-        _log.info(f"  {fname:22} MD5: {md5(path)}")
+        checksums[fname] = file_md5(path)
+    return checksums
+
+# log_version()
+#
+# Log a unique hash for the code used
+#
+def log_version():
+    _log.info("Checksum for each script file (to be replaced with single version number when script is stable):")
+    for fname, md5 in get_code_checksums().items():
+        _log.info(f"  {fname:22} MD5: {md5}")
+
+# read_municipality_borders()
+#
+# Read the municipality borders, optionally only those intersecting a bounding box
+#
+def read_municipality_borders(bbox=None):
+    return read_geometry_from_file("data/ak_riks.zip", "ak_riks", bbox)
 
 # get_municipality()
 #
-# Get the borders for the given municipality
+# Get the borders for the given municipality, from already read borders if given
 #
-def get_municipality(municipality_code_or_name):
-    gdf = read_geometry_from_file("data/ak_riks.zip", "ak_riks")
+def get_municipality(municipality_code_or_name, bbox=None, borders=None):
+    gdf = borders
+    if gdf is None:
+        gdf = read_municipality_borders(bbox)
     geo = []
-    for _, row in gdf.iterrows():
-        if str(row.KOM_KOD) == municipality_code_or_name or row.KOMMUNNAMN == municipality_code_or_name:
-            geo.append(row.geometry)
+    for kom_kod, kommunnamn, geometry in zip(gdf["KOM_KOD"].tolist(), gdf["KOMMUNNAMN"].tolist(), gdf.geometry.values):
+        if str(kom_kod) == municipality_code_or_name or kommunnamn == municipality_code_or_name:
+            geo.append(geometry)
     if len(geo) == 0:
         return None
     return geo
@@ -181,77 +404,524 @@ def insert_rlid_elements(way_db, ways, data_src_name, debug_ways=None, do_snap=T
         else:
             did_snap = way_db.insert_rlid_node(way, data_src_name, do_snap)
             if not did_snap and do_snap:
-                append_fixme_value(way.tags, "no nearby reference geometry to snap to")
+                append_fixme_value(way.mutable_tags(), "no nearby reference geometry to snap to")
     _log.info("done merging")
 
 
+# merge_line_layers()
+#
+# Setup the reference geometry and merge all line layers into it. Returns the way database
+# with geometry search setup, ready for merging point layers.
+#
+def merge_line_layers(layer_reader, master_geometry_name, line_names, municipality, self_test_mode, self_test_sample_fraction, debug_dump_layers):
+
+    # First setup a complete master geometry and refine it so we have a good geometry to merge the rest of the data with
+    with stage("reference_geometry"):
+        name = master_geometry_name
+        ref_ways = layer_reader.get(name)
+        perform_self_testing = self_test_mode != "off"
+        way_db = WayDatabase(ref_ways, perform_self_testing, self_test_mode, self_test_sample_fraction)
+        add_stage_counts({ "layer_segments": len(ref_ways) })
+        if stats_enabled():
+            add_stage_counts(way_db.get_stats())
+
+    if debug_dump_layers:
+        write_osmxml(way_db.get_reference_geometry(), [], "reference_geometry.osm")
+
+    all_line_names = line_names
+    layer_count = len(all_line_names)
+    layer_idx = 0
+    for name in all_line_names:
+        if name is None:
+            break
+        with stage(f"layer {name}", way_db):
+            ways = layer_reader.get(name)
+            add_stage_counts({ "layer_segments": len(ways) })
+            did_insert_new_ref_geometry = way_db.insert_missing_reference_geometry_if_any(ways)
+
+            if debug_dump_layers:
+                if did_insert_new_ref_geometry:
+                    write_osmxml(way_db.get_reference_geometry(), [], "reference_geometry.osm")
+                write_osmxml(ways, [], name + ".osm")
+
+            debug_ways = None
+            if name == "NVDB-Bro_och_tunnel":
+                ways = preprocess_bridges_and_tunnels(ways, way_db)
+                if debug_dump_layers:
+                    write_osmxml(ways, [], name + "-preproc.osm")
+                    debug_ways = []
+
+            insert_rlid_elements(way_db, ways, name, debug_ways=debug_ways)
+            if perform_self_testing:
+                way_db.test_segments()
+            if debug_ways is not None:
+                write_osmxml(debug_ways, [], name + "-adapted.osm")
+        layer_idx += 1
+        _log.info(f"Merged {layer_idx} of {layer_count} line geometry layers")
+
+    with stage("line_layers_cleanup", way_db):
+        way_db.join_segments_with_same_tags()
+        way_db.remove_short_sub_segments()
+        if municipality is not None:
+            way_db.remove_segments_outside_area(municipality)
+
+        way_db.setup_geometry_search()
+    return way_db
+
+# read_railway_network()
+#
+# Read the national railway network, only the part within the given bounding box
+#
+def read_railway_network(railway_filename, bounds):
+    gdf = None
+    for rw_name in ["Järnvägsnät_grundegenskaper2_0_GeoPackage", "Järnvägsnät_med_grundegenskaper2_0", "Järnvägsnät_med_grundegenskaper"]:
+        gdf = read_geometry_from_file(railway_filename, rw_name, bbox=bounds)
+        if gdf is not None:
+            break
+    if gdf is None:
+        raise RuntimeError("Railway geometry missing")
+    return gdf
+
+# read_railways()
+#
+# Read railway segments within the given bounding box from the national railway network,
+# or from an already read (larger) part of it if given
+#
+def read_railways(railway_filename, bounds, railway_network=None):
+    gdf = railway_network
+    if gdf is None:
+        gdf = read_railway_network(railway_filename, bounds)
+    _log.info(f"Filtering out railway segments for bounding box {bounds}...")
+    railways = []
+    for index, geometry in zip(gdf.index.tolist(), gdf.geometry.values):
+        if bounds_intersect(geometry.bounds, bounds):
+            seg = NvdbSegment({ "geometry": shapely_linestring_to_way(geometry),
+                                "RLID": f"RW-{index}"
+                               })
+            railways.append(seg)
+    _log.info(f"Done ({len(railways)} of {len(gdf)} segments kept)")
+    return railways
+
+# merge_point_layers()
+#
+# Merge all point layers into the way database
+#
+def merge_point_layers(layer_reader, point_names, way_db, nvdb_total_bounds, railway_filename, railway_network, skip_railway, debug_dump_layers):
+    layer_count = len(point_names)
+    layer_idx = 0
+    for name in point_names:
+        if name is None:
+            break
+        with stage(f"layer {name}", way_db):
+            points = layer_reader.get(name)
+            add_stage_counts({ "layer_segments": len(points) })
+
+            do_snap = True
+            if name == "NVDB-GCM_passage":
+                points = preprocess_footcycleway_crossings(points, way_db)
+            elif name == "NVDB-Korsning":
+                points = process_street_crossings(points, way_db, name)
+            elif name in ("VIS-Jarnvagskorsning", "AGGREGAT-Plankorsning_vag_jarnvag"):
+                if len(points) > 0:
+                    railways = []
+                    if not skip_railway:
+                        _log.info(f"There are {len(points)} railway crossings, reading railway geometry to have something to snap them to")
+                        railways = read_railways(railway_filename, nvdb_total_bounds, railway_network)
+                        if debug_dump_layers:
+                            write_osmxml(railways, [], "local-railway.osm")
+                    points = preprocess_railway_crossings(points, way_db, railways)
+            elif name == "VIS-P_ficka":
+                points = preprocess_laybys(points, way_db)
+                do_snap = False
+
+            insert_rlid_elements(way_db, points, name, do_snap=do_snap)
+        layer_idx += 1
+        _log.debug(f"Merged {layer_idx} of {layer_count} point layers")
+
+# save_pipeline_checkpoint()
+#
+# Save way database and global state needed to resume conversion after the given stage
+#
+def save_pipeline_checkpoint(checkpoint_dir, stage_name, way_db, nvdb_total_bounds):
+    state = {
+        "way_db": way_db,
+        "nvdb_total_bounds": list(nvdb_total_bounds),
+        "time_interval_strings": set(time_interval_strings),
+        "code_checksums": get_code_checksums()
+    }
+    save_checkpoint(checkpoint_dir, stage_name, state)
+
+# load_pipeline_checkpoint()
+#
+# Load way database saved by save_pipeline_checkpoint() and restore global state
+#
+def load_pipeline_checkpoint(checkpoint_dir, stage_name, nvdb_total_bounds):
+    state = load_checkpoint(checkpoint_dir, stage_name)
+    if state["code_checksums"] != get_code_checksums():
+        _log.warning(f"Code has changed since checkpoint '{stage_name}' was saved")
+    nvdb_total_bounds[:] = state["nvdb_total_bounds"]
+    time_interval_strings.update(state["time_interval_strings"])
+    return state["way_db"]
+
+# parse_self_test_mode()
+#
+# Parse --self_test parameter value, returns mode and sample fraction
+#
+def parse_self_test_mode(value):
+    mode, _, fraction = value.partition(":")
+    if mode not in SELF_TEST_MODES or (fraction != "" and mode != "sampled"):
+        _log.error(f"self_test parameter must be one of {SELF_TEST_MODES}")
+        sys.exit(1)
+    if mode != "sampled":
+        return mode, 1.0
+    try:
+        fraction = float(fraction) if fraction != "" else 0.1
+    except ValueError:
+        fraction = -1
+    if not 0 < fraction <= 1:
+        _log.error("self_test sample fraction must be larger than 0 and at most 1, like sampled:0.05")
+        sys.exit(1)
+    return mode, fraction
+
+
+# merge_layers()
+#
+# Merge all layers into a way database, saving and resuming from checkpoints if requested
+#
+def merge_layers(options, directory_or_zip, nvdb_total_bounds, municipality, bbox, railway_network):
+    debug_dump_layers = options.dump_layers
+    checkpoint_dir = options.checkpoint_dir
+    resume_from = options.resume_from
+    layer_names = []
+    if resume_from is None:
+        layer_names += [ MASTER_GEOMETRY_NAME ] + LINE_LAYER_NAMES
+    if resume_from in (None, "line_layers"):
+        layer_names += POINT_LAYER_NAMES
+    raw_dumps = None
+    if debug_dump_layers:
+        # the raw reference geometry is dumped as read, before duplicates are removed
+        raw_dumps = { MASTER_GEOMETRY_NAME: "raw_reference_geometry.osm" }
+    layer_reader = LayerReader(directory_or_zip, layer_names, nvdb_total_bounds, options.jobs, options.cache_dir, bbox, raw_dumps)
+
+    if resume_from is None:
+        way_db = merge_line_layers(layer_reader, MASTER_GEOMETRY_NAME, LINE_LAYER_NAMES, municipality,
+                                   options.self_test_mode, options.self_test_sample_fraction, debug_dump_layers)
+        if checkpoint_dir is not None:
+            save_pipeline_checkpoint(checkpoint_dir, "line_layers", way_db, nvdb_total_bounds)
+    elif resume_from == "line_layers":
+        way_db = load_pipeline_checkpoint(checkpoint_dir, resume_from, nvdb_total_bounds)
+
+    if resume_from != "point_layers":
+        merge_point_layers(layer_reader, POINT_LAYER_NAMES, way_db, nvdb_total_bounds, options.railway_file, railway_network,
+                           options.skip_railway, debug_dump_layers)
+        if checkpoint_dir is not None:
+            save_pipeline_checkpoint(checkpoint_dir, "point_layers", way_db, nvdb_total_bounds)
+    else:
+        way_db = load_pipeline_checkpoint(checkpoint_dir, resume_from, nvdb_total_bounds)
+    layer_reader.close()
+    return way_db
+
+# convert()
+#
+# Convert NVDB data to an OSM file. Options are the checked command line arguments, see
+# main(). The municipality borders, the bounding box to read within and the railway network
+# are given by the caller in batch mode.
+#
+def convert(options, directory_or_zip, output_filename, municipality=None, basename=None, bbox=None, railway_network=None):
+    write_rlid = options.rlid
+    debug_dump_layers = options.dump_layers
+    small_road_resolve_algorithm = options.small_road_resolve
+
+    _log.debug("Starting!")
+    nvdb_total_bounds = [10000000, 10000000, 0, 0] # init to outside max range of SWEREF99
+    with stage("merge_layers"):
+        if options.tile_size is not None:
+            way_db = merge_layers_tiled(options, directory_or_zip, nvdb_total_bounds, municipality)
+        else:
+            way_db = merge_layers(options, directory_or_zip, nvdb_total_bounds, municipality, bbox, railway_network)
+        way_db.intern_tags()
+        if stats_enabled():
+            add_stage_counts(way_db.get_stats())
+
+    if debug_dump_layers:
+        waydb2osmxml(way_db, "pre-resolve.osm")
+
+    with stage("resolve_highways", way_db):
+        sort_multiple_road_names(way_db)
+        resolve_highways(way_db, small_road_resolve_algorithm)
+    if small_road_resolve_algorithm not in ['prefer_service_static', 'prefer_track_static']:
+        with stage("upgrade_unclassified_stumps_connected_to_residential"):
+            upgrade_unclassified_stumps_connected_to_residential(way_db)
+        with stage("guess_upgrade_tracks"):
+            guess_upgrade_tracks(way_db)
+
+    with stage("simplify_and_cleanup_tags", way_db):
+        # converts cycleway way crossings to node crossing, which is optional, both ways to map are correct
+        simplify_cycleway_crossings(way_db)
+
+        bridge_footway_and_cycleway_separations(way_db)
+        simplify_speed_limits(way_db)
+        remove_redundant_speed_limits(way_db)
+        cleanup_highway_widths(way_db)
+        round_highway_widths(way_db)
+        remove_redundant_cycleway_names(way_db)
+        merge_nearby_same_nodes(way_db, way_db.point_db)
+
+        # Note: simplify_oneway() may reverse some ways, causing functions depending on that ways
+        # with the same RLID is oriented in the same direction to not work
+        simplify_oneway(way_db, way_db.point_db)
+
+        resolve_lanes(way_db)
+        final_pass_postprocess_miscellaneous_tags(way_db)
+
+        used_keys = SortedDict()
+        cleanup_used_nvdb_tags(way_db.way_db, used_keys)
+        cleanup_used_nvdb_tags(way_db.point_db, used_keys)
+
+    log_used_and_leftover_keys(used_keys)
+    _log.info("Time intervals used:")
+    for str1 in time_interval_strings:
+        _log.info(f"  '{str1}'")
+
+    if debug_dump_layers:
+        waydb2osmxml(way_db, "pre-join.osm")
+
+    with stage("join_segments_with_same_tags", way_db):
+        way_db.join_segments_with_same_tags(join_rlid=True)
+
+    if debug_dump_layers:
+        waydb2osmxml(way_db, "pre-treelike.osm")
+
+    with stage("make_way_directions_tree_like"):
+        way_db.make_way_directions_tree_like()
+
+    if debug_dump_layers:
+        waydb2osmxml(way_db, "pre-simplify.osm")
+
+    with stage("simplify_geometry", way_db):
+        way_db.simplify_geometry()
+    _log.info(f"Writing output to {output_filename}")
+    with stage("write_output"):
+        waydb2osmxml(way_db, output_filename, boundary_polygons=municipality, write_rlid=write_rlid)
+    _log.info("done writing output")
+
+    if options.split_area_polygons is not None:
+        if basename is None:
+            basename = "mapdata"
+        split_dir = options.split_dir
+        if split_dir is None:
+            split_dir = "."
+        file_extension = "pbf" if str(output_filename).endswith(".pbf") else "osm"
+        with stage("split_output"):
+            splitosm(way_db, municipality, options.split_area_polygons, split_dir, basename, write_rlid=write_rlid,
+                     file_extension=file_extension, jobs=options.jobs)
+
+# State shared by all tasks in a batch or tile worker process, set up once by the initializer
+_shared_worker_state = {}
+
+def _init_shared_worker(loglevel, search_backend, options, railway_network, municipality=None):
+    _init_worker(loglevel, search_backend)
+    _shared_worker_state["options"] = options
+    _shared_worker_state["railway_network"] = railway_network
+    _shared_worker_state["municipality"] = municipality
+
+def _convert_in_batch_worker(directory_or_zip, output_filename, municipality, basename, bbox):
+    # time intervals are only logged, but should not pile up between municipalities
+    time_interval_strings.clear()
+    convert(_shared_worker_state["options"], directory_or_zip, output_filename, municipality, basename, bbox,
+            _shared_worker_state["railway_network"])
+
+def _merge_tile_in_worker(directory_or_zip, core_bounds, read_bounds, owned_rlids):
+    options = _shared_worker_state["options"]
+    time_interval_strings.clear()
+    nvdb_total_bounds = [10000000, 10000000, 0, 0]
+    layer_reader = LayerReader(directory_or_zip, [ MASTER_GEOMETRY_NAME ] + LINE_LAYER_NAMES + POINT_LAYER_NAMES, nvdb_total_bounds,
+                               1, options.cache_dir, read_bounds)
+    way_db = merge_line_layers(layer_reader, MASTER_GEOMETRY_NAME, LINE_LAYER_NAMES, _shared_worker_state["municipality"],
+                               options.self_test_mode, options.self_test_sample_fraction, False)
+    merge_point_layers(layer_reader, POINT_LAYER_NAMES, way_db, nvdb_total_bounds, options.railway_file,
+                       _shared_worker_state["railway_network"], options.skip_railway, False)
+    layer_reader.close()
+    return way_db.get_tile(set(owned_rlids), core_bounds), nvdb_total_bounds, set(time_interval_strings)
+
+# read_rlid_bounds()
+#
+# Get the bounding box of each RLID in a layer. The layer is read in chunks and without
+# other attributes than RLID, so memory use is small compared to converting it.
+#
+def read_rlid_bounds(directory_or_zip, name, chunk_size=200000):
+    gdf_filename, _ = find_geometry_file(directory_or_zip, name)
+    if gdf_filename is None:
+        raise RuntimeError(f"Layer {name} missing in {directory_or_zip}")
+    info = pyogrio.read_info(gdf_filename)
+    # new format layers call the RLID column ELEMENT_ID, see ALT_TAG_NAMES
+    fields = info["fields"].tolist()
+    if "ELEMENT_ID" in fields:
+        rlid_column = "ELEMENT_ID"
+    elif "RLID" in fields:
+        rlid_column = "RLID"
+    else:
+        raise RuntimeError(f"Layer {name} in {directory_or_zip} has no RLID column")
+    feature_count = info["features"]
+    if feature_count < 0:
+        chunks = [ None ] # count not known, read all at once
+    else:
+        chunks = [ slice(start, start + chunk_size) for start in range(0, feature_count, chunk_size) ]
+    _log.info(f"Reading RLID bounding boxes from {gdf_filename}")
+    rlid_bounds = {}
+    for rows in chunks:
+        gdf = geopandas.read_file(gdf_filename, columns=[ rlid_column ], rows=rows)
+        bounds = gdf.geometry.bounds
+        bounds["RLID"] = gdf[rlid_column]
+        bounds = bounds.dropna().groupby("RLID").agg({ "minx": "min", "miny": "min", "maxx": "max", "maxy": "max" })
+        for rlid, minx, miny, maxx, maxy in zip(bounds.index.tolist(), bounds["minx"].tolist(), bounds["miny"].tolist(),
+                                                bounds["maxx"].tolist(), bounds["maxy"].tolist()):
+            if rlid in rlid_bounds:
+                merge_bounds(rlid_bounds[rlid], [ minx, miny, maxx, maxy ])
+            else:
+                rlid_bounds[rlid] = [ minx, miny, maxx, maxy ]
+    _log.info(f"done ({len(rlid_bounds)} RLIDs)")
+    return rlid_bounds
+
+# make_tiles()
+#
+# Partition RLIDs into square tiles, each RLID belonging to the tile containing the center
+# of its bounding box. Returns a list of (core bounds, read bounds, RLIDs) for non-empty
+# tiles, where the read bounds cover all RLIDs of the tile plus overlap, so that a tile has
+# the complete geometry of its RLIDs and their surroundings.
+#
+def make_tiles(rlid_bounds, tile_size, overlap):
+    tiles = {}
+    for rlid, b in rlid_bounds.items():
+        key = (math.floor((b[0] + b[2]) / 2 / tile_size), math.floor((b[1] + b[3]) / 2 / tile_size))
+        if key not in tiles:
+            core = [ key[0] * tile_size, key[1] * tile_size, (key[0] + 1) * tile_size, (key[1] + 1) * tile_size ]
+            tiles[key] = (core, list(core), [])
+        _, read_bounds, rlids = tiles[key]
+        merge_bounds(read_bounds, b)
+        rlids.append(rlid)
+    result = []
+    for key in sorted(tiles.keys()):
+        core, read_bounds, rlids = tiles[key]
+        read_bounds = [ read_bounds[0] - overlap, read_bounds[1] - overlap, read_bounds[2] + overlap, read_bounds[3] + overlap ]
+        result.append((core, read_bounds, rlids))
+    return result
+
+# merge_layers_tiled()
+#
+# Merge all layers tile by tile, in worker processes, and stitch the tiles together into one
+# way database. Merging only needs memory for one tile per worker, and the stitched
+# database is about the size of the merged result.
+#
+def merge_layers_tiled(options, directory_or_zip, nvdb_total_bounds, municipality):
+    tiles = make_tiles(read_rlid_bounds(directory_or_zip, MASTER_GEOMETRY_NAME), options.tile_size, options.tile_overlap)
+    _log.info(f"Merging layers in {len(tiles)} tiles of {options.tile_size:g} meters with {options.tile_overlap:g} meters overlap")
+
+    railway_network = None
+    if not options.skip_railway:
+        railway_bounds = [10000000, 10000000, 0, 0]
+        for _, read_bounds, _ in tiles:
+            merge_bounds(railway_bounds, read_bounds)
+        railway_network = read_railway_network(options.railway_file, railway_bounds)
+
+    initargs = (logging.getLogger().getEffectiveLevel(), get_search_backend(), options, railway_network, municipality)
+    perform_self_testing = options.self_test_mode != "off"
+    if options.jobs == 1:
+        _init_shared_worker(*initargs)
+        return WayDatabase.from_tiles(_merged_tiles(tiles, directory_or_zip, nvdb_total_bounds),
+                                      perform_self_testing, options.self_test_mode, options.self_test_sample_fraction)
+    with ProcessPoolExecutor(max_workers=options.jobs, initializer=_init_shared_worker, initargs=initargs) as pool:
+        return WayDatabase.from_tiles(_merged_tiles(tiles, directory_or_zip, nvdb_total_bounds, pool, options.jobs),
+                                      perform_self_testing, options.self_test_mode, options.self_test_sample_fraction)
+
+# _merged_tiles()
+#
+# Generator merging tiles and yielding them in order, for stitching each tile into the result
+# as soon as it is merged. With a worker pool a window of tiles is merged ahead, one more than
+# the number of workers, so that only a few merged tiles are waiting at any time.
+#
+def _merged_tiles(tiles, directory_or_zip, nvdb_total_bounds, pool=None, jobs=1):
+    pending = {}
+    for idx, (core, read_bounds, rlids) in enumerate(tiles):
+        if pool is None:
+            _log.info(f"Merging tile {idx+1} of {len(tiles)} ({len(rlids)} RLIDs)")
+            result = _merge_tile_in_worker(directory_or_zip, core, read_bounds, rlids)
+        else:
+            for ahead in range(idx, min(idx + jobs + 1, len(tiles))):
+                if ahead not in pending:
+                    pending[ahead] = pool.submit(_merge_tile_in_worker, directory_or_zip, *tiles[ahead])
+            # the future is dropped so the result is only kept until it is stitched
+            result = pending.pop(idx).result()
+            _log.info(f"Merged tile {idx+1} of {len(tiles)}")
+        tile_db, bounds, ti_strings = result
+        del result
+        merge_bounds(nvdb_total_bounds, bounds)
+        time_interval_strings.update(ti_strings)
+        yield tile_db
+
+# convert_batch()
+#
+# Convert several municipalities from the same (county) input, writing one output file per
+# municipality. The municipality borders and railway network are read once and shared, and
+# conversions run in worker processes which each convert one municipality at a time.
+#
+def convert_batch(options, directory_or_zip, output_template, municipality_names):
+    # only municipalities overlapping the input data need to be read
+    county_bounds = read_layer_bounds(directory_or_zip, MASTER_GEOMETRY_NAME)
+    borders = read_municipality_borders(county_bounds)
+    tasks = []
+    railway_bounds = None
+    if county_bounds is not None:
+        railway_bounds = list(county_bounds)
+    for name in municipality_names:
+        municipality = get_municipality(name, borders=borders)
+        if municipality is None:
+            _log.error(f"could not get municipality {name}")
+            sys.exit(1)
+        bbox = [10000000, 10000000, 0, 0]
+        for polygon in municipality:
+            merge_bounds(bbox, polygon.bounds)
+        if railway_bounds is not None:
+            merge_bounds(railway_bounds, bbox)
+        tasks.append((directory_or_zip, output_template.format(municipality=name), municipality, name, bbox))
+
+    railway_network = None
+    if not options.skip_railway:
+        railway_network = read_railway_network(options.railway_file, railway_bounds)
+
+    # parallelism is over municipalities, each conversion is single process
+    jobs = options.jobs
+    options = copy.copy(options)
+    options.jobs = 1
+
+    failed = []
+    if jobs == 1 or len(tasks) == 1:
+        _init_shared_worker(logging.getLogger().getEffectiveLevel(), get_search_backend(), options, railway_network)
+        for task in tasks:
+            _log.info(f"Converting municipality {task[3]}")
+            try:
+                with stage(f"municipality {task[3]}"):
+                    _convert_in_batch_worker(*task)
+            except Exception as e: # pylint: disable=broad-exception-caught
+                _log.exception(f"Conversion of municipality {task[3]} failed: {e}")
+                failed.append(task[3])
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_shared_worker,
+                                 initargs=(logging.getLogger().getEffectiveLevel(), get_search_backend(), options, railway_network)) as pool:
+            futures = [ (task[3], pool.submit(_convert_in_batch_worker, *task)) for task in tasks ]
+            for name, future in futures:
+                try:
+                    future.result()
+                    _log.info(f"Converted municipality {name}")
+                except Exception as e: # pylint: disable=broad-exception-caught
+                    _log.error(f"Conversion of municipality {name} failed: {e}")
+                    failed.append(name)
+    if len(failed) > 0:
+        _log.error(f"Conversion failed for {len(failed)} of {len(tasks)} municipalities: {', '.join(failed)}")
+        sys.exit(1)
+
 def main():
     """The main function, entry point of the program."""
-    master_geometry_name = "NVDB-Reflinjetillkomst"
-
-    # Note the order how the layers are merged is in part important, see comments
-    # So be careful if you re-order
-    line_names = [
-        # We always do FunkVagklass and GCM_vagtyp/CykelVgsKat first, as experience tells us
-        # that if there is a problem with the reference geometry these layers will trigger it.
-        "NVDB-FunkVagklass", # all streets/roads
-        "NVDB-GCM_vagtyp",   # all footways/cycleways
-        "NVDB-CykelVgsKat",  # most often redundant, otherwise complements GCM_vagtyp
-
-        "AGGREGAT-Vagslag",
-        "AGGREGAT-KommunLanReg",
-
-        # just alphabetical order
-        "NVDB-Antal_korfalt2",
-        "NVDB-Barighet",
-        "NVDB-BegrAxelBoggiTryck",
-        "NVDB-BegrBruttovikt",
-        "NVDB-BegrFordBredd",
-        "NVDB-BegrFordLangd",
-        "NVDB-Bro_och_tunnel",
-        "NVDB-Cirkulationsplats",
-        "NVDB-Farjeled",
-        "NVDB-ForbjudenFardriktning",
-        "NVDB-Forbud_omkorn",
-        "NVDB-ForbudTrafik",
-        "NVDB-Gagata",
-        "NVDB-Gangfartsomrade",
-        "NVDB-Gatunamn",
-        #"NVDB-Gatutyp", replaced with AGGREGAT-Vagslag
-        "NVDB-GCM_belyst",
-        "NVDB-GCM_separation",
-        "NVDB-Hastighetsgrans",
-        "NVDB-Huvudled",
-        "NVDB-InskrTranspFarligtGods",
-        "NVDB-Kollektivkorfalt",
-        # "NVDB-Miljozon", experimental tags, excluding them for now
-        "NVDB-Motortrafikled",
-        "NVDB-Motorvag",
-        "NVDB-Ovrigt_vagnamn",
-        "NVDB-RekomVagFarligtGods",
-        "NVDB-Slitlager",
-        "NVDB-Tillganglighet",
-        "NVDB-Vagbredd",
-        "NVDB-Vagnummer",
-        "EVB-Driftbidrag_statligt",
-        "VIS-Funktionellt_priovagnat",
-        #"VIS-Omkorningsforbud", replaced by NVDB-Forbud_omkorn
-        "VIS-Slitlager"
-    ]
-
-    point_names = [
-        "NVDB-Farthinder",
-        "NVDB-GCM_passage",
-        "NVDB-Hojdhinder45dm",
-        "NVDB-Korsning",
-        "NVDB-Stopplikt",
-        "NVDB-Vaghinder",
-        "NVDB-Vajningsplikt",
-        "VIS-Jarnvagskorsning",
-        "VIS-P_ficka",
-        "VIS-Rastplats",
-        "AGGREGAT-Plankorsning_vag_jarnvag"
-    ]
     parser = argparse.ArgumentParser(description='Convert NVDB-data from Trafikverket to OpenStreetMap XML')
     parser.add_argument('--dump_layers', help="Write an OSM XML file for each layer", action='store_true')
     parser.add_argument('--skip_railway', help="Don't require railway geometry (leads to worse railway crossing handling)", action='store_true')
@@ -259,9 +929,23 @@ def main():
     parser.add_argument('--split_file', type=pathlib.Path, help="Path to geojson with polygons of subareas for splitting the output")
     parser.add_argument('--split_dir', type=pathlib.Path, help="Path to store subarea output")
     parser.add_argument('--municipality_filter', help="Code or name of municipality which all geometry should be inside", default=None)
+    parser.add_argument('--batch_municipalities', help="Comma-separated codes or names of municipalities to convert from the same (county) input, "
+                        "one output file each. The output file name must then contain {municipality}, like out/{municipality}.osm", default=None)
+    parser.add_argument('--tile_size', type=float, help="Merge layers in square tiles of this size in meters, in parallel with --jobs, "
+                        "to bound memory use when converting large areas", default=None)
+    parser.add_argument('--tile_overlap', type=float, help="Meters of surrounding geometry read around the RLIDs of each tile", default=200.0)
     parser.add_argument('--rlid', help="Include RLID in output", action='store_true')
     parser.add_argument('--small_road_resolve', help="Specify small road resolve algorithm", default="default")
-    parser.add_argument('--skip_self_test', help="Skip self tests", action='store_true')
+    parser.add_argument('--skip_self_test', help="Skip self tests (same as --self_test=off)", action='store_true')
+    parser.add_argument('--self_test', help=f"Self test mode, one of {SELF_TEST_MODES}, sampled with fraction of RLIDs to test, like sampled:0.05", default="incremental")
+    parser.add_argument('--cache_dir', type=pathlib.Path, help="Directory where parsed layers are cached between runs", default=None)
+    parser.add_argument('--checkpoint_dir', type=pathlib.Path, help="Directory where pipeline checkpoints are saved and resumed from", default=None)
+    parser.add_argument('--resume_from', help=f"Resume from checkpoint saved after the given stage, one of {CHECKPOINT_STAGES}", default=None)
+    parser.add_argument('--jobs', type=int, help="Number of worker processes used for reading layers and writing split files, or for converting municipalities in batch mode", default=1)
+    parser.add_argument('--stats_file', type=pathlib.Path, help="Write JSON report with time, memory and object counts per stage and layer, stages in worker processes are not included", default=None)
+    parser.add_argument('--profile_stage', help="Run the named stage (as in the stats report, like 'resolve_highways' or 'layer NVDB-Gatunamn') with cProfile", default=None)
+    parser.add_argument('--profile_file', type=pathlib.Path, help="Where to save the profile of --profile_stage", default="nvdb2osm.prof")
+    parser.add_argument('--search_backend', help=f"Spatial search implementation, one of {SEARCH_BACKENDS}", default=SEARCH_BACKENDS[0])
     parser.add_argument(
         '-d', '--debug',
         help="Print debugging statements",
@@ -276,7 +960,7 @@ def main():
     parser.add_argument('shape_file', type=pathlib.Path,
                         help="zip or dir with NVDB *.shp files")
     parser.add_argument('osm_file', type=pathlib.Path,
-                        help="filename of OSM XML output")
+                        help="filename of OSM output, PBF format if it ends with .pbf, otherwise OSM XML")
     args = parser.parse_args()
     logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=args.loglevel)
     _log = logging.getLogger("nvdb2osm")
@@ -289,194 +973,80 @@ def main():
     _log.info(f"args are {args}")
 
     log_version()
+    if args.stats_file is not None or args.profile_stage is not None:
+        enable_stats(args.profile_stage, args.profile_file)
 
-    write_rlid = args.rlid
-    debug_dump_layers = args.dump_layers
-    skip_railway = args.skip_railway
     directory_or_zip = args.shape_file
     output_filename = args.osm_file
-    railway_filename = args.railway_file
     split_areas_filename = args.split_file
-    split_dir = args.split_dir
     municipality_filter = args.municipality_filter
-    perform_self_testing = not args.skip_self_test
-    small_road_resolve_algorithm = args.small_road_resolve
+    args.self_test_mode, args.self_test_sample_fraction = parse_self_test_mode(args.self_test)
+    if args.skip_self_test:
+        args.self_test_mode = "off"
 
+    args.split_area_polygons = None
     if split_areas_filename is not None:
         _log.info(f"Reading {split_areas_filename} (to be used for splitting output)")
-        split_area_polygons = read_geojson_with_polygons(split_areas_filename)
+        args.split_area_polygons = read_geojson_with_polygons(split_areas_filename)
 
     municipality = None
-    if municipality_filter is not None:
-        municipality = get_municipality(municipality_filter)
+    if municipality_filter is not None and args.batch_municipalities is None:
+        # only municipalities overlapping the input data need to be read
+        municipality = get_municipality(municipality_filter, read_layer_bounds(directory_or_zip, MASTER_GEOMETRY_NAME))
         if municipality is None:
             _log.error(f"could not get municipality {municipality_filter}")
             sys.exit(1)
 
-    if small_road_resolve_algorithm not in SMALL_ROAD_RESOLVE_ALGORITHMS:
+    if args.small_road_resolve not in SMALL_ROAD_RESOLVE_ALGORITHMS:
         _log.error(f"small_road_resolve parameter must be one of {SMALL_ROAD_RESOLVE_ALGORITHMS}")
         sys.exit(1)
 
-    if railway_filename is None and not skip_railway:
-        _log.error("File with national railway geometry not provided (use --railway_file). Can be skipped by adding --skip_railway parameter, but then railway crossings will be somewhat misaligned")
+    if args.search_backend not in SEARCH_BACKENDS:
+        _log.error(f"search_backend parameter must be one of {SEARCH_BACKENDS}")
         sys.exit(1)
+    set_search_backend(args.search_backend)
 
-    _log.debug("Starting!")
-    nvdb_total_bounds = [10000000, 10000000, 0, 0] # init to outside max range of SWEREF99
-    # First setup a complete master geometry and refine it so we have a good geometry to merge the rest of the data with
-    name = master_geometry_name
-    ref_ways = read_nvdb_geometry(directory_or_zip, name, TAG_TRANSLATIONS[name], nvdb_total_bounds)
-    if debug_dump_layers:
-        write_osmxml(ref_ways, [], "raw_reference_geometry.osm")
-    ref_ways = find_overlapping_and_remove_duplicates(name, ref_ways)
-    way_db = WayDatabase(ref_ways, perform_self_testing)
-
-    if debug_dump_layers:
-        write_osmxml(way_db.get_reference_geometry(), [], "reference_geometry.osm")
-
-    all_line_names = line_names
-    layer_count = len(all_line_names)
-    layer_idx = 0
-    for name in all_line_names:
-        if name is None:
-            break
-        ways = read_nvdb_geometry(directory_or_zip, name, TAG_TRANSLATIONS[name], nvdb_total_bounds)
-        ways = find_overlapping_and_remove_duplicates(name, ways)
-        did_insert_new_ref_geometry = way_db.insert_missing_reference_geometry_if_any(ways)
-
-        if debug_dump_layers:
-            if did_insert_new_ref_geometry:
-                write_osmxml(way_db.get_reference_geometry(), [], "reference_geometry.osm")
-            write_osmxml(ways, [], name + ".osm")
-
-        debug_ways = None
-        if name == "NVDB-Bro_och_tunnel":
-            ways = preprocess_bridges_and_tunnels(ways, way_db)
-            if debug_dump_layers:
-                write_osmxml(ways, [], name + "-preproc.osm")
-                debug_ways = []
-
-        insert_rlid_elements(way_db, ways, name, debug_ways=debug_ways)
-        if perform_self_testing:
-            way_db.test_segments()
-        if debug_ways is not None:
-            write_osmxml(debug_ways, [], name + "-adapted.osm")
-        layer_idx += 1
-        _log.info(f"Merged {layer_idx} of {layer_count} line geometry layers")
-
-    way_db.join_segments_with_same_tags()
-    way_db.remove_short_sub_segments()
-    if municipality is not None:
-        way_db.remove_segments_outside_area(municipality)
-
-    way_db.setup_geometry_search()
-
-    layer_count = len(point_names)
-    layer_idx = 0
-    for name in point_names:
-        if name is None:
-            break
-        points = read_nvdb_geometry(directory_or_zip, name, TAG_TRANSLATIONS[name], nvdb_total_bounds)
-        points = find_overlapping_and_remove_duplicates(name, points)
-
-        do_snap = True
-        if name == "NVDB-GCM_passage":
-            points = preprocess_footcycleway_crossings(points, way_db)
-        elif name == "NVDB-Korsning":
-            points = process_street_crossings(points, way_db, name)
-        elif name in ("VIS-Jarnvagskorsning", "AGGREGAT-Plankorsning_vag_jarnvag"):
-            if len(points) > 0:
-                railways = []
-                if not skip_railway:
-                    _log.info(f"There are {len(points)} railway crossings, reading railway geometry to have something to snap them to")
-                    gdf = None
-                    for rw_name in ["Järnvägsnät_grundegenskaper2_0_GeoPackage", "Järnvägsnät_med_grundegenskaper2_0", "Järnvägsnät_med_grundegenskaper"]:
-                        gdf = read_geometry_from_file(railway_filename, rw_name)
-                        if gdf is not None:
-                            break
-                    if gdf is None:
-                        raise RuntimeError("Railway geometry missing")
-                    _log.info(f"Filtering out railway segments for bounding box {nvdb_total_bounds}...")
-                    for index, row in gdf.iterrows():
-                        if bounds_intersect(row.geometry.bounds, nvdb_total_bounds):
-                            seg = NvdbSegment({ "geometry": shapely_linestring_to_way(row.geometry),
-                                                "RLID": f"RW-{index}"
-                                               })
-                            railways.append(seg)
-                    _log.info(f"Done ({len(railways)} of {len(gdf)} segments kept)")
-                    if debug_dump_layers:
-                        write_osmxml(railways, [], "local-railway.osm")
-                points = preprocess_railway_crossings(points, way_db, railways)
-        elif name == "VIS-P_ficka":
-            points = preprocess_laybys(points, way_db)
-            do_snap = False
-
-        insert_rlid_elements(way_db, points, name, do_snap=do_snap)
-        layer_idx += 1
-        _log.debug(f"Merged {layer_idx} of {layer_count} point layers")
-
-    if debug_dump_layers:
-        waydb2osmxml(way_db, "pre-resolve.osm")
-
-    sort_multiple_road_names(way_db)
-    resolve_highways(way_db, small_road_resolve_algorithm)
-    if small_road_resolve_algorithm not in ['prefer_service_static', 'prefer_track_static']:
-        upgrade_unclassified_stumps_connected_to_residential(way_db)
-        guess_upgrade_tracks(way_db)
-
-    # converts cycleway way crossings to node crossing, which is optional, both ways to map are correct
-    simplify_cycleway_crossings(way_db)
-
-    bridge_footway_and_cycleway_separations(way_db)
-    simplify_speed_limits(way_db)
-    remove_redundant_speed_limits(way_db)
-    cleanup_highway_widths(way_db)
-    round_highway_widths(way_db)
-    remove_redundant_cycleway_names(way_db)
-    merge_nearby_same_nodes(way_db, way_db.point_db)
-
-    # Note: simplify_oneway() may reverse some ways, causing functions depending on that ways
-    # with the same RLID is oriented in the same direction to not work
-    simplify_oneway(way_db, way_db.point_db)
-
-    resolve_lanes(way_db)
-    final_pass_postprocess_miscellaneous_tags(way_db)
-
-    used_keys = SortedDict()
-    cleanup_used_nvdb_tags(way_db.way_db, used_keys)
-    cleanup_used_nvdb_tags(way_db.point_db, used_keys)
-
-    log_used_and_leftover_keys(used_keys)
-    _log.info("Time intervals used:")
-    for str1 in time_interval_strings:
-        _log.info(f"  '{str1}'")
-
-    if debug_dump_layers:
-        waydb2osmxml(way_db, "pre-join.osm")
-
-    way_db.join_segments_with_same_tags(join_rlid=True)
+    if args.jobs < 1:
+        _log.error("jobs parameter must be at least 1")
+        sys.exit(1)
 
-    if debug_dump_layers:
-        waydb2osmxml(way_db, "pre-treelike.osm")
+    if args.resume_from is not None:
+        if args.resume_from not in CHECKPOINT_STAGES:
+            _log.error(f"resume_from parameter must be one of {CHECKPOINT_STAGES}")
+            sys.exit(1)
+        if args.checkpoint_dir is None:
+            _log.error("resume_from requires checkpoint_dir")
+            sys.exit(1)
 
-    way_db.make_way_directions_tree_like()
+    if args.railway_file is None and not args.skip_railway:
+        _log.error("File with national railway geometry not provided (use --railway_file). Can be skipped by adding --skip_railway parameter, but then railway crossings will be somewhat misaligned")
+        sys.exit(1)
 
-    if debug_dump_layers:
-        waydb2osmxml(way_db, "pre-simplify.osm")
+    if args.tile_size is not None:
+        if args.tile_size <= 0 or args.tile_overlap < 0:
+            _log.error("tile_size must be larger than 0 and tile_overlap must not be negative")
+            sys.exit(1)
+        if args.batch_municipalities is not None or args.checkpoint_dir is not None or args.dump_layers:
+            _log.error("tile_size cannot be combined with batch_municipalities, checkpoint_dir or dump_layers")
+            sys.exit(1)
 
-    way_db.simplify_geometry()
-    _log.info(f"Writing output to {output_filename}")
-    waydb2osmxml(way_db, output_filename, boundary_polygons=municipality, write_rlid=write_rlid)
-    _log.info("done writing output")
+    if args.batch_municipalities is not None:
+        if municipality_filter is not None:
+            _log.error("municipality_filter cannot be combined with batch_municipalities")
+            sys.exit(1)
+        if args.checkpoint_dir is not None or args.dump_layers:
+            _log.error("checkpoint_dir and dump_layers cannot be used with batch_municipalities")
+            sys.exit(1)
+        if "{municipality}" not in str(output_filename):
+            _log.error("With batch_municipalities the output file name must contain {municipality}")
+            sys.exit(1)
+        municipality_names = [ name.strip() for name in args.batch_municipalities.split(",") if name.strip() != "" ]
+        convert_batch(args, directory_or_zip, str(output_filename), municipality_names)
+    else:
+        convert(args, directory_or_zip, output_filename, municipality, municipality_filter)
 
-    if split_areas_filename is not None:
-        if municipality is not None:
-            basename = municipality_filter
-        else:
-            basename = "mapdata"
-        if split_dir is None:
-            split_dir = "."
-        splitosm(way_db, municipality, split_area_polygons, split_dir, basename, write_rlid=write_rlid)
+    if args.stats_file is not None:
+        write_stats_report(args.stats_file, { "input": str(directory_or_zip), "code_checksums": get_code_checksums() })
 
     _log.info("Conversion is complete. Don't expect NVDB data to be perfect or complete.")
     _log.info("Remember to validate the OSM file (JOSM validator) and check any fixme tags.")
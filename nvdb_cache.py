@@ -0,0 +1,109 @@
+import hashlib
+import logging
+import os
+import pickle
+
+_log = logging.getLogger("nvdb_cache")
+
+# Bump when the content of the cache files changes
+CACHE_FORMAT_VERSION = 2
+
+# md5 sums of input files, keyed on (path, size, mtime) so each file is only hashed once per run
+_file_md5_cache = {}
+
+# file_md5()
+#
+# Get md5 hex digest of a file
+#
+def file_md5(fname):
+    st = os.stat(fname)
+    key = (os.path.abspath(fname), st.st_size, st.st_mtime_ns)
+    if key in _file_md5_cache:
+        return _file_md5_cache[key]
+    hash_md5 = hashlib.md5()
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hash_md5.update(chunk)
+    digest = hash_md5.hexdigest()
+    _file_md5_cache[key] = digest
+    return digest
+
+# get_layer_cache_key()
+#
+# Make a key (usable as file name) for a parsed layer, from the checksums of the input
+# files, the layer name, the bounding box it was read within (if any) and the checksums of
+# the code that parsed it.
+#
+def get_layer_cache_key(source_files, name, code_checksums, bbox=None):
+    hash_md5 = hashlib.md5()
+    hash_md5.update(f"format {CACHE_FORMAT_VERSION}\n".encode())
+    hash_md5.update(f"layer {name}\n".encode())
+    if bbox is not None:
+        hash_md5.update(f"bbox {' '.join([ repr(float(v)) for v in bbox ])}\n".encode())
+    for fname in source_files:
+        hash_md5.update(f"input {os.path.basename(fname)} {file_md5(fname)}\n".encode())
+    for fname, md5 in sorted(code_checksums.items()):
+        hash_md5.update(f"code {fname} {md5}\n".encode())
+    return f"{name}-{hash_md5.hexdigest()}"
+
+# load_cached_layer()
+#
+# Load a layer stored by store_cached_layer(), returns None if there is none
+#
+def load_cached_layer(cache_dir, key):
+    fname = os.path.join(cache_dir, key + ".pickle")
+    if not os.path.isfile(fname):
+        return None
+    try:
+        with open(fname, "rb") as f:
+            data = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError) as e:
+        _log.warning(f"Ignoring unreadable cache file {fname}: {e}")
+        return None
+    _log.info(f"Read layer from cache file {fname}")
+    return data
+
+# store_cached_layer()
+#
+# Store a layer in the cache directory. The file is written under a temporary name and
+# then renamed so that concurrent runs never see a half-written file.
+#
+def store_cached_layer(cache_dir, key, data):
+    os.makedirs(cache_dir, exist_ok=True)
+    fname = os.path.join(cache_dir, key + ".pickle")
+    tmp_fname = f"{fname}.{os.getpid()}.tmp"
+    with open(tmp_fname, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_fname, fname)
+    _log.info(f"Stored layer in cache file {fname}")
+
+# save_checkpoint()
+#
+# Store pipeline state (way database and anything else needed to continue) after a named
+# stage, to be loaded with load_checkpoint()
+#
+def save_checkpoint(checkpoint_dir, stage, state):
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    fname = os.path.join(checkpoint_dir, stage + ".checkpoint")
+    _log.info(f"Writing checkpoint {fname}...")
+    tmp_fname = f"{fname}.{os.getpid()}.tmp"
+    with open(tmp_fname, "wb") as f:
+        pickle.dump((CACHE_FORMAT_VERSION, stage, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_fname, fname)
+    _log.info("done")
+
+# load_checkpoint()
+#
+# Load state stored by save_checkpoint()
+#
+def load_checkpoint(checkpoint_dir, stage):
+    fname = os.path.join(checkpoint_dir, stage + ".checkpoint")
+    if not os.path.isfile(fname):
+        raise RuntimeError(f"No checkpoint file {fname}")
+    _log.info(f"Reading checkpoint {fname}...")
+    with open(fname, "rb") as f:
+        version, file_stage, state = pickle.load(f)
+    if version != CACHE_FORMAT_VERSION or file_stage != stage:
+        raise RuntimeError(f"Checkpoint file {fname} is incompatible")
+    _log.info("done")
+    return state
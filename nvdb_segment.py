@@ -1,7 +1,65 @@
+from geometry_basics import Point, PointArray
 from proj_xy import latlon_str
 
 NVDB_GEOMETRY_TAGS = [ "STARTAVST", "SLUTAVST", "SHAPE_LEN", "AVST", "FRAN_DATUM" ]
 
+# _tags_key()
+#
+# Hashable form of a tags (or tag sources) dictionary. List values are kept apart from
+# tuples, as they would be in a dictionary comparison.
+#
+def _tags_key(tags):
+    return tuple(sorted((k, (list, tuple(v)) if isinstance(v, list) else v) for k, v in tags.items()))
+
+# FrozenTags
+#
+# Immutable tags (or tag sources) dictionary, shared between segments (see NvdbSegment). The
+# hash is computed once, or given as a precomputed key from _tags_key().
+#
+class FrozenTags(dict):
+    __slots__ = ("_hash",)
+
+    def __init__(self, tags=(), key=None):
+        super().__init__(tags)
+        self._hash = None if key is None else hash(key)
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("shared tags are immutable, use NvdbSegment.mutable_tags()")
+
+    __setitem__ = _immutable
+    __delitem__ = _immutable
+    __ior__ = _immutable
+    clear = _immutable
+    pop = _immutable
+    popitem = _immutable
+    setdefault = _immutable
+    update = _immutable
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(_tags_key(self))
+        return self._hash
+
+    def __reduce__(self):
+        return (FrozenTags, (dict(self),))
+
+def _freeze(tags):
+    if isinstance(tags, FrozenTags):
+        return tags
+    return FrozenTags(tags)
+
+def _unfreeze(tags):
+    return { k: (v.copy() if isinstance(v, list) else v) for k, v in tags.items() }
+
+# NvdbSegment
+#
+# A segment of an NVDB road (RLID) with tags, and for each tag the data source it came from.
+#
+# Tags and tag sources are copy-on-write: segments split from the same segment, and segments
+# with equal tags after intern_tags(), share the same FrozenTags. Reading 'tags' and 'tag_src'
+# directly never copies, modifications must be made through mutable_tags() and
+# mutable_tag_src(), which make a private copy first if shared. Use same_tags() to compare.
+#
 class NvdbSegment:
     def __init__(self, *args):
         # python doesn't support multiple constructors, so we use a hack with dynamic args
@@ -17,6 +75,8 @@ class NvdbSegment:
 
             tags = shapely_dict.copy()
             self.way = shapely_dict["geometry"]
+            if isinstance(self.way, PointArray):
+                self.way = self.way.to_points()
 
             tags.pop("RLID", None)
             tags.pop("TILL_DATUM", None)
@@ -33,12 +93,36 @@ class NvdbSegment:
             self.tag_src = {}
         self.way_id = -1
 
+    def mutable_tags(self):
+        if isinstance(self.tags, FrozenTags):
+            self.tags = _unfreeze(self.tags)
+        return self.tags
+
+    def mutable_tag_src(self):
+        if isinstance(self.tag_src, FrozenTags):
+            self.tag_src = _unfreeze(self.tag_src)
+        return self.tag_src
+
+    # same_tags()
+    #
+    # Check if two segments have equal tags. Shared tags are compared by identity, or by their
+    # hash if both are shared.
+    #
+    def same_tags(self, other):
+        if self.tags is other.tags:
+            return True
+        if isinstance(self.tags, FrozenTags) and isinstance(other.tags, FrozenTags) and hash(self.tags) != hash(other.tags):
+            return False
+        return self.tags == other.tags
+
     def make_copy_new_way(self, way):
         copy = type(self)()
         copy.rlid = self.rlid
         copy.way_id = self.way_id
-        copy.tags = self.tags.copy()
-        copy.tag_src = self.tag_src.copy()
+        self.tags = _freeze(self.tags)
+        self.tag_src = _freeze(self.tag_src)
+        copy.tags = self.tags
+        copy.tag_src = self.tag_src
         copy.way = way
         return copy
 
@@ -52,3 +136,55 @@ class NvdbSegment:
         if isinstance(self.way, list):
             return f"<rlid:{self.rlid} {self.way[0].dist:g}..{self.way[-1].dist:g}>"
         return f"<rlid:{self.rlid} {latlon_str(self.way)}>"
+
+def _intern(tags, interned, kind):
+    key = _tags_key(tags)
+    canonical = interned.get((kind, key), None)
+    if canonical is None:
+        canonical = tags if isinstance(tags, FrozenTags) else FrozenTags(tags, key)
+        interned[(kind, key)] = canonical
+    return canonical
+
+# intern_tags()
+#
+# Make segments with equal tags share the same FrozenTags, and likewise for tag sources (see
+# NvdbSegment). The 'interned' dict is the intern table and can be reused between calls.
+#
+def intern_tags(segments, interned=None):
+    if interned is None:
+        interned = {}
+    for seg in segments:
+        seg.tags = _intern(seg.tags, interned, "tags")
+        seg.tag_src = _intern(seg.tag_src, interned, "tag_src")
+    return interned
+
+# pack_segments()
+#
+# Convert a freshly read list of NvdbSegment to a compact form suitable for pickling, used
+# when passing layers between processes. Only valid before the segments have been merged
+# (tag sources are recreated from FRAN_DATUM when unpacking).
+#
+def pack_segments(segments):
+    packed = []
+    for seg in segments:
+        if isinstance(seg.way, list):
+            way = PointArray.from_points(seg.way)
+        else:
+            way = (seg.way.x, seg.way.y)
+        packed.append((seg.rlid, seg.way_id, seg.tags, way))
+    return packed
+
+# unpack_segments()
+#
+# Inverse of pack_segments()
+#
+def unpack_segments(packed):
+    segments = []
+    for rlid, way_id, tags, way in packed:
+        shapely_dict = tags.copy()
+        shapely_dict["RLID"] = rlid
+        shapely_dict["geometry"] = way if isinstance(way, PointArray) else Point(way[0], way[1])
+        seg = NvdbSegment(shapely_dict)
+        seg.way_id = way_id
+        segments.append(seg)
+    return segments
@@ -1,8 +1,9 @@
 # Tools for parsing NVDB time intervals and converting them to OSM "opening hours" format
 #
-# FIXME: Currently this code is very hackish. At some point it should be redesigned to
-# parse to a "time interval" class and then work on that rather than just work directly on
-# strings
+# The time interval columns are parsed into typed values (hour and minute ranges, date ranges,
+# weekday ranges and day types), which are combined into a TimeInterval, a list of opening
+# hours rules. Merging and simplification work on the rules, and the OSM string is rendered
+# at the end. Results are cached per distinct set of time interval column values.
 #
 import re
 import logging
@@ -13,6 +14,80 @@ from sortedcontainers import SortedDict
 _log = logging.getLogger("nvdb_ti")
 time_interval_strings = set()
 
+# Results of parse_time_interval_tags() by time interval column values. Not bounded, there
+# are few distinct time intervals even in large datasets.
+_parsed_cache = {}
+
+MONTHS = [ "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec" ]
+
+# TimeIntervalRule
+#
+# One rule of an OSM opening hours value. The selector is for example "Mo-Fr", "PH" or
+# "Jun 1-Aug 31 Sa" (None if there is no selector), and times for example "08:00-16:00" or
+# "off".
+#
+class TimeIntervalRule:
+    __slots__ = ("selector", "times")
+
+    def __init__(self, selector, times):
+        self.selector = selector
+        self.times = times
+
+    def with_prefix(self, prefix):
+        if self.selector is None:
+            return TimeIntervalRule(prefix, self.times)
+        return TimeIntervalRule(prefix + " " + self.selector, self.times)
+
+    def __str__(self):
+        if self.selector is None:
+            return self.times
+        return self.selector + " " + self.times
+
+    def __repr__(self):
+        return f"<{self}>"
+
+# TimeInterval
+#
+# OSM opening hours value as a list of rules, str() renders it in OSM syntax
+#
+class TimeInterval:
+    def __init__(self, rules):
+        self.rules = rules
+
+    def has_date_interval(self):
+        selector = self.rules[0].selector
+        return selector is not None and selector.split()[0] in MONTHS
+
+    def has_selector(self, selector):
+        return any(r.selector == selector for r in self.rules)
+
+    def count_selector(self, selector):
+        return sum(1 for r in self.rules if r.selector == selector)
+
+    # without_rule()
+    #
+    # Remove a rule (for example "PH off") wherever it follows another rule
+    #
+    def without_rule(self, selector, times):
+        rules = self.rules[:1] + [ r for r in self.rules[1:] if r.selector != selector or r.times != times ]
+        return TimeInterval(rules)
+
+    # with_prefix()
+    #
+    # Prefix the first rule's selector, for example with a date range
+    #
+    def with_prefix(self, prefix):
+        return TimeInterval([ self.rules[0].with_prefix(prefix) ] + self.rules[1:])
+
+    def is_always(self):
+        return len(self.rules) == 1 and self.rules[0].selector is None and self.rules[0].times == "00:00-24:00"
+
+    def __str__(self):
+        return "; ".join(str(r) for r in self.rules)
+
+    def __repr__(self):
+        return f"<TimeInterval {self}>"
+
 
 # parse_time_interval_tags()
 #
@@ -64,6 +139,24 @@ def parse_time_interval_tags(tags):
                     presuffixes.add(prefix + suffix)
                     del_keys.append(k)
                     break
+
+    try:
+        # type included so that for example 1 and True are kept apart
+        cache_key = tuple((k, type(tags[k]), tags[k]) for k in sorted(del_keys))
+        cached = _parsed_cache.get(cache_key, None)
+    except TypeError:
+        # unhashable value
+        cache_key = None
+        cached = None
+    if cached is not None:
+        result, recorded = cached
+        time_interval_strings.update(recorded)
+        for k in del_keys:
+            del tags[k]
+        if isinstance(result, dict):
+            return result.copy()
+        return result
+
     parsed_intervals = SortedDict({})
     for presuffix in presuffixes:
         prefix = presuffix.split("/")[0] + "/"
@@ -104,103 +197,129 @@ def parse_time_interval_tags(tags):
                 output[output_key] = item["parser"](values)
     for k in del_keys:
         del tags[k]
+    recorded = []
     output_map = {}
     for k, v in parsed_intervals.items():
         prefix = k.split("/")[0] + "/"
         if prefix not in output_map:
             output_map[prefix] = None
-        ti_str = merge_time_intervals(v, tags["RLID"])
-        if ti_str == -1:
+        ti = merge_time_intervals(v, tags["RLID"], recorded)
+        if ti == -1:
+            time_interval_strings.update(recorded)
             return -1
-        if ti_str is not None:
+        if ti is not None:
             if output_map[prefix] is None:
-                output_map[prefix] = simplify_time_interval(ti_str)
+                output_map[prefix] = simplify_time_interval(ti)
             else:
-                output_map[prefix] = merge_multiple_time_intervals(output_map[prefix], ti_str)
+                output_map[prefix] = merge_multiple_time_intervals(output_map[prefix], ti, recorded)
+    time_interval_strings.update(recorded)
+    for prefix, ti in output_map.items():
+        if ti is not None:
+            output_map[prefix] = str(ti)
     if len(output_map) == 1 and "/" in output_map:
-        return output_map["/"]
-    return output_map
+        result = output_map["/"]
+    else:
+        result = output_map
+    if cache_key is not None:
+        _parsed_cache[cache_key] = (result, tuple(recorded))
+        if isinstance(result, dict):
+            return result.copy()
+    return result
+
+def _hourmin_str(hourmin):
+    return "%02d:%02d-%02d:%02d" % hourmin
 
+def _day_interval_str(day_interval):
+    if day_interval[1] is None:
+        return day_interval[0]
+    return day_interval[0] + "-" + day_interval[1]
 
-def merge_time_intervals(ti, rlid):
+def _date_interval_str(date_interval):
+    (start_mon, start_day), (end_mon, end_day) = date_interval
+    return "%s %d-%s %d" % (MONTHS[start_mon - 1], start_day, MONTHS[end_mon - 1], end_day)
+
+# merge_time_intervals()
+#
+# Combine the parsed values of one time interval into a TimeInterval. Returns None if the
+# interval covers all time, and -1 on failure. Rendered intervals are appended to 'recorded'.
+#
+def merge_time_intervals(ti, rlid, recorded):
     hourmin_int1 = ti.get("hourmin_interval1", None)
     hourmin_int2 = ti.get("hourmin_interval2", None)
     if hourmin_int1 is None and hourmin_int2 is not None:
         _log.warning(f"bad hourmin interval combination. (RLID {rlid} TI {ti})")
         return -1
     if hourmin_int1 is not None and hourmin_int2 is not None:
-        hourmin_int = hourmin_int1 + "," + hourmin_int2
+        times = _hourmin_str(hourmin_int1) + "," + _hourmin_str(hourmin_int2)
+    elif hourmin_int1 is not None:
+        times = _hourmin_str(hourmin_int1)
     else:
-        hourmin_int = hourmin_int1
+        times = "00:00-24:00"
 
     day_type = ti["day_type"]
     day_interval = ti["day_interval"]
     date_interval = ti["date_interval"]
-    merge_str = hourmin_int
-    if merge_str is None:
-        merge_str = "00:00-24:00"
+    rules = [ TimeIntervalRule(None, times) ]
     if day_type is not None:
-        if day_interval == "Mo-Fr" and day_type in ["vardag utom dag före sön- och helgdag", 3]:
+        if day_interval == ("Mo", "Fr") and day_type in ["vardag utom dag före sön- och helgdag", 3]:
             day_interval = None
         if day_interval is not None and day_type != "vardag":
-            _log.warning(f"day_interval ({day_interval}) and day_type ({day_type}) set at the same time (RLID {rlid} TI {ti})")
+            _log.warning(f"day_interval ({_day_interval_str(day_interval)}) and day_type ({day_type}) set at the same time (RLID {rlid} TI {ti})")
             return -1
         if day_type in ["vardag", 1]:
             if day_interval is not None:
                 # rare case (observed in InskrTranspFarligtGods Stockholm)
-                merge_str = "%s %s; PH off" % (day_interval, merge_str)
+                rules = [ TimeIntervalRule(_day_interval_str(day_interval), times), TimeIntervalRule("PH", "off") ]
                 day_interval = None
             else:
-                merge_str = "Mo-Sa %s; PH off" % merge_str
+                rules = [ TimeIntervalRule("Mo-Sa", times), TimeIntervalRule("PH", "off") ]
         elif day_type in ['vardag före sön- och helgdag', 2]:
-            merge_str = "Sa %s; PH -1 day %s; PH off" % (merge_str, merge_str)
+            rules = [ TimeIntervalRule("Sa", times), TimeIntervalRule("PH -1 day", times), TimeIntervalRule("PH", "off") ]
         elif day_type in ["vardag utom dag före sön- och helgdag", 3]:
-            merge_str = "Mo-Fr %s; PH -1 day off; PH off" % merge_str
+            rules = [ TimeIntervalRule("Mo-Fr", times), TimeIntervalRule("PH -1 day", "off"), TimeIntervalRule("PH", "off") ]
         elif day_type in ["sön- och helgdag", 4]:
-            merge_str = "Su %s; PH %s" % (merge_str, merge_str)
+            rules = [ TimeIntervalRule("Su", times), TimeIntervalRule("PH", times) ]
         else:
             _log.warning(f"unknown day type {day_type} (RLID {rlid})")
             return -1
+    merged = TimeInterval(rules)
     if day_interval is not None:
-        merge_str = day_interval + " " + merge_str
+        merged = merged.with_prefix(_day_interval_str(day_interval))
     if date_interval is not None:
-        merge_str = "%s %s" % (date_interval, merge_str)
-    if merge_str == "00:00-24:00":
+        merged = merged.with_prefix(_date_interval_str(date_interval))
+    if merged.is_always():
         return None
-    time_interval_strings.add(merge_str)
-    return merge_str
+    recorded.append(str(merged))
+    return merged
 
 
 # This is not fully generic, in only can merge time intervals
 # merge_time_intervals() is expected to produce
-def merge_multiple_time_intervals(dst, src):
-    months = [ "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec" ]
-    dst_has_date_interval = dst.split()[0] in months
-    src_has_date_interval = src.split()[0] in months
-
-    if dst_has_date_interval:
-        merge_str = dst + "; " + src
-    elif src_has_date_interval:
-        merge_str = src + "; " + dst
+def merge_multiple_time_intervals(dst, src, recorded):
+    if dst.has_date_interval():
+        merged = TimeInterval(dst.rules + src.rules)
+    elif src.has_date_interval():
+        merged = TimeInterval(src.rules + dst.rules)
     else:
-        src_has_ph1 = "PH -1 day" in src
-        src_has_ph = src.count("PH ") - src.count("PH -1 day") == 1
-        if "; PH -1 day off" in dst and src_has_ph1:
-            dst = dst.replace("; PH -1 day off", "")
-        if "; PH off" in dst and src_has_ph:
-            dst = dst.replace("; PH off", "")
-        merge_str = dst + "; " + src
-
-    merge_str = simplify_time_interval(merge_str)
-    time_interval_strings.add("Merge time intervals: '%s' AND '%s' => '%s'" % (dst, src, merge_str))
-    return merge_str
+        src_has_ph1 = src.has_selector("PH -1 day")
+        src_has_ph = src.count_selector("PH") == 1
+        if src_has_ph1:
+            dst = dst.without_rule("PH -1 day", "off")
+        if src_has_ph:
+            dst = dst.without_rule("PH", "off")
+        merged = TimeInterval(dst.rules + src.rules)
+
+    merged = simplify_time_interval(merged)
+    recorded.append("Merge time intervals: '%s' AND '%s' => '%s'" % (dst, src, merged))
+    return merged
 
 def parse_hourmin_interval(values):
-    return "%02d:%02d-%02d:%02d" % (int(values[0]), int(values[1]), int(values[2]), int(values[3]))
+    return (int(values[0]), int(values[1]), int(values[2]), int(values[3]))
 
 def parse_date_interval(values):
-    di = parse_range_date(values[0]) + "-" + parse_range_date(values[1])
-    if di in ("Dec 29-Dec 29", "Jan 01-Dec 29"):
+    di = (_parse_month_day(values[0]), _parse_month_day(values[1]))
+    # 1899-12-29 is used for not set
+    if di == ((12, 29), (12, 29)):
         return None
     return di
 
@@ -212,57 +331,54 @@ def parse_day_interval(values):
     day_map = { "måndag": "Mo", "tisdag": "Tu", "onsdag": "We", "torsdag": "Th", "fredag": "Fr", "lördag": "Sa", "söndag": "Su", \
                 "1": "Mo", "2": "Tu", "3": "We", "4": "Th", "5": "Fr", "6": "Sa", "7": "Su" }
     if values[1] is None:
-        return day_map[str(values[0])]
-    return day_map[str(values[0])] + "-" + day_map[str(values[1])]
+        return (day_map[str(values[0])], None)
+    return (day_map[str(values[0])], day_map[str(values[1])])
 
 def parse_day_type(values):
     return values[0] # fix at merge
 
+def _parse_month_day(date_str):
+    if isinstance(date_str, pd.Timestamp):
+        return date_str.month, date_str.day
+    # old string format, may be 1899-10-11 or 1899/10/11 00:00:00
+    split_date_str = re.split(r"[-/ ]", date_str)
+    return int(split_date_str[1]), int(split_date_str[2])
+
 # parse_range_date()
 #
 # Translate NVDB range date to OSM syntax (example: "1899-10-11" => "Oct 10")
 #
 def parse_range_date(date_str):
-    if isinstance(date_str, pd.Timestamp):
-        mon = date_str.month
-        day = str(date_str.day)
-    else:
-        # old string format, may be 1899-10-11 or 1899/10/11 00:00:00
-        split_date_str = re.split(r"[-/ ]", date_str)
-        mon = int(split_date_str[1])
-        day = str(int(split_date_str[2]))
-    mon_str = [ "", "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec" ][mon]
-    return mon_str + " " + day
-
-def simplify_time_interval_once(ti_str):
+    mon, day = _parse_month_day(date_str)
+    return MONTHS[mon - 1] + " " + str(day)
+
+# _same_times()
+#
+# Check if the first rules have the given selectors and the same single hour range
+#
+def _same_times(rules, selectors):
+    if len(rules) < len(selectors) or re.fullmatch(r"\d{2}:\d{2}-\d{2}:\d{2}", rules[0].times) is None:
+        return False
+    for rule, selector in zip(rules, selectors):
+        if rule.selector != selector or rule.times != rules[0].times:
+            return False
+    return True
+
+def simplify_time_interval_once(ti):
     # FIXME: support more cases
 
-    pattern = r'Mo-Sa (\d{2}):(\d{2})-(\d{2}):(\d{2}); Su (\d{2}):(\d{2})-(\d{2}):(\d{2}); PH (\d{2}):(\d{2})-(\d{2}):(\d{2})'
-    match = re.match(pattern, ti_str)
-    if match:
-        val = match.groups()
-        for i in range(0, 4):
-            if val[i+0] != val[i+4] or val[i+0] != val[i+8]:
-                return ti_str
-        return "%02d:%02d-%02d:%02d" % val[:4]
+    # Mo-Sa 22:00-06:00; Su 22:00-06:00; PH 22:00-06:00 => 22:00-06:00
+    if _same_times(ti.rules, [ "Mo-Sa", "Su", "PH" ]):
+        return TimeInterval([ TimeIntervalRule(None, ti.rules[0].times) ] + ti.rules[3:])
 
     # Mo-Fr 22:00-06:00; Sa 22:00-06:00 => Mo-Sa 22:00-06:00
-    pattern = r'Mo-Fr (\d{2}):(\d{2})-(\d{2}):(\d{2}); Sa (\d{2}):(\d{2})-(\d{2}):(\d{2})\s*\w*'
-    match = re.match(pattern, ti_str)
-    if match:
-        val = match.groups()
-        for i in range(0, 4):
-            if val[i+0] != val[i+4]:
-                return ti_str
-        return "Mo-Sa %02d:%02d-%02d:%02d%s" % (val[0], val[1], val[2], val[3], ti_str[33:])
-    return ti_str
-
-def simplify_time_interval(ti_str):
-    out = simplify_time_interval_once(ti_str)
-    while out != ti_str:
-        ti_str = out
-        out = simplify_time_interval_once(ti_str)
-    return out
+    if _same_times(ti.rules, [ "Mo-Fr", "Sa" ]):
+        return TimeInterval([ TimeIntervalRule("Mo-Sa", ti.rules[0].times) ] + ti.rules[2:])
+    return ti
 
-#print(simplify_time_interval('Mo-Sa 22:00-06:00; Su 22:00-06:00; PH 22:00-06:00'))
-#print(simplify_time_interval('Mo-Fr 22:00-06:00; Sa 22:00-06:00; PH 22:00-06:00'))
+def simplify_time_interval(ti):
+    out = simplify_time_interval_once(ti)
+    while out is not ti:
+        ti = out
+        out = simplify_time_interval_once(ti)
+    return out
@@ -0,0 +1,86 @@
+import logging
+from array import array
+from geometry_basics import *
+from proj_xy import sweref99_transformer, latlon_str
+from shapely_utils import way_is_self_crossing, split_self_crossing_way
+
+_log = logging.getLogger("waydb")
+
+# OsmOutput
+#
+# Nodes and ways to write with ids assigned, shared by the output writers
+#
+class OsmOutput:
+    def __init__(self):
+        self.tagged_nodes = []    # NvdbSegment for each tagged node
+        self.untagged_nodes = []  # Point for each anonymous node, in id order
+        self.ways = []            # (NvdbSegment, list of points, way id) for each way
+
+# prepare_osm_output()
+#
+# Assign node and way ids (negative in output), and split self-crossing ways as the OSM
+# format doesn't support them. Node ids are stored in Point.node_id and way ids in
+# NvdbSegment.way_id.
+#
+def prepare_osm_output(way_list, point_list):
+    self_crossing = set()
+    self_crossing_rlids = set()
+    for seg in way_list:
+        if way_is_self_crossing(seg.way):
+            self_crossing.add(seg)
+            self_crossing_rlids.add(seg.rlid)
+    if len(self_crossing) > 0:
+        # since we join to as long ways as possible, it's normal to get self-crossing ways
+        _log.debug("data contains self-crossing ways, these will be split to support OSM XML format")
+        _log.debug(f"These are the RLIDs for the self-crossing ways: {self_crossing_rlids}")
+
+    output = OsmOutput()
+    unique_id = 1
+    points = {}
+
+    # all nodes with tags (points)
+    for seg in point_list:
+        p = seg.way
+        if p in points:
+            raise RuntimeError(f"Duplicate node in tagged node database {seg.rlid} {latlon_str(seg.way)}")
+        p.node_id = unique_id
+        unique_id += 1
+        points[p] = p.node_id
+        output.tagged_nodes.append(seg)
+
+    # all anonymous nodes (points)
+    for seg in way_list:
+        for p in seg.way:
+            if p not in points:
+                p.node_id = unique_id
+                unique_id += 1
+                points[p] = p.node_id
+                output.untagged_nodes.append(p)
+            else:
+                p.node_id = points[p]
+
+    # all ways
+    for seg in way_list:
+        ways = [seg.way]
+        if seg in self_crossing:
+            ways = split_self_crossing_way(seg.way)
+        for way in ways:
+            seg.way_id = unique_id
+            unique_id += 1
+            output.ways.append((seg, way, seg.way_id))
+    return output
+
+# transform_to_latlon()
+#
+# Transform points from SWEREF99 to WGS84 latitude/longitude, in batches as pyproj is much
+# faster per point when given arrays
+#
+def transform_to_latlon(points, batch_size=65536):
+    lats = []
+    lons = []
+    for start in range(0, len(points), batch_size):
+        batch = points[start:start+batch_size]
+        lat, lon = sweref99_transformer.transform(array('d', [ p.y for p in batch ]), array('d', [ p.x for p in batch ]))
+        lats += lat
+        lons += lon
+    return lats, lons
@@ -0,0 +1,191 @@
+import struct
+import zlib
+
+from osmoutput import prepare_osm_output, transform_to_latlon
+
+# Max number of nodes or ways in each data block (recommended by the format specification)
+PBF_BLOCK_SIZE = 8000
+
+# Coordinate resolution in nanodegrees (100 is the format default, that is 7 decimals)
+PBF_GRANULARITY = 100
+
+#
+# Minimal protocol buffers encoding, only what is needed for writing OSM PBF files
+#
+
+def _varint(out, v):
+    if v < 0:
+        v &= 0xFFFFFFFFFFFFFFFF # int64 negative values are encoded as 10 byte two's complement
+    while v > 0x7F:
+        out.append((v & 0x7F) | 0x80)
+        v >>= 7
+    out.append(v)
+
+def _zigzag(v):
+    return (v << 1) ^ (v >> 63)
+
+def _field_varint(out, field, v):
+    _varint(out, field << 3)
+    _varint(out, v)
+
+def _field_bytes(out, field, data):
+    _varint(out, (field << 3) | 2)
+    _varint(out, len(data))
+    out += data
+
+def _field_packed(out, field, values):
+    data = bytearray()
+    for v in values:
+        _varint(data, v)
+    _field_bytes(out, field, data)
+
+def _field_packed_sint_delta(out, field, values):
+    data = bytearray()
+    prev = 0
+    for v in values:
+        _varint(data, _zigzag(v - prev))
+        prev = v
+    _field_bytes(out, field, data)
+
+# _StringTable
+#
+# String table of a primitive block, index 0 is reserved (used as delimiter in dense nodes)
+#
+class _StringTable:
+    def __init__(self):
+        self._strings = [ b"" ]
+        self._index = { b"": 0 }
+
+    def index(self, s):
+        s = s.encode("utf-8")
+        idx = self._index.get(s, None)
+        if idx is None:
+            idx = len(self._strings)
+            self._strings.append(s)
+            self._index[s] = idx
+        return idx
+
+    def encode(self):
+        out = bytearray()
+        for s in self._strings:
+            _field_bytes(out, 1, s)
+        return out
+
+def _write_blob(stream, blob_type, data):
+    blob = bytearray()
+    _field_varint(blob, 2, len(data))            # raw_size
+    _field_bytes(blob, 3, zlib.compress(data))   # zlib_data
+    header = bytearray()
+    _field_bytes(header, 1, blob_type.encode())  # type
+    _field_varint(header, 3, len(blob))          # datasize
+    stream.write(struct.pack("!I", len(header)))
+    stream.write(header)
+    stream.write(blob)
+
+def _write_header_block(stream):
+    block = bytearray()
+    _field_bytes(block, 4, b"OsmSchema-V0.6")    # required_features
+    _field_bytes(block, 4, b"DenseNodes")
+    _field_bytes(block, 16, b"nvdb2osm.py")      # writingprogram
+    _write_blob(stream, "OSMHeader", block)
+
+def _write_primitive_block(stream, string_table, group):
+    block = bytearray()
+    _field_bytes(block, 1, string_table.encode())
+    _field_bytes(block, 2, group)
+    _field_varint(block, 17, PBF_GRANULARITY)
+    _write_blob(stream, "OSMData", block)
+
+def _tag_to_str(tag):
+    if isinstance(tag, list):
+        return ";".join([ str(t) for t in tag ])
+    return str(tag)
+
+def _tag_items(seg, write_rlid):
+    if write_rlid:
+        yield "RLID", str(seg.rlid)
+    for k, v in seg.tags.items():
+        yield k, _tag_to_str(v)
+
+def _write_dense_nodes(stream, nodes, write_rlid):
+    # nodes is a list of (node_id, lat, lon, segment with tags or None)
+    string_table = _StringTable()
+    ids = []
+    lats = []
+    lons = []
+    keys_vals = []
+    has_tags = False
+    for node_id, lat, lon, seg in nodes:
+        ids.append(-node_id)
+        lats.append(round(lat * 1e9 / PBF_GRANULARITY))
+        lons.append(round(lon * 1e9 / PBF_GRANULARITY))
+        if seg is not None:
+            has_tags = True
+            for k, v in _tag_items(seg, write_rlid):
+                keys_vals.append(string_table.index(k))
+                keys_vals.append(string_table.index(v))
+        keys_vals.append(0)
+
+    # DenseInfo with version 1 for all nodes, same as in the XML output
+    info = bytearray()
+    _field_packed(info, 1, [ 1 ] * len(nodes))           # version
+    _field_packed_sint_delta(info, 2, [ 0 ] * len(nodes)) # timestamp
+    _field_packed_sint_delta(info, 3, [ 0 ] * len(nodes)) # changeset
+    _field_packed_sint_delta(info, 4, [ 0 ] * len(nodes)) # uid
+    _field_packed_sint_delta(info, 5, [ 0 ] * len(nodes)) # user_sid
+
+    dense = bytearray()
+    _field_packed_sint_delta(dense, 1, ids)
+    _field_bytes(dense, 5, info)
+    _field_packed_sint_delta(dense, 8, lats)
+    _field_packed_sint_delta(dense, 9, lons)
+    if has_tags:
+        _field_packed(dense, 10, keys_vals)
+
+    group = bytearray()
+    _field_bytes(group, 2, dense)
+    _write_primitive_block(stream, string_table, group)
+
+def _write_ways(stream, ways, write_rlid):
+    string_table = _StringTable()
+    group = bytearray()
+    for seg, way, way_id in ways:
+        keys = []
+        vals = []
+        for k, v in _tag_items(seg, write_rlid):
+            keys.append(string_table.index(k))
+            vals.append(string_table.index(v))
+        info = bytearray()
+        _field_varint(info, 1, 1) # version
+        msg = bytearray()
+        _field_varint(msg, 1, -way_id)
+        _field_packed(msg, 2, keys)
+        _field_packed(msg, 3, vals)
+        _field_bytes(msg, 4, info)
+        _field_packed_sint_delta(msg, 8, [ -p.node_id for p in way ])
+        _field_bytes(group, 3, msg)
+    _write_primitive_block(stream, string_table, group)
+
+# write_osmpbf()
+#
+# Write nodes and ways to an OSM PBF file. The content is the same as written by
+# write_osmxml(), with the same negative ids.
+#
+def write_osmpbf(way_list, point_list, filename, write_rlid=True):
+
+    output = prepare_osm_output(way_list, point_list)
+
+    nodes = []
+    lats, lons = transform_to_latlon([ seg.way for seg in output.tagged_nodes ])
+    for seg, lat, lon in zip(output.tagged_nodes, lats, lons):
+        nodes.append((seg.way.node_id, lat, lon, seg))
+    lats, lons = transform_to_latlon(output.untagged_nodes)
+    for p, lat, lon in zip(output.untagged_nodes, lats, lons):
+        nodes.append((p.node_id, lat, lon, None))
+
+    with open(filename, 'wb') as stream:
+        _write_header_block(stream)
+        for start in range(0, len(nodes), PBF_BLOCK_SIZE):
+            _write_dense_nodes(stream, nodes[start:start+PBF_BLOCK_SIZE], write_rlid)
+        for start in range(0, len(output.ways), PBF_BLOCK_SIZE):
+            _write_ways(stream, output.ways[start:start+PBF_BLOCK_SIZE], write_rlid)
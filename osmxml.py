@@ -1,8 +1,9 @@
 import html
 import logging
 from geometry_basics import *
-from proj_xy import sweref99_transformer, latlon_str
-from shapely_utils import way_is_self_crossing, split_self_crossing_way, shortest_way_inside_or_crossing, way_is_inside_or_crossing
+from osmoutput import prepare_osm_output, transform_to_latlon
+from osmpbf import write_osmpbf
+from shapely_utils import shortest_way_inside_or_crossing, way_is_inside_or_crossing
 
 _log = logging.getLogger("waydb")
 
@@ -29,7 +30,7 @@ def waydb2osmxml(way_db, filename, boundary_polygons=None, write_rlid=True):
                         break
         else:
             points += segs
-    write_osmxml(ways, points, filename, write_rlid)
+    write_osm_file(ways, points, filename, write_rlid)
 
 
 def write_osmxml(way_list, point_list, filename, write_rlid=True):
@@ -43,68 +44,54 @@ def write_osmxml(way_list, point_list, filename, write_rlid=True):
             return html.escape(v)
         return html.escape(str(tag))
 
-    self_crossing = set()
-    self_crossing_rlids = set()
-    for seg in way_list:
-        if way_is_self_crossing(seg.way):
-            self_crossing.add(seg)
-            self_crossing_rlids.add(seg.rlid)
-    if len(self_crossing) > 0:
-        # since we join to as long ways as possible, it's normal to get self-crossing ways
-        _log.debug("data contains self-crossing ways, these will be split to support OSM XML format")
-        _log.debug(f"These are the RLIDs for the self-crossing ways: {self_crossing_rlids}")
+    def tags_to_str(seg):
+        fragments = []
+        if write_rlid:
+            fragments.append(f"  <tag k='RLID' v='{seg.rlid}' />\n")
+        for k, v in seg.tags.items():
+            fragments.append(f"  <tag k='{k}' v='{tag_to_str(v)}' />\n")
+        return "".join(fragments)
 
-    unique_id = 1
-    points = {}
+    output = prepare_osm_output(way_list, point_list)
 
-    with open(filename, 'w', encoding="utf-8") as stream:
+    with open(filename, 'w', encoding="utf-8", buffering=1024*1024) as stream:
         # header
         stream.write("<?xml version='1.0' encoding='UTF-8'?>")
         stream.write("<osm version='0.6' upload='never' generator='nvdb2osm.py'>")
 
         # all nodes with tags (points)
-        for seg in point_list:
-            p = seg.way
-            if p in points:
-                raise RuntimeError(f"Duplicate node in tagged node database {seg.rlid} {latlon_str(seg.way)}")
-            p.node_id = unique_id
-            unique_id += 1
-            points[p] = p.node_id
-            lat, lon = sweref99_transformer.transform(p.y, p.x)
-            stream.write(f"<node id='-{p.node_id}' version='1' lat='{lat}' lon='{lon}'>\n")
-            if write_rlid:
-                stream.write(f"  <tag k='RLID' v='{seg.rlid}' />\n")
-            for k, v in seg.tags.items():
-                stream.write(f"  <tag k='{k}' v='{tag_to_str(v)}' />\n")
-            stream.write("</node>")
+        lats, lons = transform_to_latlon([ seg.way for seg in output.tagged_nodes ])
+        for seg, lat, lon in zip(output.tagged_nodes, lats, lons):
+            stream.write(f"<node id='-{seg.way.node_id}' version='1' lat='{lat}' lon='{lon}'>\n{tags_to_str(seg)}</node>")
 
         # all anonymous nodes (points)
-        for seg in way_list:
-            for p in seg.way:
-                if p not in points:
-                    p.node_id = unique_id
-                    unique_id += 1
-                    points[p] = p.node_id
-                    lat, lon = sweref99_transformer.transform(p.y, p.x)
-                    stream.write(f"<node id='-{p.node_id}' version='1' lat='{lat}' lon='{lon}' />\n")
-                else:
-                    p.node_id = points[p]
+        lats, lons = transform_to_latlon(output.untagged_nodes)
+        fragments = []
+        for p, lat, lon in zip(output.untagged_nodes, lats, lons):
+            fragments.append(f"<node id='-{p.node_id}' version='1' lat='{lat}' lon='{lon}' />\n")
+            if len(fragments) >= 4096:
+                stream.write("".join(fragments))
+                fragments = []
+        stream.write("".join(fragments))
 
         # all ways
-        for seg in way_list:
-            ways = [seg.way]
-            if seg in self_crossing:
-                ways = split_self_crossing_way(seg.way)
-            for way in ways:
-                seg.way_id = unique_id
-                unique_id += 1
-                stream.write(f"<way id='-{seg.way_id}' version='1'>\n")
-                for p in way:
-                    stream.write(f"  <nd ref='-{p.node_id}' />\n")
-                if write_rlid:
-                    stream.write(f"  <tag k='RLID' v='{seg.rlid}' />\n")
-                for k, v in seg.tags.items():
-                    stream.write(f"  <tag k='{k}' v='{tag_to_str(v)}' />\n")
-                stream.write("</way>\n")
+        fragments = []
+        for seg, way, way_id in output.ways:
+            nds = "".join([ f"  <nd ref='-{p.node_id}' />\n" for p in way ])
+            fragments.append(f"<way id='-{way_id}' version='1'>\n{nds}{tags_to_str(seg)}</way>\n")
+            if len(fragments) >= 1024:
+                stream.write("".join(fragments))
+                fragments = []
+        stream.write("".join(fragments))
 
         stream.write("</osm>\n")
+
+# write_osm_file()
+#
+# Write OSM file, PBF format if the file name ends with .pbf, otherwise XML
+#
+def write_osm_file(way_list, point_list, filename, write_rlid=True):
+    if str(filename).endswith(".pbf"):
+        write_osmpbf(way_list, point_list, filename, write_rlid)
+    else:
+        write_osmxml(way_list, point_list, filename, write_rlid)
@@ -0,0 +1,133 @@
+import cProfile
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource # not available on Windows
+except ImportError:
+    resource = None
+
+_log = logging.getLogger("pipeline_stats")
+
+# Stage statistics, only collected when enabled with enable_stats()
+_enabled = False
+_profile_stage = None
+_profile_filename = None
+_records = []
+_open_records = []
+_start_time = None
+
+# enable_stats()
+#
+# Start collecting statistics for stages. If profile_stage is given, that stage is run with
+# cProfile and the profile is saved to profile_filename (readable with the pstats module).
+#
+def enable_stats(profile_stage=None, profile_filename=None):
+    global _enabled, _profile_stage, _profile_filename, _start_time # pylint: disable=global-statement
+    _enabled = True
+    _profile_stage = profile_stage
+    _profile_filename = profile_filename
+    _start_time = time.perf_counter()
+
+def stats_enabled():
+    return _enabled
+
+# _peak_rss_mb()
+#
+# Peak RSS in MB of this process, or of its largest finished child process if children is
+# True. Returns None where not available (Windows).
+#
+def _peak_rss_mb(children=False):
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    maxrss = resource.getrusage(who).ru_maxrss
+    if sys.platform == "darwin":
+        # bytes on macOS, kilobytes on Linux and other systems
+        return maxrss / (1024.0 * 1024.0)
+    return maxrss / 1024.0
+
+# stage()
+#
+# Context manager recording wall time, CPU time and memory of a named stage. Stages can be
+# nested. If a way database is given its object counts are recorded when the stage ends.
+#
+# Only the peak RSS of the whole process is available, so for memory the process peak so far
+# is recorded when the stage ends, and how much the stage raised it. A stage that uses less
+# memory than an earlier stage shows no growth. Stages run in worker processes are not recorded.
+#
+@contextmanager
+def stage(name, way_db=None):
+    if not _enabled:
+        yield
+        return
+    record = {
+        "name": name,
+        "depth": len(_open_records),
+        "start": time.perf_counter() - _start_time
+    }
+    _open_records.append(record)
+    _records.append(record)
+    profiler = None
+    if name == _profile_stage:
+        profiler = cProfile.Profile()
+    wall_time = time.perf_counter()
+    cpu_time = time.process_time()
+    peak_rss = _peak_rss_mb()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record["wall_time"] = time.perf_counter() - wall_time
+        record["cpu_time"] = time.process_time() - cpu_time
+        record["process_peak_rss_mb"] = _peak_rss_mb()
+        record["peak_rss_growth_mb"] = None if peak_rss is None else record["process_peak_rss_mb"] - peak_rss
+        if way_db is not None:
+            add_stage_counts(way_db.get_stats())
+        _open_records.pop()
+        memory = ""
+        if peak_rss is not None:
+            memory = f", process peak RSS so far {record['process_peak_rss_mb']:.0f} MB (+{record['peak_rss_growth_mb']:.0f} MB)"
+        _log.info(f"Stage {name}: {record['wall_time']:.2f}s wall, {record['cpu_time']:.2f}s CPU{memory}")
+        if profiler is not None:
+            profiler.dump_stats(_profile_filename)
+            _log.info(f"Wrote profile of stage {name} to {_profile_filename}")
+
+# add_stage_counts()
+#
+# Add object counts (name => number) to the innermost running stage
+#
+def add_stage_counts(counts):
+    if not _enabled or len(_open_records) == 0:
+        return
+    record = _open_records[-1]
+    if "counts" not in record:
+        record["counts"] = {}
+    record["counts"].update(counts)
+
+# write_stats_report()
+#
+# Write collected statistics as JSON
+#
+def write_stats_report(filename, extra_info=None):
+    report = {
+        "total_wall_time": time.perf_counter() - _start_time,
+        "total_cpu_time": time.process_time(),
+        "peak_rss_mb": _peak_rss_mb(),
+        "children_peak_rss_mb": _peak_rss_mb(children=True),
+        "note": "process_peak_rss_mb of a stage is the peak of the main process up to the end of the stage, "
+                "peak_rss_growth_mb how much the stage raised it. Stages run in worker processes (--jobs) "
+                "are not recorded, children_peak_rss_mb is the largest peak of a finished worker.",
+        "stages": _records
+    }
+    if extra_info is not None:
+        report.update(extra_info)
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    _log.info(f"Wrote statistics report to {filename}")
@@ -1,9 +1,10 @@
 import logging
 from functools import cmp_to_key
+import numpy
 
 from geometry_basics import *
 from geometry_search import GeometrySearch, snap_to_closest_way
-from twodimsearch import TwoDimSearch
+from twodimsearch import new_two_dim_search
 from merge_tags import merge_tags, append_fixme_value
 from nvdb_segment import *
 from proj_xy import latlon_str
@@ -49,9 +50,78 @@ NVDB_USED_KEYS = [
 def merge_translated_tags(way, tags):
     for k, v in tags.items():
         if k == "fixme":
-            append_fixme_value(way.tags, v)
+            append_fixme_value(way.mutable_tags(), v)
         else:
-            way.tags[k] = v
+            way.mutable_tags()[k] = v
+
+# _segment_dedup_key()
+#
+# Hashable key of a segment for finding duplicates, equal for segments with the same RLID,
+# tags (which include the measure range) and geometry. List tag values are kept apart from
+# tuples, as they would be in a dictionary comparison.
+#
+def _segment_dedup_key(way):
+    tags = tuple(sorted((k, (list, tuple(v)) if isinstance(v, list) else v) for k, v in way.tags.items()))
+    if isinstance(way.way, list):
+        coords = tuple(c for p in way.way for c in (p.x, p.y))
+    else:
+        coords = (way.way.x, way.way.y)
+    return way.rlid, isinstance(way.way, list), tags, coords
+
+# _log_overlapping_segments()
+#
+# Log segments that have a point pair (in the same direction) that an earlier segment also has,
+# the first such pair of each segment is logged. Point pairs occurring only once are filtered
+# out with numpy first, so only the few candidates are checked one by one.
+#
+def _log_overlapping_segments(ways):
+    point_count = sum(len(way.way) for way in ways)
+    if point_count == 0:
+        return False
+    xy = numpy.empty((point_count, 2))
+    point_way = numpy.empty(point_count, dtype=numpy.int64)
+    way_offsets = []
+    idx = 0
+    for way_idx, way in enumerate(ways):
+        way_offsets.append(idx)
+        n = len(way.way)
+        xy[idx:idx+n] = [ (p.x, p.y) for p in way.way ]
+        point_way[idx:idx+n] = way_idx
+        idx += n
+
+    # pair i is (point i+1, point i) when both are in the same segment
+    is_pair = point_way[1:] == point_way[:-1]
+    pair_idx = numpy.flatnonzero(is_pair)
+    keys = numpy.hstack((xy[pair_idx + 1], xy[pair_idx]))
+    order = numpy.lexsort(keys.T[::-1])
+    sorted_keys = keys[order]
+    same_as_next = numpy.all(sorted_keys[1:] == sorted_keys[:-1], axis=1)
+    is_repeated = numpy.zeros(len(order), dtype=bool)
+    is_repeated[:-1] |= same_as_next
+    is_repeated[1:] |= same_as_next
+    repeated = numpy.zeros(len(order), dtype=bool)
+    repeated[order] = is_repeated
+
+    overlap = False
+    pointpairs = {}
+    logged_ways = set()
+    for i in pair_idx[repeated].tolist():
+        way_idx = int(point_way[i])
+        if way_idx in logged_ways:
+            continue
+        way = ways[way_idx]
+        local_idx = i - way_offsets[way_idx]
+        pp = (way.way[local_idx + 1], way.way[local_idx])
+        if pp not in pointpairs:
+            pointpairs[pp] = way
+        else:
+            way2 = pointpairs[pp]
+            _log.info(f"Self-overlapping segment between {latlon_str(pp[0])}-{latlon_str(pp[1])}:")
+            _log.info(f"  Segment 1: {way} tags={way.tags} ({len(way.way)} points, index {way.way_id})")
+            _log.info(f"  Segment 2: {way2} tags={way2.tags} ({len(way2.way)} points, index {way2.way_id})")
+            overlap = True
+            logged_ways.add(way_idx)
+    return overlap
 
 # find_overlapping_and_remove_duplicates()
 #
@@ -59,61 +129,23 @@ def merge_translated_tags(way, tags):
 #
 def find_overlapping_and_remove_duplicates(data_src_name, ways):
 
-    class NvdbSegmentDup:
-        def __init__(self, nvdb_seg):
-            self.way = nvdb_seg.way
-            self.tags = nvdb_seg.tags
-            self.rlid = nvdb_seg.rlid
-        def __eq__(self, other):
-            if not isinstance(other, NvdbSegmentDup):
-                return False
-            return self.way == other.way and self.rlid == other.rlid and self.tags == other.tags
-        def __hash__(self):
-            return hash(self.rlid)
-
-    pointpairs = {}
-    waysd = {}
+    seen = set()
     new_ways = []
-    overlap = False
-
     for way in ways:
-        wd = NvdbSegmentDup(way)
-        if wd not in waysd:
-            waysd[wd] = way
-        else:
-            #way2 = waysd[wd]
-
+        key = _segment_dedup_key(way)
+        if key in seen:
             # duplicates are so normal and common, so we don't care to log them any longer
-            #if isinstance(way.way, list):
-            #    print("Duplicate ways:")
-            #    print("  Way 1: %s tags=%s (%s points, index %s)" % (way, way.tags, len(way.way), way.way_id))
-            #    print("  Way 2: %s tags=%s (%s points, index %s)" % (way2, way2.tags, len(way2.way), way2.way_id))
-            #else:
-            #    print("Duplicate nodes:")
-            #    print("  Node 1: %s tags=%s (%s, index %s)" % (way, way.tags, way.way, way.way_id))
-            #    print("  Node 2: %s tags=%s (%s, index %s)" % (way2, way2.tags, way2.way, way2.way_id))
             continue
-
-        # overlapping segments are quite normal, but may be interesting to print, except for some
-        # data layers when there's always lots of overlaps (it must be for some layers, for directional speed limits
-        # for example)
-        if isinstance(way.way, list) and data_src_name not in ("NVDB-Hastighetsgrans", "NVDB-Vagnummer"):
-            it = iter(way.way)
-            prev = next(it)
-            for p in it:
-                pp = (p, prev)
-                prev = p
-                if pp not in pointpairs:
-                    pointpairs[pp] = way
-                else:
-                    way2 = pointpairs[pp]
-                    _log.info(f"Self-overlapping segment between {latlon_str(pp[0])}-{latlon_str(pp[1])}:")
-                    _log.info(f"  Segment 1: {way} tags={way.tags} ({len(way.way)} points, index {way.way_id})")
-                    _log.info(f"  Segment 2: {way2} tags={way2.tags} ({len(way2.way)} points, index {way2.way_id})")
-                    overlap = True
-                    break
+        seen.add(key)
         new_ways.append(way)
 
+    # overlapping segments are quite normal, but may be interesting to print, except for some
+    # data layers when there's always lots of overlaps (it must be for some layers, for directional speed limits
+    # for example)
+    overlap = False
+    if data_src_name not in ("NVDB-Hastighetsgrans", "NVDB-Vagnummer"):
+        overlap = _log_overlapping_segments([ way for way in new_ways if isinstance(way.way, list) ])
+
     if len(new_ways) < len(ways):
         _log.info(f"{data_src_name} has duplicate elements. Only one copy of each was kept")
 
@@ -302,8 +334,8 @@ def preprocess_bridges_and_tunnels(ways, way_db):
                 delete_bridges.add(bridge)
 
     for way in convert_to_tunnels:
-        way.tags["tunnel"] = "yes"
-        way.tags["layer"] = -1
+        way.mutable_tags()["tunnel"] = "yes"
+        way.mutable_tags()["layer"] = -1
 
     nbridges = []
     bridges_lcs = GeometrySearch(GEO_FILL_LENGTH)
@@ -370,7 +402,7 @@ def preprocess_bridges_and_tunnels(ways, way_db):
 #
 def process_street_crossings(points, way_db, data_src_name):
     def get_roundabout_ways(point_on_roundabout, way_db):
-        ways = way_db.gs.find_all_connecting_ways(point_on_roundabout)
+        ways = way_db.topology.find_all_connecting_ways(point_on_roundabout)
         rbw = set()
         for w in ways:
             if w.tags.get("junction", "") == "roundabout":
@@ -379,8 +411,8 @@ def process_street_crossings(points, way_db, data_src_name):
         while True:
             nrbw = set()
             for w in rbw:
-                ways = way_db.gs.find_all_connecting_ways(w.way[0]).copy()
-                ways.update(way_db.gs.find_all_connecting_ways(w.way[-1]))
+                ways = way_db.topology.find_all_connecting_ways(w.way[0])
+                ways.update(way_db.topology.find_all_connecting_ways(w.way[-1]))
                 for w1 in ways:
                     if w1.tags.get("junction", "") == "roundabout":
                         nrbw.add(w1)
@@ -426,13 +458,13 @@ def process_street_crossings(points, way_db, data_src_name):
             for w in rbw:
                 if "name" in w.tags:
                     merge_name = w.tags["name"]
-                    w.tags["name"] = node.tags["name"]
+                    w.mutable_tags()["name"] = node.tags["name"]
                 else:
                     merge_name = node.tags["name"]
                 merge_tags(w, {"name": merge_name}, data_src_name)
                 named_rbw.add(w)
         if "highway" in node.tags:
-            del node.tags["name"]
+            del node.mutable_tags()["name"]
             crossings.append(node)
     if fixme_count > 0:
         _log.warning(f"did not find any way crossing for {fixme_count} street crossings, fixme tags added")
@@ -445,9 +477,9 @@ def process_street_crossings(points, way_db, data_src_name):
         remove_count = 0
         for way in way_db:
             if way.tags.get("junction", None) == "roundabout":
-                way.tags.pop("alt_name", None)
+                way.mutable_tags().pop("alt_name", None)
                 if way not in named_rbw:
-                    if way.tags.pop("name", None) is not None:
+                    if way.mutable_tags().pop("name", None) is not None:
                         remove_count += 1
         _log.info(f"Removed {remove_count} roundabout street names")
 
@@ -480,7 +512,7 @@ def preprocess_railway_crossings(points, way_db, railways):
                     cp.append((dist, crossing_point))
         cp = sorted(cp, key=lambda x: x[0])
         fixme = False
-        node.tags["railway"] = crossing_tag
+        node.mutable_tags()["railway"] = crossing_tag
         if len(cp) == 0:
             fixme = True
             rw_crossings.append(node)
@@ -575,7 +607,7 @@ def resolve_vagnummer(way):
         refs.sort(key=cmp_to_key(compare_vagnummer))
     else:
         refs = str(refs).replace("NVDB_lansbeteckning", lan)
-    way.tags["ref"] = refs
+    way.mutable_tags()["ref"] = refs
 
 # resolve_highways()
 #
@@ -684,7 +716,7 @@ def resolve_highways(way_db, small_road_resolve_algorithm):
                 # JOSM doesn't like pedestrian roads narrower than 3 meters
                 tags["highway"] = "cycleway"
                 tags["foot"] = "yes"
-                way.tags.pop("maxspeed", None) # cycleways shouldn't have maxspeed
+                way.mutable_tags().pop("maxspeed", None) # cycleways shouldn't have maxspeed
         elif "NVDB_gangfartsomrode" in way.tags:
             # We ignore NVDB_gangfartsomrode_side, from investigations it seems that even if
             # on only one side the speed limit is set to 5 km/h.
@@ -867,7 +899,7 @@ def resolve_highways(way_db, small_road_resolve_algorithm):
             processed_set.add(way)
             # in rare occasions way is a loop, the set() trick makes sure we don't run the same endpoint twice
             for ep in set([ way.way[0], way.way[-1] ]):
-                ways = way_db.gs.find_all_connecting_ways(ep)
+                ways = way_db.topology.find_all_connecting_ways(ep)
                 ways.remove(way)
                 for w in ways:
                     if w in gcm_resolve_crossings and w not in processed_set:
@@ -883,7 +915,7 @@ def resolve_highways(way_db, small_road_resolve_algorithm):
             fw_count = 0
             for way in crossing:
                 for ep in set([ way.way[0], way.way[-1] ]):
-                    ways = way_db.gs.find_all_connecting_ways(ep)
+                    ways = way_db.topology.find_all_connecting_ways(ep)
                     connected_to_footway = False
                     for w in ways:
                         if w.tags.get("highway", None) == "cycleway":
@@ -897,12 +929,12 @@ def resolve_highways(way_db, small_road_resolve_algorithm):
             _log.debug(f"Crossing {crossing[0].rlid} has {cw_count} cw and {fw_count} fw")
             for way in crossing:
                 if (cw_count == 1 and fw_count == 0) or cw_count > 1:
-                    way.tags["highway"] = "cycleway"
-                    way.tags["cycleway"] = "crossing"
-                    way.tags["foot"] = "yes"
+                    way.mutable_tags()["highway"] = "cycleway"
+                    way.mutable_tags()["cycleway"] = "crossing"
+                    way.mutable_tags()["foot"] = "yes"
                 else:
-                    way.tags["highway"] = "footway"
-                    way.tags["footway"] = "crossing"
+                    way.mutable_tags()["highway"] = "footway"
+                    way.mutable_tags()["footway"] = "crossing"
 
     if fixme_count > 0:
         _log.warning(f"could not resolve tags for {fixme_count} highway segments, added fixme tags")
@@ -913,25 +945,10 @@ def resolve_highways(way_db, small_road_resolve_algorithm):
 
 # get_connected_roads()
 #
-def get_connected_roads(ways, gs, criteria_fun):
-    processed = set()
-    roads = []
-    for way in ways:
-        if way in processed or not criteria_fun(way):
-            continue
-        road = set()
-        new_segs = { way }
-        while len(new_segs) > 0:
-            road.update(new_segs)
-            prev_segs = new_segs
-            new_segs = set()
-            for w0 in prev_segs:
-                for w in gs.find_all_connecting_ways([w0.way[0], w0.way[-1]]):
-                    if w not in road and criteria_fun(w):
-                        new_segs.add(w)
-        processed.update(road)
-        roads.append(road)
-    return roads
+# Get sets of segments fulfilling criteria_fun that are connected via endpoints
+#
+def get_connected_roads(ways, topology, criteria_fun):
+    return topology.connected_components(ways, criteria_fun)
 
 
 # upgrade_unclassified_stumps_connected_to_residential
@@ -939,7 +956,7 @@ def get_connected_roads(ways, gs, criteria_fun):
 def upgrade_unclassified_stumps_connected_to_residential(way_db):
 
     _log.info("Upgrading short unclassified stumps to residential (if connected to residential)...")
-    roads = get_connected_roads(way_db, way_db.gs, lambda way: way.tags.get("highway", None) == "unclassified")
+    roads = get_connected_roads(way_db, way_db.topology, lambda way: way.tags.get("highway", None) == "unclassified")
     upgrade_count = 0
     for road in roads:
         total_length = 0
@@ -950,7 +967,7 @@ def upgrade_unclassified_stumps_connected_to_residential(way_db):
             if total_length > 1000:
                 break
             if not has_connected_residential:
-                for w in way_db.gs.find_all_connecting_ways([way.way[0], way.way[-1]]):
+                for w in way_db.topology.find_all_connecting_ways([way.way[0], way.way[-1]]):
                     if w not in road and w.tags.get("highway", None) == "residential":
                         has_connected_residential = True
                         break
@@ -958,7 +975,7 @@ def upgrade_unclassified_stumps_connected_to_residential(way_db):
         if total_length <= 1000 and has_connected_residential:
             for way in road:
                 _log.debug(f"Upgraded {way.rlid} from unclassified to residential due to being short stump connected to residential.")
-                way.tags["highway"] = "residential"
+                way.mutable_tags()["highway"] = "residential"
                 upgrade_count += 1
     _log.info(f"done ({upgrade_count} segments upgraded from unclassified to residential)")
 
@@ -986,10 +1003,9 @@ def upgrade_unclassified_stumps_connected_to_residential(way_db):
 def guess_upgrade_tracks(way_db):
 
     def get_deadend_parent_ways(way):
-        ways1 = way_db.gs.find_all_connecting_ways(way.way[0])
-        ways2 = way_db.gs.find_all_connecting_ways(way.way[-1])
+        ways1 = way_db.topology.find_all_connecting_ways(way.way[0])
+        ways2 = way_db.topology.find_all_connecting_ways(way.way[-1])
         if len(ways1) == 1 and len(ways2) > 1:
-            ways2 = ways2.copy()
             return [w for w in ways2 if w != way], way.way[-1]
         if len(ways1) > 1 and len(ways2) == 1:
             ways1 = ways1.copy()
@@ -1115,12 +1131,12 @@ def guess_upgrade_tracks(way_db):
         also_leads_nowhere = set()
         for way in newest_leads_nowhere:
             test_ways = set()
-            for w0 in way_db.gs.find_all_connecting_ways([way.way[0], way.way[-1]]):
+            for w0 in way_db.topology.find_all_connecting_ways([way.way[0], way.way[-1]]):
                 if w0 not in leads_nowhere and w0 in undecided:
                     test_ways.add(w0)
             for w0 in test_ways:
                 for ep in (w0.way[0], w0.way[-1]):
-                    ways = way_db.gs.find_all_connecting_ways(ep)
+                    ways = way_db.topology.find_all_connecting_ways(ep)
                     deadend_for_sure = True
                     for w1 in ways:
                         if w1 != w0 and w1 not in leads_nowhere:
@@ -1141,7 +1157,7 @@ def guess_upgrade_tracks(way_db):
     #
     # Upgrade roads that connect larger roads to unclassified
     #
-    roads = get_connected_roads(undecided, way_db.gs, \
+    roads = get_connected_roads(undecided, way_db.topology, \
                                 lambda w : w not in leads_nowhere and w in undecided and int(w.tags.get("NVDB_funk_klass", 9)) <= 8)
     larger_road_tags = MAJOR_HIGHWAYS + MINOR_HIGHWAYS
     larger_road_tags.remove("track")
@@ -1151,13 +1167,13 @@ def guess_upgrade_tracks(way_db):
         ext_connected_eps = 0
         for w0 in road:
             for ep in (w0.way[0], w0.way[-1]):
-                for w in way_db.gs.find_all_connecting_ways(ep):
+                for w in way_db.topology.find_all_connecting_ways(ep):
                     if w not in road and w.tags.get("highway", None) in larger_road_tags:
                         ext_connected_eps += 1
                         break
         if ext_connected_eps >= 2:
             for w0 in road:
-                w0.tags["highway"] = "unclassified"
+                w0.mutable_tags()["highway"] = "unclassified"
             upgraded.update(road)
     undecided -= upgraded
     _log.info(f"  {len(upgraded)} tracks upgraded to unclassified as they form connecting links")
@@ -1179,7 +1195,7 @@ def guess_upgrade_tracks(way_db):
             prev_segs = new_segs
             new_segs = set()
             for w0 in prev_segs:
-                for w in way_db.gs.find_all_connecting_ways([w0.way[0], w0.way[-1]]):
+                for w in way_db.topology.find_all_connecting_ways([w0.way[0], w0.way[-1]]):
                     if w in road:
                         continue
                     if w in leads_nowhere and w in undecided:
@@ -1201,7 +1217,7 @@ def guess_upgrade_tracks(way_db):
                 # way segment not a dead end, not a driveway
                 continue
             length, _ = calc_way_length(w.way)
-            has_connected_midpoints = len(way_db.gs.find_all_connecting_ways(w.way[1:-1])) > 1
+            has_connected_midpoints = len(way_db.topology.find_all_connecting_ways(w.way[1:-1])) > 1
             if length > 150 or has_connected_midpoints:
                 # a bit too long or connected for being a likely driveway
                 continue
@@ -1237,7 +1253,7 @@ def guess_upgrade_tracks(way_db):
         if way not in undecided:
             continue
         connected_to_larger_road = False
-        for w in way_db.gs.find_all_connecting_ways([way.way[0], way.way[-1]]):
+        for w in way_db.topology.find_all_connecting_ways([way.way[0], way.way[-1]]):
             if w.tags.get("highway", None) in ROAD_TAGS:
                 connected_to_larger_road = True
                 break
@@ -1246,7 +1262,7 @@ def guess_upgrade_tracks(way_db):
         current_service_roads.add(way)
         current_service_roads_gs.insert(way)
         undecided.remove(way)
-        way.tags["highway"] = "service"
+        way.mutable_tags()["highway"] = "service"
         directly_connected += 1
     _log.info(f"  {directly_connected} tracks upgraded to service as likely driveways connected to larger roads")
 
@@ -1255,7 +1271,7 @@ def guess_upgrade_tracks(way_db):
     upgraded = set()
     for way in neighbor_driveway_candidates:
         if way in undecided and len(current_service_roads_gs.find_all_nearby_ways([way.way[0], way.way[-1]])) >= 2:
-            way.tags["highway"] = "service"
+            way.mutable_tags()["highway"] = "service"
             upgraded.add(way)
     _log.info(f"  {len(upgraded)} tracks upgraded to service as likely driveways near others")
     for way in upgraded:
@@ -1267,7 +1283,7 @@ def guess_upgrade_tracks(way_db):
     upgraded = set()
     for way in undecided:
         if way.tags.get("surface", "unpaved") == "asphalt":
-            way.tags["highway"] = "service"
+            way.mutable_tags()["highway"] = "service"
             upgraded.add(way)
     for way in upgraded:
         current_service_roads.add(way)
@@ -1284,7 +1300,7 @@ def guess_upgrade_tracks(way_db):
         has_service_connection = [ False, False ]
         has_road_connection = [ False, False ]
         for i, ep in enumerate([way.way[0], way.way[-1]]):
-            for w in way_db.gs.find_all_connecting_ways(ep):
+            for w in way_db.topology.find_all_connecting_ways(ep):
                 if w == way:
                     continue
                 if w in current_service_roads:
@@ -1301,12 +1317,12 @@ def guess_upgrade_tracks(way_db):
                 has_service_connection[1] = False
         has_service_connection = has_service_connection[0] or has_service_connection[1]
         if not has_service_connection:
-            for w in way_db.gs.find_all_connecting_ways(way.way[1:-1]):
+            for w in way_db.topology.find_all_connecting_ways(way.way[1:-1]):
                 if w in current_service_roads:
                     has_service_connection = True
                     break
         if has_service_connection:
-            way.tags["highway"] = "service"
+            way.mutable_tags()["highway"] = "service"
             upgraded.add(way)
     for way in upgraded:
         current_service_roads.add(way)
@@ -1357,7 +1373,7 @@ def sort_multiple_road_names(way_db):
             new_match_set = set()
             for w in match_set:
                 for ep in (w.way[0], w.way[-1]):
-                    ways = way_db.gs.find_all_connecting_ways(ep)
+                    ways = way_db.topology.find_all_connecting_ways(ep)
                     for w1 in ways:
                         if w1 in tried_set:
                             continue
@@ -1407,11 +1423,11 @@ def sort_multiple_road_names(way_db):
             sorted_names = [ orig_first_name ] + [n for n in sorted_names if n != orig_first_name]
         if names == sorted_names:
             continue
-        way.tags["name"] = sorted_names[0]
+        way.mutable_tags()["name"] = sorted_names[0]
         if len(sorted_names) > 2:
-            way.tags["alt_name"] = sorted_names[1:]
+            way.mutable_tags()["alt_name"] = sorted_names[1:]
         else:
-            way.tags["alt_name"] = sorted_names[1]
+            way.mutable_tags()["alt_name"] = sorted_names[1]
 
     _log.info("done")
 
@@ -1448,7 +1464,7 @@ def simplify_cycleway_crossings(way_db):
             new_set = set()
             for w0 in crossing_set:
                 for ep in [ w0.way[0], w0.way[-1] ]:
-                    ways = way_db.gs.find_all_connecting_ways(ep)
+                    ways = way_db.topology.find_all_connecting_ways(ep)
                     for w1 in ways:
                         if w1 not in crossing_set and ep in (w1.way[0], w1.way[-1]) and \
                            w1.tags.get("highway", None) == hw_tag and \
@@ -1463,7 +1479,7 @@ def simplify_cycleway_crossings(way_db):
         for w0 in crossing_set:
             processed_set.add(w0)
             for p in w0.way:
-                ways = way_db.gs.find_all_connecting_ways(p)
+                ways = way_db.topology.find_all_connecting_ways(p)
                 for w1 in ways:
                     if w1 not in crossing_set and "highway" in w1.tags:
                         if w1.tags["highway"] not in GCM:
@@ -1472,8 +1488,8 @@ def simplify_cycleway_crossings(way_db):
                         has_cw_crossing = True
 
         for w0 in crossing_set:
-            w0.tags.pop(way.tags["highway"], None)
-            w0.tags.pop("crossing", None)
+            w0.mutable_tags().pop(way.tags["highway"], None)
+            w0.mutable_tags().pop("crossing", None)
 
         if len(crossings) == 0:
             if not has_cw_crossing:
@@ -1546,10 +1562,10 @@ def bridge_footway_and_cycleway_separations(way_db):
             continue
         candidates1 = []
         candidates2 = []
-        for w in way_db.gs.find_all_connecting_ways(way.way[0]):
+        for w in way_db.topology.find_all_connecting_ways(way.way[0]):
             if (w.tags.get(KEYL, None) in SEPARATIONS_TO_BRIDGE or w.tags.get(KEYR, None) in SEPARATIONS_TO_BRIDGE) and has_same_tags([w, way], exclude_tags):
                 candidates1.append(w)
-        for w in way_db.gs.find_all_connecting_ways(way.way[-1]):
+        for w in way_db.topology.find_all_connecting_ways(way.way[-1]):
             if (w.tags.get(KEYL, None) in SEPARATIONS_TO_BRIDGE or w.tags.get(KEYR, None) in SEPARATIONS_TO_BRIDGE) and has_same_tags([w, way], exclude_tags):
                 candidates2.append(w)
         if len(candidates1) == 0 or len(candidates2) == 0:
@@ -1606,7 +1622,7 @@ def remove_redundant_cycleway_names(way_db):
         for w1 in name2road[name]:
             for p in w1.way:
                 if way in gs.find_all_nearby_ways(p):
-                    del way.tags["name"]
+                    del way.mutable_tags()["name"]
                     _log.debug(f"removed name {name} from {way.tags['highway']} {way.rlid}")
                     break
             if "name" not in way.tags:
@@ -1648,7 +1664,7 @@ def remove_redundant_speed_limits(way_db):
             continue
         klass = int(way.tags.get("NVDB_funk_klass", "9"))
         if klass >= 7 and way.tags.get("highway", None) in ["service", "unclassified", "track"]:
-            way.tags.pop("maxspeed", None)
+            way.mutable_tags().pop("maxspeed", None)
             remove_count += 1
     _log.info(f"done (removed {remove_count} of {total_count} speed limits)")
 
@@ -1678,17 +1694,17 @@ def simplify_speed_limits(way_db):
                     same_speeds = False
                 break
         if same_speeds:
-            way.tags.pop("maxspeed:forward", None)
-            way.tags.pop("maxspeed:backward", None)
-            way.tags["maxspeed"] = speed
+            way.mutable_tags().pop("maxspeed:forward", None)
+            way.mutable_tags().pop("maxspeed:backward", None)
+            way.mutable_tags()["maxspeed"] = speed
         elif ms_f is not None and ms_b is not None and ms is not None:
             merge_translated_tags(way, {"fixme": "too many maxspeeds"})
         elif ms is not None:
             if ms_b is not None:
-                way.tags["maxspeed:forward"] = ms
+                way.mutable_tags()["maxspeed:forward"] = ms
             else:
-                way.tags["maxspeed:backward"] = ms
-            way.tags.pop("maxspeed", None)
+                way.mutable_tags()["maxspeed:backward"] = ms
+            way.mutable_tags().pop("maxspeed", None)
 
     _log.info("done")
 
@@ -1719,7 +1735,7 @@ def cleanup_highway_widths(way_db):
         highway = way.tags["highway"]
         if (highway == "unclassified" and way_is_small_road_gatutyp(way)) or highway == "track":
             # According to tests, not reliable data, so we remove it
-            way.tags.pop("width", None)
+            way.mutable_tags().pop("width", None)
             remove_count += 1
             continue
 
@@ -1727,7 +1743,7 @@ def cleanup_highway_widths(way_db):
             # This is good data, but to some not deemed important enough to keep
             klass = int(way.tags.get("NVDB_funk_klass", "9"))
             if klass >= 7 or highway == "residential":
-                way.tags.pop("width", None)
+                way.mutable_tags().pop("width", None)
                 remove_count += 1
                 continue
 
@@ -1736,7 +1752,7 @@ def cleanup_highway_widths(way_db):
         new_width = round(width, 1)
         if new_width != width:
             _log.debug(f'rounding width {width} to {new_width}')
-            way.tags["width"] = new_width
+            way.mutable_tags()["width"] = new_width
 
     _log.info(f"done (removed {remove_count} of {total_count} highway widths)")
 
@@ -1777,12 +1793,12 @@ def round_highway_widths(way_db):
             continue
         road = [ way ]
         while True:
-            cw = get_connecting_way(road[0], way_db.gs.find_all_connecting_ways(road[0].way[0]))
+            cw = get_connecting_way(road[0], way_db.topology.find_all_connecting_ways(road[0].way[0]))
             if cw is not None:
                 road.insert(0, cw)
                 processed.add(cw)
             else:
-                cw = get_connecting_way(road[-1], way_db.gs.find_all_connecting_ways(road[-1].way[-1]))
+                cw = get_connecting_way(road[-1], way_db.topology.find_all_connecting_ways(road[-1].way[-1]))
                 if cw is not None:
                     road.append(cw)
                     processed.add(cw)
@@ -1812,7 +1828,7 @@ def round_highway_widths(way_db):
             if round(avg, 0) / min_width <= 1.15 and max_width / round(avg, 0) <= 1.15:
                 avg = int(round(avg, 0))
             for way in road:
-                way.tags["width"] = avg
+                way.mutable_tags()["width"] = avg
             _log.info(f"Road: {len(road)} segments, width range {min_width} to {max_width} changed to width {avg} for all segments")
         return large_span_roads
 
@@ -1839,20 +1855,14 @@ def round_highway_widths(way_db):
 def merge_nearby_same_nodes(way_db, point_db):
 
     def find_all_connecting_ways(point):
-        # geometry search is setup before point layers are merged, can't search for connected ways directly
-        node_ways = []
-        nearby_node_ways = way_db.gs.find_all_nearby_ways(point)
-        for way in nearby_node_ways:
-            for p in way.way:
-                if p == point:
-                    node_ways.append(way)
-                    break
-        return node_ways
+        # the topology is kept up to date when nodes are merged into the ways, unlike the
+        # geometry search which is setup before point layers are merged
+        return way_db.topology.find_all_connecting_ways(point)
 
     _log.info("Merge nearby nodes that are actually the same...")
 
     # setup 2D search for all nodes
-    node_search = TwoDimSearch()
+    node_search = new_two_dim_search()
     for node_list in point_db.values():
         for node in node_list:
             node_search.insert(node.way, node)
@@ -1909,9 +1919,9 @@ def simplify_oneway(way_db, point_db):
                 bw_key = k.replace(":forward", ":backward")
                 plain_key = k.replace(":forward", "")
                 if bw_key in way.tags and way.tags[bw_key] == v and way.tags.get(plain_key, v) == v:
-                    del way.tags[k]
-                    del way.tags[bw_key]
-                    way.tags[plain_key] = v
+                    del way.mutable_tags()[k]
+                    del way.mutable_tags()[bw_key]
+                    way.mutable_tags()[plain_key] = v
 
         if not "oneway" in way.tags:
             continue
@@ -1928,14 +1938,14 @@ def simplify_oneway(way_db, point_db):
         for k, v in list(way.tags.items()):
             #  Removing direction if it's the same as oneway, except for lanes (need for lane resolving later)
             if ":forward" in k and not "lanes:" in k:
-                del way.tags[k]
+                del way.mutable_tags()[k]
                 k = k.replace(":forward", "")
-                way.tags[k] = v
+                way.mutable_tags()[k] = v
 
             # Remove redundant backward vehicle restriction
             k_split = k.split(":backward")
             if len(k_split) > 1 and k_split[0] in ALL_VEHICLES and v == "no":
-                del way.tags[k]
+                del way.mutable_tags()[k]
     _log.info("done")
 
 
@@ -1956,15 +1966,15 @@ def resolve_lanes(way_db):
                     spec_lane_count += int(v.split()[0]) # if conditional, eg "1 @ ...."
 
         if not "lanes" in way.tags and "NVDB_guess_lanes" in way.tags:
-            way.tags["lanes"] = way.tags["NVDB_guess_lanes"]
+            way.mutable_tags()["lanes"] = way.tags["NVDB_guess_lanes"]
 
         is_oneway = way.tags.get("oneway", None) in ("yes", "-1", -1)
         if spec_lane_count > 0:
             total_count = way.tags.get("lanes", -1)
             if total_count == -1:
-                append_fixme_value(way.tags, "total lane count (lanes=x) not specified")
+                append_fixme_value(way.mutable_tags(), "total lane count (lanes=x) not specified")
             elif spec_lane_count > total_count:
-                append_fixme_value(way.tags, "too many lanes specified")
+                append_fixme_value(way.mutable_tags(), "too many lanes specified")
             elif spec_lane_count < total_count:
                 if not "lanes:forward" in way.tags and not "lanes:backward" in way.tags:
                     if is_oneway:
@@ -1972,12 +1982,12 @@ def resolve_lanes(way_db):
                         pass
                     elif total_count - spec_lane_count == 2:
                         # assume one lane in each direction
-                        way.tags["lanes:forward"] = 1
-                        way.tags["lanes:backward"] = 1
+                        way.mutable_tags()["lanes:forward"] = 1
+                        way.mutable_tags()["lanes:backward"] = 1
                     else:
-                        append_fixme_value(way.tags, "could not derive forward/backward lanes")
+                        append_fixme_value(way.mutable_tags(), "could not derive forward/backward lanes")
                 else:
-                    append_fixme_value(way.tags, "too few lanes specified")
+                    append_fixme_value(way.mutable_tags(), "too few lanes specified")
 
         # remove redundant lanes direction
         if is_oneway and spec_lane_count > 0:
@@ -1993,21 +2003,21 @@ def resolve_lanes(way_db):
                     remove_oneway = True
                     break
             if remove_oneway:
-                way.tags.pop("oneway", None)
+                way.mutable_tags().pop("oneway", None)
                 total_count = way.tags.get("lanes", None)
                 if total_count is not None and total_count > spec_lane_count:
-                    way.tags["lanes" + dirstr] = total_count - spec_lane_count
+                    way.mutable_tags()["lanes" + dirstr] = total_count - spec_lane_count
             else:
                 for k, v in list(way.tags.items()):
                     if "lanes:" in k and dirstr in k:
-                        del way.tags[k]
+                        del way.mutable_tags()[k]
                         k = k.replace(dirstr, "")
-                        way.tags[k] = v
+                        way.mutable_tags()[k] = v
 
         # if all lanes are bus lanes, set access restrictions
         if way.tags.get("lanes", -1) == (way.tags.get("lanes:bus", 0) + way.tags.get("lanes:bus:forward", 0) + way.tags.get("lanes:bus:backward", 0)):
-            way.tags["vehicle"] = way.tags.get("vehicle", "no")
-            way.tags["bus"] = way.tags.get("bus", "yes")
+            way.mutable_tags()["vehicle"] = way.tags.get("vehicle", "no")
+            way.mutable_tags()["bus"] = way.tags.get("bus", "yes")
             _log.debug(f"Added access restrictions to {way.rlid} due to all being bus lanes")
 
         # 2021-11-21: we choose to keep "redundant lanes", see https://github.com/atorger/nvdb2osm/issues/28
@@ -2078,11 +2088,11 @@ def postprocess_miscellaneous_tags(tags):
 #
 def final_pass_postprocess_miscellaneous_tags(way_db):
     for way in way_db:
-        postprocess_miscellaneous_tags(way.tags)
+        postprocess_miscellaneous_tags(way.mutable_tags())
     for p in way_db.point_db:
         nodes = way_db.point_db[p]
         for node in nodes:
-            postprocess_miscellaneous_tags(node.tags)
+            postprocess_miscellaneous_tags(node.mutable_tags())
 
 # cleanup_used_nvdb_tags()
 #
@@ -2092,9 +2102,9 @@ def cleanup_used_nvdb_tags(way_db_ways, in_use):
     for ways in way_db_ways.values():
         for way in ways:
             for key in NVDB_USED_KEYS:
-                way.tags.pop(key, None)
+                way.mutable_tags().pop(key, None)
             for key in NVDB_GEOMETRY_TAGS:
-                way.tags.pop(key, None)
+                way.mutable_tags().pop(key, None)
             for key in way.tags.keys():
                 if not key in in_use:
                     in_use[key] = 1
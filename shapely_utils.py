@@ -1,3 +1,5 @@
+import numpy
+import shapely
 from shapely.geometry import LineString
 from shapely.geometry import Point as shapely_Point
 from geometry_basics import *
@@ -18,6 +20,39 @@ def shapely_linestring_to_way(geometry):
         way.append(p)
     return way
 
+# shapely_geometries_to_ways()
+#
+# Convert an array of shapely Point/LineString objects to a list with a Point() or a list of
+# Point() for each geometry (None for missing geometry). Same result as calling
+# shapely_linestring_to_way() for each line, but the coordinates are extracted in one go.
+#
+def shapely_geometries_to_ways(geometries):
+    geometries = numpy.asarray(geometries, dtype=object)
+    type_ids = shapely.get_type_id(geometries)
+    assert numpy.isin(type_ids, [ -1, shapely.GeometryType.POINT, shapely.GeometryType.LINESTRING ]).all(), "Unexpected geometry type"
+    coords, index = shapely.get_coordinates(geometries, return_index=True)
+
+    # skip duplicate points (quite common in NVDB data)
+    keep = numpy.ones(len(coords), dtype=bool)
+    if len(coords) > 1:
+        keep[1:] = (index[1:] != index[:-1]) | (coords[1:] != coords[:-1]).any(axis=1)
+    coords = coords[keep]
+    index = index[keep]
+    ends = numpy.cumsum(numpy.bincount(index, minlength=len(geometries))).tolist()
+
+    points = [ Point(x, y) for x, y in coords.tolist() ]
+    ways = []
+    start = 0
+    for type_id, end in zip(type_ids.tolist(), ends):
+        if type_id == -1:
+            ways.append(None)
+        elif type_id == shapely.GeometryType.POINT:
+            ways.append(points[start])
+        else:
+            ways.append(points[start:end])
+        start = end
+    return ways
+
 # simplify_way()
 #
 # Remove excess amount of points from geometry using Douglas-Peucker algorithm,
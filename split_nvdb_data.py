@@ -12,21 +12,14 @@ import zipfile
 import os
 import glob
 import sys
+from concurrent.futures import ProcessPoolExecutor
 import geopandas
-import pandas
+import numpy
+import shapely
 import fiona
 
 _log = logging.getLogger("split_nvdb_data")
 
-def print_progress(last_print, idx, data_len, progress_text="work"):
-    if data_len <= 1:
-        return last_print
-    progress = int(100 * idx / (data_len-1))
-    if progress % 10 == 0 and progress != last_print:
-        last_print = progress
-        _log.info(f"{progress_text}: {progress}%")
-    return last_print
-
 def is_gpkg_file(filename):
     if zipfile.is_zipfile(filename):
         zf = zipfile.ZipFile(filename)
@@ -137,15 +130,112 @@ def load_municipalities(lanskod):
             municipalities.append(row)
     return municipalities
 
-def append_row_to_municipality(m_data, m, row):
+def append_row_to_municipality(m_data, m, row_idx):
     if m is None:
         kom_kod = -1
     else:
         kom_kod = m.KOM_KOD
     if kom_kod in m_data:
-        m_data[kom_kod].append(row)
+        m_data[kom_kod].append(row_idx)
     else:
-        m_data[kom_kod] = [ row ]
+        m_data[kom_kod] = [ row_idx ]
+
+# distribute_rows_to_municipalities()
+#
+# Get which municipalities each row in the GeoDataFrame belongs to: the first municipality
+# containing it, or if none all municipalities it intersects. Returns a list with a list of
+# municipality indexes for each row (empty if none).
+#
+def distribute_rows_to_municipalities(gdf, municipalities):
+    m_geoms = numpy.array([ m.geometry for m in municipalities ], dtype=object)
+    shapely.prepare(m_geoms)
+    tree = shapely.STRtree(m_geoms)
+    geoms = numpy.asarray(gdf.geometry.values, dtype=object)
+
+    # candidates from bounding boxes, then exact tests with the prepared polygons
+    row_idx, m_idx = tree.query(geoms)
+    order = numpy.lexsort((m_idx, row_idx))
+    row_idx = row_idx[order]
+    m_idx = m_idx[order]
+    contains = shapely.contains(m_geoms[m_idx], geoms[row_idx])
+
+    result = [ [] for _ in range(len(gdf)) ]
+    is_contained = numpy.zeros(len(gdf), dtype=bool)
+    for ri, mi in zip(row_idx[contains].tolist(), m_idx[contains].tolist()):
+        if not is_contained[ri]:
+            is_contained[ri] = True
+            result[ri].append(mi)
+
+    # not contained in a municipality, check which municipalities it intersects with and add to all
+    keep = ~is_contained[row_idx]
+    row_idx = row_idx[keep]
+    m_idx = m_idx[keep]
+    intersects = shapely.intersects(m_geoms[m_idx], geoms[row_idx])
+    for ri, mi in zip(row_idx[intersects].tolist(), m_idx[intersects].tolist()):
+        result[ri].append(mi)
+    return result
+
+def _init_worker(loglevel):
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=loglevel)
+    logging.getLogger("fiona.env").setLevel(logging.WARNING)
+    logging.getLogger("fiona._env").setLevel(logging.WARNING)
+    logging.getLogger("fiona._shim").setLevel(logging.WARNING)
+    logging.getLogger("fiona.ogrext").setLevel(logging.WARNING)
+    logging.getLogger("fiona.collection").setLevel(logging.WARNING)
+
+# split_layer()
+#
+# Read a layer, distribute its rows to municipalities, and save one geometry file per
+# municipality
+#
+def split_layer(geometry_file, layer_name, layer_desc, gpkg_layer_name, is_gpkg, municipalities, output_dir):
+    _log.info(f"Reading layer {layer_name} ({layer_desc}) from {geometry_file}")
+    gdf = None
+    if is_gpkg:
+        if gpkg_layer_name is not None:
+            gdf = read_gpkg_layer(geometry_file, gpkg_layer_name)
+    else:
+        gdf = read_epsg_shapefile(geometry_file, layer_name)
+    if gdf is None:
+        _log.warning(f"{layer_name} is missing in {geometry_file}")
+        return
+
+    # go through all segments and distribute them into the right municipality
+    _log.info(f"Distributing {len(gdf)} segments into municipalities")
+    # only row indexes are stored, the rows are copied when writing each municipality
+    m_data = {}
+    for idx, m_indexes in enumerate(distribute_rows_to_municipalities(gdf, municipalities)):
+        for m_idx in m_indexes:
+            append_row_to_municipality(m_data, municipalities[m_idx], idx)
+        if len(m_indexes) == 0:
+            # this should not happen -- all geodata should be in some municipality
+            row = gdf.iloc[idx]
+            if row.get('ELEMENT_ID') is not None:
+                row_id = row.get('ELEMENT_ID')
+            else:
+                row_id = row.get('RLID')
+            _log.info(f"geometry with id {row_id} not contained nor intersecting with any municipality. Adding to 'unknown'.")
+            append_row_to_municipality(m_data, None, idx)
+
+    # write geometry files for each municipality
+    cleaned_layer_name = layer_name.replace('*', '-')
+    muni = [ { 'code': -1, 'name': 'unknown' }]
+    for m in municipalities:
+        muni.append({ 'code': m.KOM_KOD, 'name': m.KOMMUNNAMN })
+    for m in muni:
+        code = m['code']
+        name = m['name']
+        if code in m_data:
+            _log.info(f"Saving {cleaned_layer_name}.gkpg for {name}")
+
+            mgdf = gdf.iloc[m_data.pop(code)].reset_index(drop=True)
+            mgdf = mgdf.set_crs("epsg:3006", allow_override=True)
+
+            path = os.path.join(output_dir, name)
+            os.makedirs(path, exist_ok=True) # layers may be written in parallel
+            path = os.path.join(path, f"{cleaned_layer_name}.gpkg")
+            mgdf.to_file(path)
+            del mgdf
 
 def main():
 
@@ -215,6 +305,7 @@ def main():
     parser.add_argument('output_dir', type=pathlib.Path, help="directory to save output geometry files")
     parser.add_argument('--include_all_layers', help="Include all layers without name change (for debugging)", action='store_true')
     parser.add_argument('--lanskod_filter', help="Only include municipalities belonging to länskod", default="-1")
+    parser.add_argument('--jobs', type=int, help="Number of layers processed in parallel", default=1)
     parser.add_argument(
         '-d', '--debug',
         help="Print debugging statements",
@@ -227,9 +318,14 @@ def main():
     output_dir = args.output_dir
     lanskod = int(args.lanskod_filter)
     include_all_layers = args.include_all_layers
+    jobs = args.jobs
 
     log_version()
 
+    if jobs < 1:
+        _log.error("jobs parameter must be at least 1")
+        sys.exit(1)
+
     if not os.path.exists(output_dir):
         _log.error(f"Output directory {output_dir} does not exist")
         sys.exit(1)
@@ -260,68 +356,19 @@ def main():
         _log.error("The include all layers flag only works with gpkg")
         sys.exit(1)
 
+    tasks = []
     for layer_idx, layer_name in enumerate(layer_names):
-        _log.info(f"Reading layer {layer_name} ({layer_idx+1} of {len(layer_names)} layers) from {geometry_file}")
-        gdf = None
-        if is_gpkg:
-            ln = layer_map.get(layer_name)
-            if ln is not None:
-                gdf = read_gpkg_layer(geometry_file, ln)
-        else:
-            gdf = read_epsg_shapefile(geometry_file, layer_name)
-        if gdf is None:
-            _log.warning(f"{layer_name} is missing in {geometry_file}")
-            continue
-
-        # go through all segments and distribute them into the right municipality
-        m_data = {}
-        last_print = 0
-        for idx, row in gdf.iterrows():
-            last_print = print_progress(last_print, idx, len(gdf), progress_text="Distributing segments into municipalities")
-            contained = False
-            for m_idx, m in enumerate(municipalities):
-                if m.geometry.contains(row.geometry):
-                    contained = True
-                    append_row_to_municipality(m_data, m, row)
-                    # move to front list
-                    if m_idx != 0:
-                        municipalities.insert(0, municipalities.pop(m_idx))
-                    break
-            if not contained:
-                # not contained in a municipality, check which municipalities it intersects with and add to all
-                for m_idx, m in enumerate(municipalities):
-                    if m.geometry.intersects(row.geometry):
-                        contained = True
-                        append_row_to_municipality(m_data, m, row)
-            if not contained:
-                # this should not happen -- all geodata should be in some municipality
-                if row.get('ELEMENT_ID') is not None:
-                    row_id = row.get('ELEMENT_ID')
-                else:
-                    row_id = row.get('RLID')
-                _log.info(f"geometry with id {row_id} not contained nor intersecting with any municipality. Adding to 'unknown'.")
-                append_row_to_municipality(m_data, None, row)
-
-        # write geometry files for each municipality
-        cleaned_layer_name = layer_name.replace('*', '-')
-        muni = [ { 'code': -1, 'name': 'unknown' }]
-        for m in municipalities:
-            muni.append({ 'code': m.KOM_KOD, 'name': m.KOMMUNNAMN })
-        for m in muni:
-            code = m['code']
-            name = m['name']
-            if code in m_data:
-                _log.info(f"Saving {cleaned_layer_name}.gkpg for {name}")
-
-                empty_copy = gdf.drop(gdf.index)
-                mgdf = pandas.concat([empty_copy, pandas.DataFrame(m_data[code])], ignore_index=True)
-                mgdf.crs = "epsg:3006"
-
-                path = os.path.join(output_dir, name)
-                if not os.path.exists(path):
-                    os.mkdir(path)
-                path = os.path.join(path, f"{cleaned_layer_name}.gpkg")
-                geopandas.GeoDataFrame(mgdf).to_file(path)
+        layer_desc = f"{layer_idx+1} of {len(layer_names)} layers"
+        gpkg_layer_name = layer_map.get(layer_name) if is_gpkg else None
+        tasks.append((geometry_file, layer_name, layer_desc, gpkg_layer_name, is_gpkg, municipalities, output_dir))
+    if jobs == 1:
+        for task in tasks:
+            split_layer(*task)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(logging.getLogger().getEffectiveLevel(),)) as pool:
+            futures = [ pool.submit(split_layer, *task) for task in tasks ]
+            for future in futures:
+                future.result()
 
     # Create zip archives for each municipality
     dirnames = next(os.walk(output_dir), (None, [], None))[1]
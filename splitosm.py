@@ -1,9 +1,12 @@
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 import geopandas
+import numpy
+import shapely
 from shapely.geometry import Polygon
 
-from osmxml import write_osmxml
+from osmxml import write_osm_file
 from shapely_utils import way_is_inside_or_crossing, shortest_way_inside_or_crossing
 
 _log = logging.getLogger("splitosm")
@@ -45,26 +48,71 @@ def read_geojson_with_polygons(filename):
         polygons.append(Polygon(row.geometry))
     return sort_polygons(polygons)
 
-def splitosm(way_db, outer_polygons, polygons, output_dir, basename, write_rlid=True):
+# _get_subarea_candidates()
+#
+# Get, for each polygon, the segments and points that have a bounding box overlapping the
+# polygon's, using a spatial index over the polygons. Only these need the exact (and costly)
+# tests. The order of segments is kept.
+#
+def _get_subarea_candidates(way_db, polygons):
+    tree = shapely.STRtree(polygons)
+    segs = [ seg for segs in way_db.way_db.values() for seg in segs ]
+    points = [ point for points in way_db.point_db.values() for point in points ]
 
+    bounds = numpy.array([ (min(p.x for p in seg.way), min(p.y for p in seg.way),
+                            max(p.x for p in seg.way), max(p.y for p in seg.way)) for seg in segs ]).reshape(-1, 4)
+    seg_idx, poly_idx = tree.query(shapely.box(bounds[:,0], bounds[:,1], bounds[:,2], bounds[:,3]))
+    seg_candidates = [ [] for _ in polygons ]
+    for si, pi in sorted(zip(seg_idx.tolist(), poly_idx.tolist())):
+        seg_candidates[pi].append(segs[si])
+
+    coords = numpy.array([ (point.way.x, point.way.y) for point in points ]).reshape(-1, 2)
+    point_idx, poly_idx = tree.query(shapely.points(coords))
+    point_candidates = [ [] for _ in polygons ]
+    for si, pi in sorted(zip(point_idx.tolist(), poly_idx.tolist())):
+        point_candidates[pi].append(points[si])
+    return seg_candidates, point_candidates
+
+def _init_worker(loglevel):
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=loglevel)
+
+# _write_subarea()
+#
+# Get all ways and points that are inside or intersect a subarea and write them to file
+#
+def _write_subarea(idx, polygon_count, polygon, outer_polygons, segs, candidate_points, output_filename, basename, write_rlid):
+    _log.info(f"Getting all ways and points that is inside or intersects area {idx+1} (of {polygon_count})")
+    ways = []
+    points = []
+    for seg in segs:
+        w = shortest_way_inside_or_crossing(polygon, seg.way)
+        for poly in outer_polygons:
+            w = shortest_way_inside_or_crossing(poly, w)
+            if w is not None:
+                ways.append(seg.make_copy_new_way(w))
+                break
+    for point in candidate_points:
+        if way_is_inside_or_crossing(polygon, point.way):
+            points.append(point)
+    _log.info(f"{basename} subarea {idx+1} contains {len(ways)} ways and {len(points)} points")
+    _log.info(f"Writing output to {output_filename}")
+    write_osm_file(ways, points, output_filename, write_rlid)
+    _log.info("done writing output")
+
+def splitosm(way_db, outer_polygons, polygons, output_dir, basename, write_rlid=True, file_extension="osm", jobs=1):
+
+    seg_candidates, point_candidates = _get_subarea_candidates(way_db, polygons)
+    subareas = []
     for idx, polygon in enumerate(polygons):
-        _log.info(f"Getting all ways and points that is inside or intersects area {idx+1} (of {len(polygons)})")
-        ways = []
-        points = []
-        for segs in way_db.way_db.values():
-            for seg in segs:
-                w = shortest_way_inside_or_crossing(polygon, seg.way)
-                for poly in outer_polygons:
-                    w = shortest_way_inside_or_crossing(poly, w)
-                    if w is not None:
-                        ways.append(seg.make_copy_new_way(w))
-                        break
-        for segs in way_db.point_db.values():
-            for point in segs:
-                if way_is_inside_or_crossing(polygon, point.way):
-                    points.append(point)
-        _log.info(f"{basename} subarea {idx+1} contains {len(ways)} ways and {len(points)} points")
-        output_filename = os.path.join(output_dir, f"{basename}-subarea-{idx+1:02d}.osm")
-        _log.info(f"Writing output to {output_filename}")
-        write_osmxml(ways, points, output_filename, write_rlid)
-        _log.info("done writing output")
+        output_filename = os.path.join(output_dir, f"{basename}-subarea-{idx+1:02d}.{file_extension}")
+        subareas.append((idx, len(polygons), polygon, outer_polygons, seg_candidates[idx], point_candidates[idx], output_filename, basename, write_rlid))
+
+    if jobs <= 1:
+        for subarea in subareas:
+            _write_subarea(*subarea)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(logging.getLogger().getEffectiveLevel(),)) as pool:
+        futures = [ pool.submit(_write_subarea, *subarea) for subarea in subareas ]
+        for future in futures:
+            future.result()
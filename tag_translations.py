@@ -100,12 +100,16 @@
 
 import logging
 import string
+from collections import OrderedDict
 import pandas
 
 from nvdb_ti import parse_time_interval_tags, parse_range_date
 
 _log = logging.getLogger("translations")
 
+# Max number of distinct attribute combinations remembered per layer by _TranslationMemo
+TRANSLATION_MEMO_SIZE = 8192
+
 
 # append_fixme_value()
 #
@@ -1205,33 +1209,53 @@ def preprocess_name(name):
 
     return name
 
-# process_tag_translations()
+# translate_name_value()
 #
-# Translate tags for a layer using provided matching entry from TAG_TRANSLATIONS,
-# some are static translations from the table, others run matching
-# tag_translation_*() function
+# Clean up a name value using preprocess_name(), logging any change.
 #
-def process_tag_translations(tags, tag_translations):
+def translate_name_value(name):
+    new_name = preprocess_name(name)
+    if new_name != name:
+        if new_name is None:
+            if name not in ["-1", -1, None]:
+                _log.info(f"Removed invalid name: '{name}'")
+        else:
+            _log.info(f"Changed name: '{name}' => '{new_name}'")
+        return new_name
+    return name
 
-    if not bool(tag_translations):
-        return
+# Marker for static translations that keep the original value under a new key
+_KEEP_VALUE = object()
 
-    if "Namn" in tags:
-        name = tags["Namn"]
-        new_name = preprocess_name(name)
-        if new_name != name:
-            if new_name is None:
-                if name not in ["-1", -1, None]:
-                    _log.info(f"Removed invalid name: '{name}'")
-            else:
-                _log.info(f"Changed name: '{name}' => '{new_name}'")
-            tags["Namn"] = new_name
-
-    if "translator_function" in tag_translations:
-        tag_translations["translator_function"](tags)
-    if tag_translations.get("expect_unset_time_intervals", False):
-        tag_translation_expect_unset_time_intervals(tags)
-    replaced_keys = []
+# get_static_translation()
+#
+# Get how a static translation from the table changes a single key/value. Returns a tuple
+# (replaced, items) where 'replaced' is True if the key should be removed and 'items' is a
+# list of new (key, value) pairs, with value _KEEP_VALUE if the original value should be used.
+#
+def get_static_translation(k, v, tag_translations):
+    # look at k=v first as we want to support both key=value and key replacement for the same key.
+    kv = "%s=%s" % (k, v)
+    if kv in tag_translations:
+        sub = tag_translations.get(kv)
+        items = []
+        if sub is not None:
+            # replace specific key/value combination with new key/value combo
+            if not isinstance(sub, list):
+                sub = [sub]
+            for kv in sub:
+                kv = kv.split('=')
+                items.append((kv[0].strip(), kv[1].strip()))
+        return True, items
+    if k in tag_translations:
+        sub = tag_translations[k]
+        # replace key with new key name (or remove it)
+        if sub is None:
+            return True, []
+        return True, [ (sub, _KEEP_VALUE) ]
+    return False, []
+
+def _get_added_keys_and_values(tag_translations):
     new_items = {}
     if "add_keys_and_values" in tag_translations:
         all_kv = tag_translations["add_keys_and_values"]
@@ -1242,463 +1266,688 @@ def process_tag_translations(tags, tag_translations):
             if len(kv) == 1:
                 raise RuntimeError("Bad item in add_keys_and_values %s" % item)
             new_items[kv[0].strip()] = kv[1].strip()
+    return new_items
+
+# apply_static_tag_translations()
+#
+# Apply the static key and key=value translations from the table, and add the keys and
+# values listed in "add_keys_and_values".
+#
+def apply_static_tag_translations(tags, tag_translations):
+    replaced_keys = []
+    new_items = _get_added_keys_and_values(tag_translations)
     for k, v in tags.items():
-        # look at k=v first as we want to support both key=value and key replacement for the same key.
-        kv = "%s=%s" % (k, v)
-        if kv in tag_translations:
-            sub = tag_translations.get(kv)
-            replaced_keys.append(k)
-            if sub is not None:
-                # replace specific key/value combination with new key/value combo
-                if not isinstance(sub, list):
-                    sub = [sub]
-                for kv in sub:
-                    kv = kv.split('=')
-                    new_items[kv[0].strip()] = kv[1].strip()
-        elif k in tag_translations:
-            sub = tag_translations[k]
-            # replace key with new key name (or remove it)
-            replaced_keys.append(k)
-            if sub is not None:
-                new_items[sub] = v
+        replaced, items = get_static_translation(k, v, tag_translations)
+        if not replaced:
+            continue
+        replaced_keys.append(k)
+        for new_k, new_v in items:
+            new_items[new_k] = v if new_v is _KEEP_VALUE else new_v
     tags.update(new_items)
     for k in replaced_keys:
         del tags[k]
 
-    # convert to int or float where approriate
+def convert_number_value(v):
+    if not isinstance(v, str):
+        return v
+    try:
+        return int(v)
+    except ValueError:
+        try:
+            return float(v)
+        except ValueError:
+            return v
+
+# convert_tag_number_types()
+#
+# Convert string values to int or float where approriate
+#
+def convert_tag_number_types(tags):
     for k, v in tags.items():
-        if not isinstance(v, str):
+        tags[k] = convert_number_value(v)
+
+# process_tag_translations()
+#
+# Translate tags for a layer using provided matching entry from TAG_TRANSLATIONS,
+# some are static translations from the table, others run matching
+# tag_translation_*() function
+#
+def process_tag_translations(tags, tag_translations):
+
+    if not bool(tag_translations):
+        return
+
+    if "Namn" in tags:
+        tags["Namn"] = translate_name_value(tags["Namn"])
+
+    _process_tag_translations_after_name(tags, tag_translations)
+
+def _process_tag_translations_after_name(tags, tag_translations):
+    if "translator_function" in tag_translations:
+        tag_translations["translator_function"](tags)
+    if tag_translations.get("expect_unset_time_intervals", False):
+        tag_translation_expect_unset_time_intervals(tags)
+    apply_static_tag_translations(tags, tag_translations)
+    convert_tag_number_types(tags)
+
+# _map_column_values()
+#
+# Run 'fun' once for each distinct value in a column, and return the list of results.
+#
+def _map_column_values(values, fun):
+    results = {}
+    out = []
+    for v in values:
+        key = (type(v), v) # type included so that for example 1 and True are kept apart
+        try:
+            result = results.get(key, _KEEP_VALUE)
+            if result is _KEEP_VALUE:
+                result = fun(v)
+                results[key] = result
+        except TypeError:
+            # unhashable value
+            result = fun(v)
+        out.append(result)
+    return out
+
+# _apply_static_tag_translations_to_columns()
+#
+# Column version of apply_static_tag_translations(). This requires that each column is
+# translated to the same set of keys for all its values, if not None is returned and the
+# translation has to be made per row instead.
+#
+def _apply_static_tag_translations_to_columns(columns, row_count, tag_translations):
+    new_columns = {}
+    for k, v in _get_added_keys_and_values(tag_translations).items():
+        new_columns[k] = [ v ] * row_count
+    replaced_keys = []
+    for k, values in columns.items():
+        translations = _map_column_values(values, lambda v, k=k: get_static_translation(k, v, tag_translations))
+        layouts = set()
+        for replaced, items in translations:
+            layouts.add((replaced, tuple(item[0] for item in items)))
+            if len(layouts) > 1:
+                return None
+        replaced, items = translations[0]
+        if not replaced:
             continue
+        replaced_keys.append(k)
+        for idx, (new_k, _) in enumerate(items):
+            new_columns[new_k] = [ v if tr[1][idx][1] is _KEEP_VALUE else tr[1][idx][1] for v, tr in zip(values, translations) ]
+    columns = columns.copy()
+    columns.update(new_columns)
+    for k in replaced_keys:
+        del columns[k]
+    return columns
+
+def _nan_to_none(v):
+    if pandas.isna(v):
+        return None
+    return v
+
+# preprocess_tag_columns()
+#
+# Take care of name changes of tags etc for a DataFrame (without geometry), and replace NaN
+# and NaT with None. Returns a dictionary with a list of values per key.
+# In long term the code should be adapted to handle new tag names.
+#
+def preprocess_tag_columns(df):
+    columns = {}
+    for k in df.columns:
+        columns[k] = _map_column_values(df[k].tolist(), _nan_to_none)
+    for alt_key, key in ALT_TAG_NAMES.items():
+        if alt_key in columns:
+            columns[key] = columns[alt_key]
+            _ = columns.pop(alt_key, None)
+    return columns
+
+# _RowLogCounter
+#
+# Logging filter counting warnings, and messages naming the RLID of the row being translated
+# (set in 'rlid'). Translations logging such messages are not memoized, so that they are still
+# logged for each segment. Messages below the active log level do not reach the filter, and
+# then don't prevent memoization.
+#
+class _RowLogCounter(logging.Filter):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+        self.rlid = None
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or (self.rlid is not None and self.rlid in record.getMessage()):
+            self.count += 1
+        return True
+
+_row_log_counter = _RowLogCounter()
+_log.addFilter(_row_log_counter)
+logging.getLogger("nvdb_ti").addFilter(_row_log_counter)
+
+# _TranslationMemo
+#
+# Bounded LRU memo of row translations made by translator functions, keyed on all attributes
+# except RLID (measures are already removed before translation). Within a layer a small number
+# of attribute combinations typically repeat over many rows, so each is translated once and
+# the result is copied with the RLID of the row.
+#
+class _TranslationMemo:
+    def __init__(self, tag_translations, max_size=TRANSLATION_MEMO_SIZE):
+        self._tag_translations = tag_translations
+        self._max_size = max_size
+        self._results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+
+    @staticmethod
+    def _make_key(tags):
+        # type included so that for example 1 and True are kept apart
+        return tuple((k, type(v), v) for k, v in tags.items() if k != "RLID")
+
+    # _copy_tags()
+    #
+    # Copy including list values, so rows never share lists that may be modified in place
+    #
+    @staticmethod
+    def _copy_tags(tags):
+        return { k: (v.copy() if isinstance(v, list) else v) for k, v in tags.items() }
+
+    @staticmethod
+    def _can_cache(tags, rlid):
+        if tags.get("RLID", rlid) != rlid:
+            return False
+        rlid_str = str(rlid)
+        for k, v in tags.items():
+            if k != "RLID" and (v == rlid or (isinstance(v, str) and rlid_str in v)):
+                return False
+        return True
+
+    def translate(self, tags):
+        rlid = tags.get("RLID", None)
         try:
-            intv = int(v)
-            tags[k] = intv
-        except ValueError:
-            try:
-                fv = float(v)
-                tags[k] = fv
-            except ValueError:
-                pass
+            key = self._make_key(tags)
+            result = self._results.get(key, None)
+        except TypeError:
+            # unhashable value
+            key = None
+            result = None
+        if result is not None:
+            self.hits += 1
+            self._results.move_to_end(key)
+            tags = self._copy_tags(result)
+            if "RLID" in tags:
+                tags["RLID"] = rlid
+            return tags
+
+        log_count = _row_log_counter.count
+        _row_log_counter.rlid = None if rlid is None else str(rlid)
+        try:
+            _process_tag_translations_after_name(tags, self._tag_translations)
+        finally:
+            _row_log_counter.rlid = None
+        if key is None or rlid is None or _row_log_counter.count != log_count or not self._can_cache(tags, rlid):
+            self.uncached += 1
+            return tags
+        self.misses += 1
+        self._results[key] = self._copy_tags(tags)
+        if len(self._results) > self._max_size:
+            self._results.popitem(last=False)
+        return tags
+
+# process_tag_translations_columnar()
+#
+# Same as process_tag_translations(), but for a whole layer. 'columns' is a dictionary with
+# a list of values per key, and a list with a tags dictionary per row is returned.
+#
+# Name cleanup, static translations and number conversions are made per column, once for
+# each distinct value. Layers that use a translator function are translated row by row, once
+# for each distinct combination of attributes (see _TranslationMemo).
+#
+def process_tag_translations_columnar(columns, row_count, tag_translations):
 
+    def make_rows(columns):
+        keys = list(columns.keys())
+        if len(keys) == 0:
+            return [ {} for _ in range(row_count) ]
+        return [ dict(zip(keys, values)) for values in zip(*columns.values()) ]
 
-# preprocess_tags()
-#
-# Take care of name changes of tags etc
-# in long term the code should be adapted to handle new tag names
-def preprocess_tags(tags):
-
-    alt_tag_names = {
-        # Note 2026-02-16: the script was made at the time NVDB had shape files with 10 character tag names,
-        # and then kept backwards compatible. This means many new tags are translated into old less readable
-        # tag names. Going forward, try to instead keeep the more readable names the default.
-
-
-        # common/generic tags
-        "ELEMENT_ID": "RLID",
-        "VALID_FROM": "FRAN_DATUM",
-        "VALID_TO": "TILL_DATUM",
-        "START_MEASURE": "STARTAVST",
-        "END_MEASURE": "SLUTAVST",
-        "MEASURE": "AVST",
-        "EXTENT_LENGTH": "SHAPE_LEN",
-
-        "DIRECTION": "Riktning",
-        "RIKTNING": "Riktning",
-        "SIDE": "SIDA",
-        "TYP": "Typ",
-        "ROLE": "LANKROLL",
-        "Lankroll": "LANKROLL",
-        "SEQ_NO": "SEQ_NO",
-        "NAMN": "Namn",
-        "BETECKNING": "Beteckning",
-        "Galler_genomfart": "GENOMFART",
-        "XKOORDINAT": "X_koordinat",
-        "YKOORDINAT": "Y_koordinat",
-        "Ordningsnummer": "ORDNING",
-        "Vard": "VARDVAG",
-
-        # Antal_korfalt2
-        "Korfalt_i_vagens_bakriktning": "KOEFAETING",
-        "Korfalt_i_vagens_framriktning": "KOEFAETIN1",
-        "Korfaltsantal": "KOEFAETSAL",
-
-        # Barighet
-        "Barighetsklass": "BAEIGHTSSS",
-        "Barighetsklass_vinterperiod": "BAEIGHTSOD",
-        "Slutdatum_sommarperiod": "SLUDATMSOD",
-        "Slutdatum_vinterperiod": "SLUDATMVOD",
-        "Startdatum_sommarperiod": "STATDAUMOD",
-        "Startdatum_vinterperiod": "STATDAUMO3",
-
-        # BegrAxelBoggiTryck
-        "Axel_boggitrycks_begransning__Hogsta_tillatna_tryck1": "TRYCK1",
-        "Axel_boggitrycks_begransning__Hogsta_tillatna_tryck2": "TRYCK2",
-        "Axel_boggitrycks_begransning__Hogsta_tillatna_tryck3": "TRYCK3",
-        "Axel_boggitrycks_begransning__Tidsintervall__Dagslag11": "DAGSL11",
-        "Axel_boggitrycks_begransning__Tidsintervall__Dagslag21": "DAGSL21",
-        "Axel_boggitrycks_begransning__Tidsintervall__Dagslag31": "DAGSL31",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Minut111": "SLMIN111",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Minut112": "SLMIN112",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Minut211": "SLMIN211",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Minut212": "SLMIN212",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Minut311": "SLMIN311",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Minut312": "SLMIN312",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Timme111": "SLTIM111",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Timme112": "SLTIM112",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Timme211": "SLTIM211",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Timme212": "SLTIM212",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Timme311": "SLTIM311",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Timme312": "SLTIM312",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Minut111": "STMIN111",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Minut112": "STMIN112",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Minut211": "STMIN211",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Minut212": "STMIN212",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Minut311": "STMIN311",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Minut312": "STMIN312",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Timme111": "STTIM111",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Timme112": "STTIM112",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Timme211": "STTIM211",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Timme212": "STTIM212",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Timme311": "STTIM311",
-        "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Timme312": "STTIM312",
-        "Axel_boggitrycks_begransning__Tidsintervall__Slutdag11": "SLDAG11",
-        "Axel_boggitrycks_begransning__Tidsintervall__Slutdag21": "SLDAG21",
-        "Axel_boggitrycks_begransning__Tidsintervall__Slutdag31": "SLDAG31",
-        "Axel_boggitrycks_begransning__Tidsintervall__Slutdatum11": "SLDAT11",
-        "Axel_boggitrycks_begransning__Tidsintervall__Slutdatum21": "SLDAT21",
-        "Axel_boggitrycks_begransning__Tidsintervall__Slutdatum31": "SLDAT31",
-        "Axel_boggitrycks_begransning__Tidsintervall__Startdag11": "STDAG11",
-        "Axel_boggitrycks_begransning__Tidsintervall__Startdag21": "STDAG21",
-        "Axel_boggitrycks_begransning__Tidsintervall__Startdag31": "STDAG31",
-        "Axel_boggitrycks_begransning__Tidsintervall__Startdatum11": "STDAT11",
-        "Axel_boggitrycks_begransning__Tidsintervall__Startdatum21": "STDAT21",
-        "Axel_boggitrycks_begransning__Tidsintervall__Startdatum31": "STDAT31",
-        "Axel_boggitrycks_begransning__Typ_av_tryck1": "TYPTRYCK1",
-        "Axel_boggitrycks_begransning__Typ_av_tryck2": "TYPTRYCK2",
-        "Axel_boggitrycks_begransning__Typ_av_tryck3": "TYPTRYCK3",
-        "Beteckning__Artal": "AARTAL1",
-        "Beteckning__Lopnummer": "LOEPNUMME1",
-        "Beteckning__Organisationskod": "ORGNISTI1",
-        "Foreskrift_som_upphor__Artal": "AARTAL2",
-        "Foreskrift_som_upphor__Lopnummer": "LOEPNUMME2",
-        "Foreskrift_som_upphor__Organisationskod": "ORGNISTI2",
-        "Galler_inte_fordon_trafikant": "FORDTRAF",
-
-        # BegrBruttovikt
-        "Avser_aven_fordonstag": "FORD_TAG",
-        #"Galler_inte_fordon_trafikant": "FORDTRAF",
-        "Hogsta_tillatna_bruttovikt": "BRUTTOVIKT",
-
-        #"NVDB-BegrFordBredd"
-        "Galler_inte_fordon_trafikant1": "FORDTRAF1",
-        "Galler_inte_fordon_trafikant2": "FORDTRAF2",
-        "Galler_inte_fordon_trafikant3": "FORDTRAF3",
-        "Hogsta_tillatna_fordonsbredd": "FORD_BREDD",
-
-        #"NVDB-BegrFordLangd"
-        #"Galler_inte_fordon_trafikant1": "FORDTRAF1",
-        #"Galler_inte_fordon_trafikant2": "FORDTRAF2",
-        #"Galler_inte_fordon_trafikant3": "FORDTRAF3",
-        "Hogsta_tillatna_fordonslangd": "FORD_LGD",
-
-        #"NVDB-Bro_och_tunnel"
-        "Identitet": "IDENTITET",
-        "Konstruktion": "KONTRUTION",
-        "Langd": "LAENGD",
-        "Oppningsbar": "OEPNINSBAR",
-
-        #"NVDB-Cirkulationsplats" - no specific tags
-
-        #"NVDB-CykelVgsKat"
-        "Forbindelsekategori": "FOEBINELRI",
-
-        #"NVDB-Farjeled"
-        "Farjeledsnamn": "LEDSNAMN",
-
-        #"NVDB-ForbjudenFardriktning" - no specific tags
-
-        # ForbudTrafik
-        "Beskrivning": "BESKRGFART",
-        "Galler_ej__Beskrivning1": "BSEKR_GEJ1",
-        "Galler_ej__Fordon_trafikant11": "FORDTRA11",
-        "Galler_ej__Fordon_trafikant110": "FORDTRA110",
-        "Galler_ej__Fordon_trafikant12": "FORDTRA12",
-        "Galler_ej__Fordon_trafikant13": "FORDTRA13",
-        "Galler_ej__Fordon_trafikant14": "FORDTRA14",
-        "Galler_ej__Fordon_trafikant15": "FORDTRA15",
-        "Galler_ej__Fordon_trafikant16": "FORDTRA16",
-        "Galler_ej__Fordon_trafikant17": "FORDTRA17",
-        "Galler_ej__Fordon_trafikant18": "FORDTRA18",
-        "Galler_ej__Fordon_trafikant19": "FORDTRA19",
-        "Galler_ej__Verksamhet11": "VERKSAMH11",
-        "Galler_ej__Verksamhet12": "VERKSAMH12",
-        "Galler_ej__Verksamhet13": "VERKSAMH13",
-        "Galler_ej__Verksamhet14": "VERKSAMH14",
-        "Galler_ej__Verksamhet15": "VERKSAMH15",
-        "Galler_ej__Verksamhet16": "VERKSAMH16",
-        "Galler_ej__Verksamhet17": "VERKSAMH17",
-        "Galler_fordon1": "FORDTYP1",
-        "Galler_fordon2": "FORDTYP2",
-        "Galler_fordon3": "FORDTYP3",
-        "Totalvikt": "TOTALVIKT",
-        "Galler_ej__Tidsintervall__Dagslag11": "GEDAGSL11",
-        "Galler_ej__Tidsintervall__Dagslag12": "GEDAGSL12",
-        "Galler_ej__Tidsintervall__Klockslag__Sluttid__Minut111": "GESLMIN111",
-        "Galler_ej__Tidsintervall__Klockslag__Sluttid__Minut112": "GESLMIN112",
-        "Galler_ej__Tidsintervall__Klockslag__Sluttid__Minut121": "GESLMIN121",
-        "Galler_ej__Tidsintervall__Klockslag__Sluttid__Minut122": "GESLMIN122",
-        "Galler_ej__Tidsintervall__Klockslag__Sluttid__Timme111": "GESLTIM111",
-        "Galler_ej__Tidsintervall__Klockslag__Sluttid__Timme112": "GESLTIM112",
-        "Galler_ej__Tidsintervall__Klockslag__Sluttid__Timme121": "GESLTIM121",
-        "Galler_ej__Tidsintervall__Klockslag__Sluttid__Timme122": "GESLTIM122",
-        "Galler_ej__Tidsintervall__Klockslag__Starttid__Minut111": "GESTMIN111",
-        "Galler_ej__Tidsintervall__Klockslag__Starttid__Minut112": "GESTMIN112",
-        "Galler_ej__Tidsintervall__Klockslag__Starttid__Minut121": "GESTMIN121",
-        "Galler_ej__Tidsintervall__Klockslag__Starttid__Minut122": "GESTMIN122",
-        "Galler_ej__Tidsintervall__Klockslag__Starttid__Timme111": "GESTTIM111",
-        "Galler_ej__Tidsintervall__Klockslag__Starttid__Timme112": "GESTTIM112",
-        "Galler_ej__Tidsintervall__Klockslag__Starttid__Timme121": "GESTTIM121",
-        "Galler_ej__Tidsintervall__Klockslag__Starttid__Timme122": "GESTTIM122",
-        "Galler_ej__Tidsintervall__Slutdag11": "GESLDAG11",
-        "Galler_ej__Tidsintervall__Slutdag12": "GESLDAG12",
-        "Galler_ej__Tidsintervall__Slutdatum11": "GESLDAT11",
-        "Galler_ej__Tidsintervall__Slutdatum12": "GESLDAT12",
-        "Galler_ej__Tidsintervall__Startdag11": "GESTDAG11",
-        "Galler_ej__Tidsintervall__Startdag12": "GESTDAG12",
-        "Galler_ej__Tidsintervall__Startdatum11": "GESTDAT11",
-        "Galler_ej__Tidsintervall__Startdatum12": "GESTDAT12",
-
-        # "NVDB-FunkVagklass"
-        "KLASS": "Klass",
-
-        #"NVDB-Gagata" - no specific
-        #"NVDB-Gangfartsomrade" - no specific
-        #"NVDB-Gatunamn" - no specific
-
-        #"NVDB-GCM_belyst" - no specific
-
-        #"NVDB-GCM_separation",
-        "Separation": "SEPARATION",
-
-        #"NVDB-GCM_vagtyp"
-        "Gcm_typ": "GCMTYP",
-
-        #"NVDB-Hastighetsgrans"
-        "Avvikande_hastighet__Fordonstyp11": "FORDTYP11",
-        "Avvikande_hastighet__Fordonstyp12": "FORDTYP12",
-        "Avvikande_hastighet__Fordonstyp13": "FORDTYP13",
-        "Avvikande_hastighet__Galler_inte_endast1": "HAVGIE1",
-        "Avvikande_hastighet__Hogsta_tillatna_hastighet1": "HAVHAST1",
-        "Avvikande_hastighet__Tidsintervall__Dagslag11": "DAGSL11",
-        "Avvikande_hastighet__Tidsintervall__Dagslag12": "DAGSL12",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Minut111": "SLMIN111",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Minut112": "SLMIN112",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Minut121": "SLMIN121",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Minut122": "SLMIN122",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Timme111": "SLTIM111",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Timme112": "SLTIM112",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Timme121": "SLTIM121",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Timme122": "SLTIM122",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Minut111": "STMIN111",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Minut112": "STMIN112",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Minut121": "STMIN121",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Minut122": "STMIN122",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Timme111": "STTIM111",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Timme112": "STTIM112",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Timme121": "STTIM121",
-        "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Timme122": "STTIM122",
-        "Avvikande_hastighet__Tidsintervall__Slutdag11": "SLDAG11",
-        "Avvikande_hastighet__Tidsintervall__Slutdag12": "SLDAG12",
-        "Avvikande_hastighet__Tidsintervall__Slutdatum11": "SLDAT11",
-        "Avvikande_hastighet__Tidsintervall__Slutdatum12": "SLDAT12",
-        "Avvikande_hastighet__Tidsintervall__Startdag11": "STDAG11",
-        "Avvikande_hastighet__Tidsintervall__Startdag12": "STDAG12",
-        "Avvikande_hastighet__Tidsintervall__Startdatum11": "STDAT11",
-        "Avvikande_hastighet__Tidsintervall__Startdatum12": "STDAT12",
-        "Avvikande_hastighet__Totalvikt1": "TOTALVIKT1",
-        "Hogsta_tillatna_hastighet": "HTHAST",
-
-        #"NVDB-Huvudled" - no specific
-
-        #"NVDB-InskrTranspFarligtGods",
-        "Far_inte_foras_stannas_parkeras": "FARINTE",
-        "Galler_inte_fordon1": "FORDTYP1",
-        "Galler_inte_fordon2": "FORDTYP2",
-        "Galler_inte_fordon3": "FORDTYP3",
-        "Galler_inte_fordon4": "FORDTYP4",
-        "Galler_inte_fordon5": "FORDTYP5",
-        "Galler_inte_fordon_som_anvands_for__Galler_inte_fordon_trafikant11": "FORDTRAF11",
-        "Galler_inte_fordon_som_anvands_for__Galler_inte_fordon_trafikant12": "FORDTRAF12",
-        "Galler_inte_fordon_som_anvands_for__Galler_inte_fordon_trafikant13": "FORDTRAF13",
-        "Galler_inte_fordon_som_anvands_for__Plats_for_verksamhet1": "PLATS1",
-        "Galler_inte_fordon_som_anvands_for__Verksamhet11": "VERKSAMH11",
-        "Galler_inte_fordon_som_anvands_for__Verksamhet12": "VERKSAMH12",
-        "Galler_inte_fordon_som_anvands_for__Verksamhet13": "VERKSAMH13",
-
-        #"NVDB-Kollektivkorfalt"
-        "Korfalt_korbana": "KOEFAETKNA",
-
-        #"NVDB-Motortrafikled" - no specific
-        #"NVDB-Motorvag" - no specific
-
-        #"NVDB-Ovrigt_vagnamn"
-        "Namnsattande_organisation": "ORGANISAT",
-
-        #"NVDB-RekomVagFarligtGods",
-        "Rekommendation": "REKOMEND",
-
-        #"NVDB-Slitlager",
-        "Slitlagertyp": "Typ",
-
-        #"NVDB-Vagbredd",
-        "Bredd": "BREDD",
-        "Matmetod": "MÄTMETOD",
-
-        #"NVDB-Vagnummer",
-        "Europavag": "EUROPAVÄG",
-        "Huvudnummer": "HUVUDNR",
-        "Lanstillhorighet": "LÄN",
-        "Undernummer": "UNDERNR",
-
-        #"EVB-Driftbidrag_statligt",
-        "Vagnr": "VAGNR1",
-        "Vagdelsnr": "VAGDELSN1",
-        "Slitlager": "SLITLAG1",
-        "Trafikklass": "TRAFIKKL1",
-
-        #"VIS-Funktionellt_priovagnat",
-        "Fpv_klass": "FPVKLASS",
-
-        #"VIS-Omkorningsforbud" - no specific
-
-        #"VIS-Slitlager" - no specific
-
-        #"NVDB-Farthinder",
-        "Lage": "LAEGE",
-
-        #"NVDB-GCM_passage",
-        "Passagetyp": "PASSAGETYP",
-        "Refugpassage": "REFGPASAGE",
-        "Trafikanttyp": "TRAIKATTYP",
-
-        #"NVDB-Hojdhinder45dm"
-        "Hojdhindertyp": "Typ",
-        "Fri_hojd": "FRIHOJD",
-        "Hojdhinderidentitet": "HOJDID",
-
-        #"NVDB-Korsning"
-        "Generaliseringstyp": "GENRALSEYP",
-        "Ingar_i_trafikplats": "TRAIKPATER",
-        "Signalreglering": "SIGALRGLNG",
-        "Tpl_nummer": "TPLUNDRNER",
-
-        #"NVDB-Stopplikt" - no specific
-
-        #"NVDB-Vaghinder",
-        "HINDERTYP": "Hindertyp",
-        "PASSBREDD": "Passerbar_bredd",
-
-        #"NVDB-Vajningsplikt", - no specific
-
-        #"VIS-Jarnvagskorsning"
-        "PLAKORNIID": "Plankorsnings_id",
-        "JVGBANDEL": "Jvg_bandel",
-        "JVGILOETER": "Jvg_kilometer",
-        "JVGMETER": "Jvg_meter",
-        "ANTALSPAAR": "Antal_spar",
-        "VAEPROILEN": "Vagprofil_farligt_vagkron",
-        "VAEPROILVA": "Vagprofil_tvar_kurva",
-        "VAEPROILNG": "Vagprofil_brant_lutning",
-        "VAEGSKYDD": "Vagskydd",
-        "PORALHEJJD": "Portalhojd",
-        "TAAGFLOEDE": "Tagflode",
-        "KONAKTEDNG": "Kontaktledning",
-        "KORMAGSIIN": "Kort_magasin",
-        "SENSTANDAD": "Senast_andrad",
-
-        #"VIS-P_ficka"
-        "Bord_med_sittplatser": "BORMEDITER",
-        "Molok": "MOLOK",
-        "Placering": "PLACERING",
-        "Sopkarl": "SOPKAERL",
-        "Toalett": "TOALETT",
-        "Uppstallbar_langd": "UPPTAELBGD",
-
-        #"VIS-Rastplats"
-        "Alternativ_avkorningspunkt_x_koordinat": "ALTRNAIVAT",
-        "Alternativ_avkorningspunkt_y_koordinat": "ALTRNAIV15",
-        "Antal_markerade_parkeringsplatser_for_lastbil_slap": "ANTLMAKE21",
-        "Antal_markerade_parkeringsplatser_for_personbil": "ANTLMAKEIL",
-        "Avkorningspunkt_x_koordinat": "AVKERNNGAT",
-        "Avkorningspunkt_y_koordinat": "AVKERNNG13",
-        "Latrintomning": "LATINTEMNG",
-        "Lekutrustning": "LEKTRUTNNG",
-        "Ovrig_utrustning": "OEVIGURUNG",
-        "Rastplatsadress": "RASPLASASS",
-        "Rastplatsnamn": "RASPLASNMN",
-        "Restaurang": "RESTAURANG",
-        "Sakerhetsskydd": "SAEERHTSDD",
-        "Skotselansvarig": "SKOTSEANIG",
-        "Utpekad_lamplig_lastbilsparkeringsplats": "UTPKADAETS",
-
-        # Generic time intervals
-        "Tidsintervall__Dagslag": "DAGSL",
-        "Tidsintervall__Dagslag1": "DAGSL1",
-        "Tidsintervall__Dagslag2": "DAGSL2",
-        "Tidsintervall__Dagslag3": "DAGSL3",
-        "Tidsintervall__Klockslag__Sluttid__Minut": "MIN13",
-        "Tidsintervall__Klockslag__Sluttid__Minut11": "SLMIN11",
-        "Tidsintervall__Klockslag__Sluttid__Minut12": "SLMIN12",
-        "Tidsintervall__Klockslag__Sluttid__Minut21": "SLMIN21",
-        "Tidsintervall__Klockslag__Sluttid__Minut22": "SLMIN22",
-        "Tidsintervall__Klockslag__Sluttid__Minut31": "SLMIN31",
-        "Tidsintervall__Klockslag__Sluttid__Minut32": "SLMIN32",
-        "Tidsintervall__Klockslag__Sluttid__Timme": "TIM12",
-        "Tidsintervall__Klockslag__Sluttid__Timme11": "SLTIM11",
-        "Tidsintervall__Klockslag__Sluttid__Timme12": "SLTIM12",
-        "Tidsintervall__Klockslag__Sluttid__Timme21": "SLTIM21",
-        "Tidsintervall__Klockslag__Sluttid__Timme22": "SLTIM22",
-        "Tidsintervall__Klockslag__Sluttid__Timme31": "SLTIM31",
-        "Tidsintervall__Klockslag__Sluttid__Timme32": "SLTIM32",
-        "Tidsintervall__Klockslag__Starttid__Minut": "MINUT",
-        "Tidsintervall__Klockslag__Starttid__Minut11": "STMIN11",
-        "Tidsintervall__Klockslag__Starttid__Minut12": "STMIN12",
-        "Tidsintervall__Klockslag__Starttid__Minut21": "STMIN21",
-        "Tidsintervall__Klockslag__Starttid__Minut22": "STMIN22",
-        "Tidsintervall__Klockslag__Starttid__Minut31": "STMIN31",
-        "Tidsintervall__Klockslag__Starttid__Minut32": "STMIN32",
-        "Tidsintervall__Klockslag__Starttid__Timme": "TIMME",
-        "Tidsintervall__Klockslag__Starttid__Timme11": "STTIM11",
-        "Tidsintervall__Klockslag__Starttid__Timme12": "STTIM12",
-        "Tidsintervall__Klockslag__Starttid__Timme21": "STTIM21",
-        "Tidsintervall__Klockslag__Starttid__Timme22": "STTIM22",
-        "Tidsintervall__Klockslag__Starttid__Timme31": "STTIM31",
-        "Tidsintervall__Klockslag__Starttid__Timme32": "STTIM32",
-        "Tidsintervall__Slutdag": "SLUTDAG",
-        "Tidsintervall__Slutdag1": "SLDAG1",
-        "Tidsintervall__Slutdag2": "SLDAG2",
-        "Tidsintervall__Slutdag3": "SLDAG3",
-        "Tidsintervall__Slutdatum": "SLUTDATUM",
-        "Tidsintervall__Slutdatum1": "SLDAT1",
-        "Tidsintervall__Slutdatum2": "SLDAT2",
-        "Tidsintervall__Slutdatum3": "SLDAT3",
-        "Tidsintervall__Startdag": "STARTDAG",
-        "Tidsintervall__Startdag1": "STDAG1",
-        "Tidsintervall__Startdag2": "STDAG2",
-        "Tidsintervall__Startdag3": "STDAG3",
-        "Tidsintervall__Startdatum": "STARTDATUM",
-        "Tidsintervall__Startdatum1": "STDAT1",
-        "Tidsintervall__Startdatum2": "STDAT2",
-        "Tidsintervall__Startdatum3": "STDAT3"
-    }
-    for alt_key, key in alt_tag_names.items():
-        if alt_key in tags:
-            tags[key] = tags[alt_key]
-            _ = tags.pop(alt_key, None)
+    if row_count == 0:
+        return []
+    if not bool(tag_translations):
+        return make_rows(columns)
 
-    # replace NaN and NaT with None
-    for k, v in tags.items():
-        if pandas.isna(v):
-            tags[k] = None
+    columns = columns.copy()
+    if "Namn" in columns:
+        columns["Namn"] = _map_column_values(columns["Namn"], translate_name_value)
+
+    if "translator_function" in tag_translations or tag_translations.get("expect_unset_time_intervals", False):
+        memo = _TranslationMemo(tag_translations)
+        rows = [ memo.translate(tags) for tags in make_rows(columns) ]
+        _log.info(f"Translated {row_count} rows: {memo.misses} translated and memoized, {memo.hits} memo hits, {memo.uncached} not memoizable")
+        return rows
+
+    translated_columns = _apply_static_tag_translations_to_columns(columns, row_count, tag_translations)
+    if translated_columns is None:
+        # some key is translated differently depending on value
+        rows = make_rows(columns)
+        for tags in rows:
+            apply_static_tag_translations(tags, tag_translations)
+            convert_tag_number_types(tags)
+        return rows
+
+    for k, values in translated_columns.items():
+        translated_columns[k] = _map_column_values(values, convert_number_value)
+    return make_rows(translated_columns)
+
+
+# ALT_TAG_NAMES
+#
+# Tag name changes made by preprocess_tag_columns(), alternative name to the left
+#
+ALT_TAG_NAMES = {
+    # Note 2026-02-16: the script was made at the time NVDB had shape files with 10 character tag names,
+    # and then kept backwards compatible. This means many new tags are translated into old less readable
+    # tag names. Going forward, try to instead keeep the more readable names the default.
+
+
+    # common/generic tags
+    "ELEMENT_ID": "RLID",
+    "VALID_FROM": "FRAN_DATUM",
+    "VALID_TO": "TILL_DATUM",
+    "START_MEASURE": "STARTAVST",
+    "END_MEASURE": "SLUTAVST",
+    "MEASURE": "AVST",
+    "EXTENT_LENGTH": "SHAPE_LEN",
+
+    "DIRECTION": "Riktning",
+    "RIKTNING": "Riktning",
+    "SIDE": "SIDA",
+    "TYP": "Typ",
+    "ROLE": "LANKROLL",
+    "Lankroll": "LANKROLL",
+    "SEQ_NO": "SEQ_NO",
+    "NAMN": "Namn",
+    "BETECKNING": "Beteckning",
+    "Galler_genomfart": "GENOMFART",
+    "XKOORDINAT": "X_koordinat",
+    "YKOORDINAT": "Y_koordinat",
+    "Ordningsnummer": "ORDNING",
+    "Vard": "VARDVAG",
+
+    # Antal_korfalt2
+    "Korfalt_i_vagens_bakriktning": "KOEFAETING",
+    "Korfalt_i_vagens_framriktning": "KOEFAETIN1",
+    "Korfaltsantal": "KOEFAETSAL",
+
+    # Barighet
+    "Barighetsklass": "BAEIGHTSSS",
+    "Barighetsklass_vinterperiod": "BAEIGHTSOD",
+    "Slutdatum_sommarperiod": "SLUDATMSOD",
+    "Slutdatum_vinterperiod": "SLUDATMVOD",
+    "Startdatum_sommarperiod": "STATDAUMOD",
+    "Startdatum_vinterperiod": "STATDAUMO3",
+
+    # BegrAxelBoggiTryck
+    "Axel_boggitrycks_begransning__Hogsta_tillatna_tryck1": "TRYCK1",
+    "Axel_boggitrycks_begransning__Hogsta_tillatna_tryck2": "TRYCK2",
+    "Axel_boggitrycks_begransning__Hogsta_tillatna_tryck3": "TRYCK3",
+    "Axel_boggitrycks_begransning__Tidsintervall__Dagslag11": "DAGSL11",
+    "Axel_boggitrycks_begransning__Tidsintervall__Dagslag21": "DAGSL21",
+    "Axel_boggitrycks_begransning__Tidsintervall__Dagslag31": "DAGSL31",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Minut111": "SLMIN111",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Minut112": "SLMIN112",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Minut211": "SLMIN211",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Minut212": "SLMIN212",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Minut311": "SLMIN311",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Minut312": "SLMIN312",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Timme111": "SLTIM111",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Timme112": "SLTIM112",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Timme211": "SLTIM211",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Timme212": "SLTIM212",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Timme311": "SLTIM311",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Sluttid__Timme312": "SLTIM312",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Minut111": "STMIN111",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Minut112": "STMIN112",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Minut211": "STMIN211",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Minut212": "STMIN212",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Minut311": "STMIN311",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Minut312": "STMIN312",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Timme111": "STTIM111",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Timme112": "STTIM112",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Timme211": "STTIM211",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Timme212": "STTIM212",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Timme311": "STTIM311",
+    "Axel_boggitrycks_begransning__Tidsintervall__Klockslag__Starttid__Timme312": "STTIM312",
+    "Axel_boggitrycks_begransning__Tidsintervall__Slutdag11": "SLDAG11",
+    "Axel_boggitrycks_begransning__Tidsintervall__Slutdag21": "SLDAG21",
+    "Axel_boggitrycks_begransning__Tidsintervall__Slutdag31": "SLDAG31",
+    "Axel_boggitrycks_begransning__Tidsintervall__Slutdatum11": "SLDAT11",
+    "Axel_boggitrycks_begransning__Tidsintervall__Slutdatum21": "SLDAT21",
+    "Axel_boggitrycks_begransning__Tidsintervall__Slutdatum31": "SLDAT31",
+    "Axel_boggitrycks_begransning__Tidsintervall__Startdag11": "STDAG11",
+    "Axel_boggitrycks_begransning__Tidsintervall__Startdag21": "STDAG21",
+    "Axel_boggitrycks_begransning__Tidsintervall__Startdag31": "STDAG31",
+    "Axel_boggitrycks_begransning__Tidsintervall__Startdatum11": "STDAT11",
+    "Axel_boggitrycks_begransning__Tidsintervall__Startdatum21": "STDAT21",
+    "Axel_boggitrycks_begransning__Tidsintervall__Startdatum31": "STDAT31",
+    "Axel_boggitrycks_begransning__Typ_av_tryck1": "TYPTRYCK1",
+    "Axel_boggitrycks_begransning__Typ_av_tryck2": "TYPTRYCK2",
+    "Axel_boggitrycks_begransning__Typ_av_tryck3": "TYPTRYCK3",
+    "Beteckning__Artal": "AARTAL1",
+    "Beteckning__Lopnummer": "LOEPNUMME1",
+    "Beteckning__Organisationskod": "ORGNISTI1",
+    "Foreskrift_som_upphor__Artal": "AARTAL2",
+    "Foreskrift_som_upphor__Lopnummer": "LOEPNUMME2",
+    "Foreskrift_som_upphor__Organisationskod": "ORGNISTI2",
+    "Galler_inte_fordon_trafikant": "FORDTRAF",
+
+    # BegrBruttovikt
+    "Avser_aven_fordonstag": "FORD_TAG",
+    #"Galler_inte_fordon_trafikant": "FORDTRAF",
+    "Hogsta_tillatna_bruttovikt": "BRUTTOVIKT",
+
+    #"NVDB-BegrFordBredd"
+    "Galler_inte_fordon_trafikant1": "FORDTRAF1",
+    "Galler_inte_fordon_trafikant2": "FORDTRAF2",
+    "Galler_inte_fordon_trafikant3": "FORDTRAF3",
+    "Hogsta_tillatna_fordonsbredd": "FORD_BREDD",
+
+    #"NVDB-BegrFordLangd"
+    #"Galler_inte_fordon_trafikant1": "FORDTRAF1",
+    #"Galler_inte_fordon_trafikant2": "FORDTRAF2",
+    #"Galler_inte_fordon_trafikant3": "FORDTRAF3",
+    "Hogsta_tillatna_fordonslangd": "FORD_LGD",
+
+    #"NVDB-Bro_och_tunnel"
+    "Identitet": "IDENTITET",
+    "Konstruktion": "KONTRUTION",
+    "Langd": "LAENGD",
+    "Oppningsbar": "OEPNINSBAR",
+
+    #"NVDB-Cirkulationsplats" - no specific tags
+
+    #"NVDB-CykelVgsKat"
+    "Forbindelsekategori": "FOEBINELRI",
+
+    #"NVDB-Farjeled"
+    "Farjeledsnamn": "LEDSNAMN",
+
+    #"NVDB-ForbjudenFardriktning" - no specific tags
+
+    # ForbudTrafik
+    "Beskrivning": "BESKRGFART",
+    "Galler_ej__Beskrivning1": "BSEKR_GEJ1",
+    "Galler_ej__Fordon_trafikant11": "FORDTRA11",
+    "Galler_ej__Fordon_trafikant110": "FORDTRA110",
+    "Galler_ej__Fordon_trafikant12": "FORDTRA12",
+    "Galler_ej__Fordon_trafikant13": "FORDTRA13",
+    "Galler_ej__Fordon_trafikant14": "FORDTRA14",
+    "Galler_ej__Fordon_trafikant15": "FORDTRA15",
+    "Galler_ej__Fordon_trafikant16": "FORDTRA16",
+    "Galler_ej__Fordon_trafikant17": "FORDTRA17",
+    "Galler_ej__Fordon_trafikant18": "FORDTRA18",
+    "Galler_ej__Fordon_trafikant19": "FORDTRA19",
+    "Galler_ej__Verksamhet11": "VERKSAMH11",
+    "Galler_ej__Verksamhet12": "VERKSAMH12",
+    "Galler_ej__Verksamhet13": "VERKSAMH13",
+    "Galler_ej__Verksamhet14": "VERKSAMH14",
+    "Galler_ej__Verksamhet15": "VERKSAMH15",
+    "Galler_ej__Verksamhet16": "VERKSAMH16",
+    "Galler_ej__Verksamhet17": "VERKSAMH17",
+    "Galler_fordon1": "FORDTYP1",
+    "Galler_fordon2": "FORDTYP2",
+    "Galler_fordon3": "FORDTYP3",
+    "Totalvikt": "TOTALVIKT",
+    "Galler_ej__Tidsintervall__Dagslag11": "GEDAGSL11",
+    "Galler_ej__Tidsintervall__Dagslag12": "GEDAGSL12",
+    "Galler_ej__Tidsintervall__Klockslag__Sluttid__Minut111": "GESLMIN111",
+    "Galler_ej__Tidsintervall__Klockslag__Sluttid__Minut112": "GESLMIN112",
+    "Galler_ej__Tidsintervall__Klockslag__Sluttid__Minut121": "GESLMIN121",
+    "Galler_ej__Tidsintervall__Klockslag__Sluttid__Minut122": "GESLMIN122",
+    "Galler_ej__Tidsintervall__Klockslag__Sluttid__Timme111": "GESLTIM111",
+    "Galler_ej__Tidsintervall__Klockslag__Sluttid__Timme112": "GESLTIM112",
+    "Galler_ej__Tidsintervall__Klockslag__Sluttid__Timme121": "GESLTIM121",
+    "Galler_ej__Tidsintervall__Klockslag__Sluttid__Timme122": "GESLTIM122",
+    "Galler_ej__Tidsintervall__Klockslag__Starttid__Minut111": "GESTMIN111",
+    "Galler_ej__Tidsintervall__Klockslag__Starttid__Minut112": "GESTMIN112",
+    "Galler_ej__Tidsintervall__Klockslag__Starttid__Minut121": "GESTMIN121",
+    "Galler_ej__Tidsintervall__Klockslag__Starttid__Minut122": "GESTMIN122",
+    "Galler_ej__Tidsintervall__Klockslag__Starttid__Timme111": "GESTTIM111",
+    "Galler_ej__Tidsintervall__Klockslag__Starttid__Timme112": "GESTTIM112",
+    "Galler_ej__Tidsintervall__Klockslag__Starttid__Timme121": "GESTTIM121",
+    "Galler_ej__Tidsintervall__Klockslag__Starttid__Timme122": "GESTTIM122",
+    "Galler_ej__Tidsintervall__Slutdag11": "GESLDAG11",
+    "Galler_ej__Tidsintervall__Slutdag12": "GESLDAG12",
+    "Galler_ej__Tidsintervall__Slutdatum11": "GESLDAT11",
+    "Galler_ej__Tidsintervall__Slutdatum12": "GESLDAT12",
+    "Galler_ej__Tidsintervall__Startdag11": "GESTDAG11",
+    "Galler_ej__Tidsintervall__Startdag12": "GESTDAG12",
+    "Galler_ej__Tidsintervall__Startdatum11": "GESTDAT11",
+    "Galler_ej__Tidsintervall__Startdatum12": "GESTDAT12",
+
+    # "NVDB-FunkVagklass"
+    "KLASS": "Klass",
+
+    #"NVDB-Gagata" - no specific
+    #"NVDB-Gangfartsomrade" - no specific
+    #"NVDB-Gatunamn" - no specific
+
+    #"NVDB-GCM_belyst" - no specific
+
+    #"NVDB-GCM_separation",
+    "Separation": "SEPARATION",
+
+    #"NVDB-GCM_vagtyp"
+    "Gcm_typ": "GCMTYP",
+
+    #"NVDB-Hastighetsgrans"
+    "Avvikande_hastighet__Fordonstyp11": "FORDTYP11",
+    "Avvikande_hastighet__Fordonstyp12": "FORDTYP12",
+    "Avvikande_hastighet__Fordonstyp13": "FORDTYP13",
+    "Avvikande_hastighet__Galler_inte_endast1": "HAVGIE1",
+    "Avvikande_hastighet__Hogsta_tillatna_hastighet1": "HAVHAST1",
+    "Avvikande_hastighet__Tidsintervall__Dagslag11": "DAGSL11",
+    "Avvikande_hastighet__Tidsintervall__Dagslag12": "DAGSL12",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Minut111": "SLMIN111",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Minut112": "SLMIN112",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Minut121": "SLMIN121",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Minut122": "SLMIN122",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Timme111": "SLTIM111",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Timme112": "SLTIM112",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Timme121": "SLTIM121",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Sluttid__Timme122": "SLTIM122",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Minut111": "STMIN111",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Minut112": "STMIN112",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Minut121": "STMIN121",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Minut122": "STMIN122",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Timme111": "STTIM111",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Timme112": "STTIM112",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Timme121": "STTIM121",
+    "Avvikande_hastighet__Tidsintervall__Klockslag__Starttid__Timme122": "STTIM122",
+    "Avvikande_hastighet__Tidsintervall__Slutdag11": "SLDAG11",
+    "Avvikande_hastighet__Tidsintervall__Slutdag12": "SLDAG12",
+    "Avvikande_hastighet__Tidsintervall__Slutdatum11": "SLDAT11",
+    "Avvikande_hastighet__Tidsintervall__Slutdatum12": "SLDAT12",
+    "Avvikande_hastighet__Tidsintervall__Startdag11": "STDAG11",
+    "Avvikande_hastighet__Tidsintervall__Startdag12": "STDAG12",
+    "Avvikande_hastighet__Tidsintervall__Startdatum11": "STDAT11",
+    "Avvikande_hastighet__Tidsintervall__Startdatum12": "STDAT12",
+    "Avvikande_hastighet__Totalvikt1": "TOTALVIKT1",
+    "Hogsta_tillatna_hastighet": "HTHAST",
+
+    #"NVDB-Huvudled" - no specific
+
+    #"NVDB-InskrTranspFarligtGods",
+    "Far_inte_foras_stannas_parkeras": "FARINTE",
+    "Galler_inte_fordon1": "FORDTYP1",
+    "Galler_inte_fordon2": "FORDTYP2",
+    "Galler_inte_fordon3": "FORDTYP3",
+    "Galler_inte_fordon4": "FORDTYP4",
+    "Galler_inte_fordon5": "FORDTYP5",
+    "Galler_inte_fordon_som_anvands_for__Galler_inte_fordon_trafikant11": "FORDTRAF11",
+    "Galler_inte_fordon_som_anvands_for__Galler_inte_fordon_trafikant12": "FORDTRAF12",
+    "Galler_inte_fordon_som_anvands_for__Galler_inte_fordon_trafikant13": "FORDTRAF13",
+    "Galler_inte_fordon_som_anvands_for__Plats_for_verksamhet1": "PLATS1",
+    "Galler_inte_fordon_som_anvands_for__Verksamhet11": "VERKSAMH11",
+    "Galler_inte_fordon_som_anvands_for__Verksamhet12": "VERKSAMH12",
+    "Galler_inte_fordon_som_anvands_for__Verksamhet13": "VERKSAMH13",
+
+    #"NVDB-Kollektivkorfalt"
+    "Korfalt_korbana": "KOEFAETKNA",
+
+    #"NVDB-Motortrafikled" - no specific
+    #"NVDB-Motorvag" - no specific
+
+    #"NVDB-Ovrigt_vagnamn"
+    "Namnsattande_organisation": "ORGANISAT",
+
+    #"NVDB-RekomVagFarligtGods",
+    "Rekommendation": "REKOMEND",
+
+    #"NVDB-Slitlager",
+    "Slitlagertyp": "Typ",
+
+    #"NVDB-Vagbredd",
+    "Bredd": "BREDD",
+    "Matmetod": "MÄTMETOD",
+
+    #"NVDB-Vagnummer",
+    "Europavag": "EUROPAVÄG",
+    "Huvudnummer": "HUVUDNR",
+    "Lanstillhorighet": "LÄN",
+    "Undernummer": "UNDERNR",
+
+    #"EVB-Driftbidrag_statligt",
+    "Vagnr": "VAGNR1",
+    "Vagdelsnr": "VAGDELSN1",
+    "Slitlager": "SLITLAG1",
+    "Trafikklass": "TRAFIKKL1",
+
+    #"VIS-Funktionellt_priovagnat",
+    "Fpv_klass": "FPVKLASS",
+
+    #"VIS-Omkorningsforbud" - no specific
+
+    #"VIS-Slitlager" - no specific
+
+    #"NVDB-Farthinder",
+    "Lage": "LAEGE",
+
+    #"NVDB-GCM_passage",
+    "Passagetyp": "PASSAGETYP",
+    "Refugpassage": "REFGPASAGE",
+    "Trafikanttyp": "TRAIKATTYP",
+
+    #"NVDB-Hojdhinder45dm"
+    "Hojdhindertyp": "Typ",
+    "Fri_hojd": "FRIHOJD",
+    "Hojdhinderidentitet": "HOJDID",
+
+    #"NVDB-Korsning"
+    "Generaliseringstyp": "GENRALSEYP",
+    "Ingar_i_trafikplats": "TRAIKPATER",
+    "Signalreglering": "SIGALRGLNG",
+    "Tpl_nummer": "TPLUNDRNER",
+
+    #"NVDB-Stopplikt" - no specific
+
+    #"NVDB-Vaghinder",
+    "HINDERTYP": "Hindertyp",
+    "PASSBREDD": "Passerbar_bredd",
+
+    #"NVDB-Vajningsplikt", - no specific
+
+    #"VIS-Jarnvagskorsning"
+    "PLAKORNIID": "Plankorsnings_id",
+    "JVGBANDEL": "Jvg_bandel",
+    "JVGILOETER": "Jvg_kilometer",
+    "JVGMETER": "Jvg_meter",
+    "ANTALSPAAR": "Antal_spar",
+    "VAEPROILEN": "Vagprofil_farligt_vagkron",
+    "VAEPROILVA": "Vagprofil_tvar_kurva",
+    "VAEPROILNG": "Vagprofil_brant_lutning",
+    "VAEGSKYDD": "Vagskydd",
+    "PORALHEJJD": "Portalhojd",
+    "TAAGFLOEDE": "Tagflode",
+    "KONAKTEDNG": "Kontaktledning",
+    "KORMAGSIIN": "Kort_magasin",
+    "SENSTANDAD": "Senast_andrad",
+
+    #"VIS-P_ficka"
+    "Bord_med_sittplatser": "BORMEDITER",
+    "Molok": "MOLOK",
+    "Placering": "PLACERING",
+    "Sopkarl": "SOPKAERL",
+    "Toalett": "TOALETT",
+    "Uppstallbar_langd": "UPPTAELBGD",
+
+    #"VIS-Rastplats"
+    "Alternativ_avkorningspunkt_x_koordinat": "ALTRNAIVAT",
+    "Alternativ_avkorningspunkt_y_koordinat": "ALTRNAIV15",
+    "Antal_markerade_parkeringsplatser_for_lastbil_slap": "ANTLMAKE21",
+    "Antal_markerade_parkeringsplatser_for_personbil": "ANTLMAKEIL",
+    "Avkorningspunkt_x_koordinat": "AVKERNNGAT",
+    "Avkorningspunkt_y_koordinat": "AVKERNNG13",
+    "Latrintomning": "LATINTEMNG",
+    "Lekutrustning": "LEKTRUTNNG",
+    "Ovrig_utrustning": "OEVIGURUNG",
+    "Rastplatsadress": "RASPLASASS",
+    "Rastplatsnamn": "RASPLASNMN",
+    "Restaurang": "RESTAURANG",
+    "Sakerhetsskydd": "SAEERHTSDD",
+    "Skotselansvarig": "SKOTSEANIG",
+    "Utpekad_lamplig_lastbilsparkeringsplats": "UTPKADAETS",
+
+    # Generic time intervals
+    "Tidsintervall__Dagslag": "DAGSL",
+    "Tidsintervall__Dagslag1": "DAGSL1",
+    "Tidsintervall__Dagslag2": "DAGSL2",
+    "Tidsintervall__Dagslag3": "DAGSL3",
+    "Tidsintervall__Klockslag__Sluttid__Minut": "MIN13",
+    "Tidsintervall__Klockslag__Sluttid__Minut11": "SLMIN11",
+    "Tidsintervall__Klockslag__Sluttid__Minut12": "SLMIN12",
+    "Tidsintervall__Klockslag__Sluttid__Minut21": "SLMIN21",
+    "Tidsintervall__Klockslag__Sluttid__Minut22": "SLMIN22",
+    "Tidsintervall__Klockslag__Sluttid__Minut31": "SLMIN31",
+    "Tidsintervall__Klockslag__Sluttid__Minut32": "SLMIN32",
+    "Tidsintervall__Klockslag__Sluttid__Timme": "TIM12",
+    "Tidsintervall__Klockslag__Sluttid__Timme11": "SLTIM11",
+    "Tidsintervall__Klockslag__Sluttid__Timme12": "SLTIM12",
+    "Tidsintervall__Klockslag__Sluttid__Timme21": "SLTIM21",
+    "Tidsintervall__Klockslag__Sluttid__Timme22": "SLTIM22",
+    "Tidsintervall__Klockslag__Sluttid__Timme31": "SLTIM31",
+    "Tidsintervall__Klockslag__Sluttid__Timme32": "SLTIM32",
+    "Tidsintervall__Klockslag__Starttid__Minut": "MINUT",
+    "Tidsintervall__Klockslag__Starttid__Minut11": "STMIN11",
+    "Tidsintervall__Klockslag__Starttid__Minut12": "STMIN12",
+    "Tidsintervall__Klockslag__Starttid__Minut21": "STMIN21",
+    "Tidsintervall__Klockslag__Starttid__Minut22": "STMIN22",
+    "Tidsintervall__Klockslag__Starttid__Minut31": "STMIN31",
+    "Tidsintervall__Klockslag__Starttid__Minut32": "STMIN32",
+    "Tidsintervall__Klockslag__Starttid__Timme": "TIMME",
+    "Tidsintervall__Klockslag__Starttid__Timme11": "STTIM11",
+    "Tidsintervall__Klockslag__Starttid__Timme12": "STTIM12",
+    "Tidsintervall__Klockslag__Starttid__Timme21": "STTIM21",
+    "Tidsintervall__Klockslag__Starttid__Timme22": "STTIM22",
+    "Tidsintervall__Klockslag__Starttid__Timme31": "STTIM31",
+    "Tidsintervall__Klockslag__Starttid__Timme32": "STTIM32",
+    "Tidsintervall__Slutdag": "SLUTDAG",
+    "Tidsintervall__Slutdag1": "SLDAG1",
+    "Tidsintervall__Slutdag2": "SLDAG2",
+    "Tidsintervall__Slutdag3": "SLDAG3",
+    "Tidsintervall__Slutdatum": "SLUTDATUM",
+    "Tidsintervall__Slutdatum1": "SLDAT1",
+    "Tidsintervall__Slutdatum2": "SLDAT2",
+    "Tidsintervall__Slutdatum3": "SLDAT3",
+    "Tidsintervall__Startdag": "STARTDAG",
+    "Tidsintervall__Startdag1": "STDAG1",
+    "Tidsintervall__Startdag2": "STDAG2",
+    "Tidsintervall__Startdag3": "STDAG3",
+    "Tidsintervall__Startdatum": "STARTDATUM",
+    "Tidsintervall__Startdatum1": "STDAT1",
+    "Tidsintervall__Startdatum2": "STDAT2",
+    "Tidsintervall__Startdatum3": "STDAT3"
+}
 
 #
 # Table for tag translations.
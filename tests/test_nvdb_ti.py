@@ -0,0 +1,91 @@
+import copy
+import logging
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("sortedcontainers")
+
+# pylint: disable=wrong-import-position
+import nvdb_ti
+from nvdb_ti import parse_time_interval_tags
+
+# hm()
+#
+# Hour/minute columns of interval 's', hour range 'idx'
+#
+def hm(s, sh, smin, eh, emin, idx="1", prefix=""):
+    return { f"{prefix}STTIM{s}{idx}": sh, f"{prefix}STMIN{s}{idx}": smin, f"{prefix}SLTIM{s}{idx}": eh, f"{prefix}SLMIN{s}{idx}": emin }
+
+# group()
+#
+# All columns of interval 's' with not used values, except those given as keyword arguments
+#
+def group(s, prefix="", **kw):
+    cols = { f"{prefix}DAGSL{s}": None, f"{prefix}STDAG{s}": None, f"{prefix}SLDAG{s}": None,
+             f"{prefix}STDAT{s}": "1899-12-29", f"{prefix}SLDAT{s}": "1899-12-29" }
+    cols.update(hm(s, -1, -1, -1, -1, "1", prefix))
+    cols.update(hm(s, -1, -1, -1, -1, "2", prefix))
+    for k, v in kw.items():
+        cols[prefix + k + s] = v
+    return cols
+
+# Inputs and outputs of the string based implementation that the rule model replaced, the
+# rendered values must be the same.
+CASES = [
+    ({ **group("1"), **hm("1", 7, 0, 16, 0) }, "07:00-16:00"),
+    ({ **group("1"), **hm("1", 7, 0, 9, 0), **hm("1", 15, 0, 18, 30, "2") }, "07:00-09:00,15:00-18:30"),
+    ({ **group("1", DAGSL="vardag"), **hm("1", 8, 0, 18, 0) }, "Mo-Sa 08:00-18:00; PH off"),
+    ({ **group("1", DAGSL=2), **hm("1", 8, 0, 18, 0) }, "Sa 08:00-18:00; PH -1 day 08:00-18:00; PH off"),
+    ({ **group("1", DAGSL="vardag utom dag före sön- och helgdag"), **hm("1", 8, 0, 18, 0) }, "Mo-Fr 08:00-18:00; PH -1 day off; PH off"),
+    ({ **group("1", DAGSL=4), **hm("1", 8, 0, 18, 0) }, "Su 08:00-18:00; PH 08:00-18:00"),
+    ({ **group("1", STDAG="måndag", SLDAG="fredag"), **hm("1", 8, 0, 18, 0) }, "Mo-Fr 08:00-18:00"),
+    ({ **group("1", STDAG="lördag"), **hm("1", 8, 0, 18, 0) }, "Sa 08:00-18:00"),
+    ({ **group("1", SLDAG=7.0), **hm("1", 8, 0, 18, 0) }, "Su 08:00-18:00"),
+    ({ **group("1", STDAG=1, SLDAG=5, DAGSL=3), **hm("1", 8, 0, 18, 0) }, "Mo-Fr 08:00-18:00; PH -1 day off; PH off"),
+    ({ **group("1", STDAG="måndag", SLDAG="onsdag", DAGSL="vardag"), **hm("1", 8, 0, 18, 0) }, "Mo-We 08:00-18:00; PH off"),
+    ({ **group("1", STDAT="1899-06-01", SLDAT="1899/08/31 00:00:00"), **hm("1", 8, 0, 18, 0) }, "Jun 1-Aug 31 08:00-18:00"),
+    ({ **group("1", DAGSL="vardag") }, "Mo-Sa 00:00-24:00; PH off"),
+    ({ **group("1", DAGSL="vardag"), **hm("1", 8, 0, 12, 0), **group("2", DAGSL="sön- och helgdag"), **hm("2", 10, 0, 14, 0) }, "Mo-Sa 08:00-12:00; Su 10:00-14:00; PH 10:00-14:00"),
+    ({ **group("1", DAGSL=2), **hm("1", 8, 0, 12, 0), **group("2", DAGSL=4), **hm("2", 10, 0, 14, 0) }, "Sa 08:00-12:00; PH -1 day 08:00-12:00; Su 10:00-14:00; PH 10:00-14:00"),
+    ({ **group("1", DAGSL=3), **hm("1", 8, 0, 12, 0), **group("2", DAGSL=2), **hm("2", 8, 0, 13, 0) }, "Mo-Fr 08:00-12:00; Sa 08:00-13:00; PH -1 day 08:00-13:00; PH off"),
+    ({ **group("1", STDAT="1899-11-01", SLDAT="1899-03-31"), **hm("1", 22, 0, 6, 0), **group("2", DAGSL=1) }, "Nov 1-Mar 31 22:00-06:00; Mo-Sa 00:00-24:00; PH off"),
+    ({ **group("1", DAGSL=1), **group("2", STDAT="1899-11-01", SLDAT="1899-03-31"), **hm("2", 22, 0, 6, 0) }, "Nov 1-Mar 31 22:00-06:00; Mo-Sa 00:00-24:00; PH off"),
+    ({ **group("1", DAGSL="vardag"), **hm("1", 8, 0, 16, 0), **group("1", "GE"), **hm("1", 9, 0, 11, 0, "1", "GE") }, { "/": "Mo-Sa 08:00-16:00; PH off", "GE/": "09:00-11:00" }),
+    ({ **group("1"), **hm("1", 0, 0, 24, 0) }, None),
+    ({ **group("1"), "STTIM11": 8, "SLTIM11": 9, "SLMIN11": 0 }, -1),
+    ({ **group("1", DAGSL=9), **hm("1", 8, 0, 16, 0) }, -1),
+    ({ **group("1", STDAG="måndag", DAGSL=4), **hm("1", 8, 0, 16, 0) }, -1),
+    ({ **group("1"), **hm("1", 8, 0, 16, 0, "2") }, -1),
+]
+
+@pytest.mark.parametrize("columns,expected", CASES)
+def test_same_as_string_implementation(columns, expected):
+    logging.disable(logging.CRITICAL)
+    try:
+        tags = { "RLID": "1000:1", "other": 5, **copy.deepcopy(columns) }
+        assert parse_time_interval_tags(tags) == expected
+        if expected != -1:
+            assert tags == { "RLID": "1000:1", "other": 5 }
+    finally:
+        logging.disable(logging.NOTSET)
+
+# these used to raise TypeError when formatting the simplified value
+def test_simplification():
+    tags = { "RLID": "1", **group("1", DAGSL="vardag"), **hm("1", 8, 0, 16, 0), **group("2", DAGSL=4), **hm("2", 8, 0, 16, 0) }
+    assert parse_time_interval_tags(tags) == "08:00-16:00"
+    tags = { "RLID": "1", **group("1", DAGSL=3), **hm("1", 8, 0, 12, 0), **group("2", DAGSL=2), **hm("2", 8, 0, 12, 0) }
+    assert parse_time_interval_tags(tags) == "Mo-Sa 08:00-12:00; PH -1 day 08:00-12:00; PH off"
+
+def test_cached_result_restores_recorded_strings():
+    columns = { **group("1", DAGSL="vardag", STDAT="1899-05-01", SLDAT="1899-09-30"), **hm("1", 6, 0, 9, 0),
+                **group("1", "GE"), **hm("1", 9, 0, 11, 0, "1", "GE") }
+    nvdb_ti.time_interval_strings.clear()
+    first = parse_time_interval_tags({ "RLID": "1", **copy.deepcopy(columns) })
+    recorded = set(nvdb_ti.time_interval_strings)
+    assert len(recorded) > 0
+    first["/"] = "modified"
+    nvdb_ti.time_interval_strings.clear()
+    second = parse_time_interval_tags({ "RLID": "2", **copy.deepcopy(columns) })
+    assert second == { "/": "May 1-Sep 30 Mo-Sa 06:00-09:00; PH off", "GE/": "09:00-11:00" }
+    assert nvdb_ti.time_interval_strings == recorded
@@ -0,0 +1,93 @@
+import logging
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("shapely")
+pytest.importorskip("pyproj")
+
+# pylint: disable=wrong-import-position
+from geometry_basics import Point
+from nvdb_segment import NvdbSegment
+from proj_xy import latlon_str
+import process_and_resolve
+from process_and_resolve import find_overlapping_and_remove_duplicates
+
+# _reference_dedup()
+#
+# The straightforward implementation that the hashed and numpy based one replaced: keep the
+# first of segments with equal RLID, geometry and tags, and log the first point pair of each
+# kept segment that an earlier kept segment has in the same direction.
+#
+def _reference_dedup(data_src_name, ways):
+    kept = []
+    messages = []
+    pointpairs = {}
+    overlap = False
+    for way in ways:
+        if any(way.rlid == w.rlid and way.way == w.way and way.tags == w.tags for w in kept):
+            continue
+        kept.append(way)
+        if isinstance(way.way, list) and data_src_name not in ("NVDB-Hastighetsgrans", "NVDB-Vagnummer"):
+            for prev, p in zip(way.way, way.way[1:]):
+                pp = (p, prev)
+                if pp not in pointpairs:
+                    pointpairs[pp] = way
+                else:
+                    way2 = pointpairs[pp]
+                    messages += [ f"Self-overlapping segment between {latlon_str(pp[0])}-{latlon_str(pp[1])}:",
+                                  f"  Segment 1: {way} tags={way.tags} ({len(way.way)} points, index {way.way_id})",
+                                  f"  Segment 2: {way2} tags={way2.tags} ({len(way2.way)} points, index {way2.way_id})" ]
+                    overlap = True
+                    break
+    if len(kept) < len(ways):
+        messages.append(f"{data_src_name} has duplicate elements. Only one copy of each was kept")
+    if overlap:
+        messages.append(f"{data_src_name} has overlapping segments.")
+    return kept, messages
+
+def _point(p):
+    point = Point(p.x, p.y)
+    point.dist = p.dist
+    return point
+
+def _random_layer(rnd):
+    grid = [ Point(600000.0 + rnd.randint(0, 6), 6600000.0 + rnd.randint(0, 3)) for _ in range(12) ]
+    for i, p in enumerate(grid):
+        p.dist = float(i)
+    ways = []
+    for way_id in range(rnd.randint(0, 25)):
+        if ways and rnd.random() < 0.25:
+            # copy of an earlier segment with new objects, sometimes with a changed tag
+            w = ways[rnd.randrange(len(ways))]
+            tags = w.mutable_tags()
+            if rnd.random() < 0.2:
+                tags["k"] = [ 1 ]
+            geometry = [ _point(p) for p in w.way ] if isinstance(w.way, list) else _point(w.way)
+            rlid = w.rlid
+        else:
+            if rnd.random() < 0.9:
+                geometry = [ rnd.choice(grid) for _ in range(rnd.randint(2, 5)) ]
+            else:
+                geometry = rnd.choice(grid)
+            rlid = rnd.choice("ab")
+            tags = { "STARTAVST": rnd.choice([0, 0.5]), "k": rnd.choice([1, [1], (1,), "x"]) }
+        seg = NvdbSegment({ "RLID": rlid, "geometry": geometry, **tags })
+        seg.way_id = way_id
+        ways.append(seg)
+    return ways
+
+# Duplicates are found with a hashed key and overlaps with sorted point pairs, check that the
+# kept segments and the log output are the same as with the straightforward implementation.
+def test_dedup_matches_reference(caplog):
+    rnd = random.Random(3)
+    caplog.set_level(logging.INFO, logger=process_and_resolve._log.name)
+    for _ in range(300):
+        ways = _random_layer(rnd)
+        data_src_name = rnd.choice([ "NVDB-Test", "NVDB-Hastighetsgrans" ])
+        expected_ways, expected_messages = _reference_dedup(data_src_name, ways)
+        caplog.clear()
+        result = find_overlapping_and_remove_duplicates(data_src_name, ways)
+        assert [ id(w) for w in result ] == [ id(w) for w in expected_ways ]
+        assert [ r.getMessage() for r in caplog.records ] == expected_messages
@@ -0,0 +1,36 @@
+import logging
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("sortedcontainers")
+
+# pylint: disable=wrong-import-position
+import tag_translations
+from tag_translations import TAG_TRANSLATIONS, _TranslationMemo
+
+def _separation_row(rlid, sida, separation="kantsten"):
+    return { "RLID": rlid, "SIDA": sida, "SEPARATION": separation }
+
+# Memoized translations must give the same tags as translating each row, and messages naming
+# the RLID must still be logged once per row.
+def test_memo_logs_row_messages_for_each_row(caplog):
+    caplog.set_level(logging.INFO, logger=tag_translations._log.name)
+    memo = _TranslationMemo(TAG_TRANSLATIONS["NVDB-GCM_separation"])
+    rows = [ _separation_row(f"R{i}", sida) for sida in [ "Höger", "Mitt" ] for i in range(3) ]
+    results = [ memo.translate(dict(row)) for row in rows ]
+    for row, result in zip(rows, results):
+        assert result["RLID"] == row["RLID"]
+        assert result == _TranslationMemo(TAG_TRANSLATIONS["NVDB-GCM_separation"]).translate(dict(row))
+    messages = [ r.getMessage() for r in caplog.records ]
+    for i in range(3):
+        assert sum(f"(RLID R{i})" in m for m in messages) == 2
+    assert memo.hits == 2 and memo.misses == 1 and memo.uncached == 3
+
+# When the message is below the log level the translation is memoized as usual
+def test_memo_caches_rows_when_row_messages_are_not_logged(caplog):
+    caplog.set_level(logging.WARNING, logger=tag_translations._log.name)
+    memo = _TranslationMemo(TAG_TRANSLATIONS["NVDB-GCM_separation"])
+    for i in range(3):
+        memo.translate(_separation_row(f"R{i}", "Mitt"))
+    assert memo.hits == 2 and memo.misses == 1 and memo.uncached == 0
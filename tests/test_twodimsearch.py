@@ -0,0 +1,63 @@
+import random
+
+from twodimsearch import TwoDimSearch, GridTwoDimSearch
+from geometry_basics import Point
+
+# Compare the grid backend against the sorted reference implementation with random inserts,
+# removals and queries. Coordinates are on a coarse grid so that equal points and equal
+# distances (ties) are common.
+
+def _random_point(rnd):
+    return Point(rnd.randint(-50, 50) * 0.5, rnd.randint(-50, 50) * 0.5)
+
+def _check_queries(rnd, ref, grid):
+    assert len(ref) == len(grid)
+    for _ in range(20):
+        p = _random_point(rnd)
+        distance = rnd.choice([ 0, 0.5, 1, 3.3, 10, 40 ])
+        exclude_self = rnd.random() < 0.5
+        assert ref.find_nearest_within(p, distance, exclude_self) == grid.find_nearest_within(p, distance, exclude_self)
+        assert ref.find_all_within(p, distance) == grid.find_all_within(p, distance)
+        assert ref.find_all_within_list(p, distance) == grid.find_all_within_list(p, distance)
+        assert (p in ref) == (p in grid)
+
+def test_grid_matches_sorted_reference():
+    rnd = random.Random(1)
+    for cell_size in [ 1, 3.7, 20 ]:
+        ref = TwoDimSearch()
+        grid = GridTwoDimSearch(cell_size)
+        inserted = []
+        for _ in range(400):
+            op = rnd.random()
+            if op < 0.6 or len(inserted) == 0:
+                p = _random_point(rnd)
+                r = rnd.randint(0, 5)
+                ref.insert(p, r)
+                grid.insert(p, r)
+                inserted.append((p, r))
+            elif op < 0.85:
+                p, r = inserted.pop(rnd.randrange(len(inserted)))
+                if r in (ref[p] if p in ref else set()):
+                    ref.remove(p, r)
+                    grid.remove(p, r)
+            elif op < 0.95:
+                p, _ = rnd.choice(inserted)
+                if p in ref:
+                    ref.remove_set(p)
+                    grid.remove_set(p)
+            else:
+                r = rnd.randint(0, 5)
+                ref.remove_ref(r)
+                grid.remove_ref(r)
+            _check_queries(rnd, ref, grid)
+        assert [ set(refs) for refs in ref ] == [ set(refs) for refs in grid ]
+
+def test_remove_missing_raises_index_error():
+    for search in [ TwoDimSearch(), GridTwoDimSearch(2) ]:
+        search.insert(Point(1, 1), "a")
+        for fun in [ lambda s=search: s.remove(Point(1, 1), "b"), lambda s=search: s.remove(Point(2, 2), "a"), lambda s=search: s.remove_set(Point(2, 2)) ]:
+            try:
+                fun()
+                assert False, "expected IndexError"
+            except IndexError:
+                pass
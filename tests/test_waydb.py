@@ -0,0 +1,126 @@
+import pickle
+import random
+
+import pytest
+
+pytest.importorskip("shapely")
+pytest.importorskip("pyproj")
+
+# pylint: disable=wrong-import-position
+from geometry_basics import Point
+from nvdb_segment import NvdbSegment
+from waydb import WayDatabase
+
+def _empty_way_db():
+    db = WayDatabase.__new__(WayDatabase)
+    db.way_db = {}
+    db._dirty_rlids = set()
+    return db
+
+def _ref_points(count):
+    points = [ Point(float(i), 0.0) for i in range(count) ]
+    for i, p in enumerate(points):
+        p.dist = float(i)
+    return points
+
+# _split_and_merge() finds overlapping segments and split points with binary search. Check
+# the result against a straightforward model: every unit interval of the line must be covered
+# by exactly one segment, which has the union of the tags of all ways inserted over it.
+# Inserted ways use distinct keys, so there are no tag conflicts to resolve.
+def test_split_and_merge_matches_interval_model():
+    rnd = random.Random(2)
+    for _ in range(100):
+        db = _empty_way_db()
+        ref = _ref_points(60)
+        # the reference geometry layer is merged first and covers the whole RLID
+        db._split_and_merge(NvdbSegment({ "RLID": "R", "geometry": list(ref) }), "ref")
+        expected = [ {} for _ in range(len(ref) - 1) ]
+        for k in range(30):
+            a = rnd.randint(0, len(ref) - 2)
+            b = rnd.randint(a + 1, min(len(ref) - 1, a + rnd.randint(1, 20)))
+            # ways are aligned to the reference geometry, so they have all its points in range
+            pts = ref[a:b+1]
+            way = NvdbSegment({ "RLID": "R", "geometry": list(pts), f"T{k}": k })
+            db._split_and_merge(way, f"src{k}")
+            for i in range(a, b):
+                expected[i][f"T{k}"] = k
+
+        segs = db.way_db["R"]
+        for s1, s2 in zip(segs, segs[1:]):
+            assert s1.way[-1].dist <= s2.way[0].dist
+        for seg in segs:
+            dists = [ p.dist for p in seg.way ]
+            assert dists == sorted(dists) and len(set(dists)) == len(dists)
+        for i, tags in enumerate(expected):
+            covering = [ s for s in segs if s.way[0].dist <= i and s.way[-1].dist >= i + 1 ]
+            assert len(covering) == 1
+            seg_tags = { k: v for k, v in covering[0].tags.items() if k.startswith("T") }
+            assert seg_tags == tags
+
+# _seam_layers()
+#
+# Reference geometry and one line layer of three rows of roads, each split at x=150 into a
+# left and a right RLID, plus a stop node at the start of each right road. The start of the
+# right roads is placed 'offset' meters to the right, as if snapped differently in another tile.
+#
+def _seam_layers(rlids, offset):
+    def geometry(rlid, start, end):
+        y = float(int(rlid[1]) * 100)
+        xs = [ float(x) for x in range(start, end + 1, 25) ]
+        if rlid[0] == "R":
+            xs[0] += offset
+        return [ Point(x, y) for x in xs ]
+
+    def road(rlid):
+        return geometry(rlid, 0, 150) if rlid[0] == "L" else geometry(rlid, 150, 300)
+
+    ref = [ NvdbSegment({ "RLID": rlid, "geometry": road(rlid) }) for rlid in rlids ]
+    lines = [ NvdbSegment({ "RLID": rlid, "geometry": road(rlid), "STARTAVST": 0.0, "SLUTAVST": 1.0, "width": 5 }) for rlid in rlids ]
+    # a second layer over part of the right roads to split them into several segments
+    lines += [ NvdbSegment({ "RLID": rlid, "geometry": geometry(rlid, 150, 225), "STARTAVST": 0.0, "SLUTAVST": 0.5, "maxspeed": 50 })
+               for rlid in rlids if rlid[0] == "R" ]
+    nodes = [ NvdbSegment({ "RLID": rlid, "geometry": Point(150.0 + offset, float(int(rlid[1]) * 100)), "stop": "yes" })
+              for rlid in rlids if rlid[0] == "R" ]
+    return ref, lines, nodes
+
+def _merged_way_db(rlids, offset):
+    ref, lines, nodes = _seam_layers(rlids, offset)
+    db = WayDatabase(ref, True, "full")
+    for way in lines:
+        db.insert_rlid_way(way, "lines")
+    for node in nodes:
+        db.insert_rlid_node(node, "nodes")
+    return db
+
+def _way_db_summary(db):
+    def points(way):
+        return [ (p.x, p.y, round(p.dist, 6)) for p in way ]
+    return (sorted((rlid, [ (points(seg.way), sorted(seg.tags.items())) for seg in segs ]) for rlid, segs in db.way_db.items()),
+            sorted((rlid, [ points(way.way) for way in ways ]) for rlid, ways in db._ref_way_db.items()),
+            sorted(((p.x, p.y), [ node.rlid for node in nodes ]) for p, nodes in db.point_db.items()))
+
+# Stitch two tiles where the second has its seam endpoints slightly off, the result must be
+# the same as merging everything at once, with distances along the moved reference ways
+# updated and consistent hash keys for moved points.
+def test_from_tiles_matches_single_tile():
+    left = [ f"L{j}" for j in range(3) ]
+    right = [ f"R{j}" for j in range(3) ]
+    single = _merged_way_db(left + right, 0.0)
+
+    # the first tile reads both sides, the second only its own roads
+    tile1 = pickle.loads(pickle.dumps(_merged_way_db(left + right, 0.0).get_tile(set(left), [ 0, 0, 150, 300 ])))
+    tile2 = pickle.loads(pickle.dumps(_merged_way_db(right, 0.05).get_tile(set(right), [ 150, 0, 300, 300 ])))
+    # tiles are given as a generator, as when they are stitched while merging
+    stitched = WayDatabase.from_tiles((tile for tile in [ tile1, tile2 ]), True, "full")
+
+    assert _way_db_summary(stitched) == _way_db_summary(single)
+    stitched.test_segments()
+    for ways in stitched._ref_way_db.values():
+        for way in ways:
+            stitched._test_way_dist(way)
+    for p, nodes in stitched.point_db.items():
+        assert nodes[0].way == p and hash(p) == hash((p.x, p.y))
+    for rlid in right:
+        start = stitched.way_db[rlid][0].way[0]
+        assert stitched._ref_gs.find_reference_way(start, rlid) is stitched._ref_way_db[rlid][0]
+        assert len(stitched.topology.find_all_connecting_ways(start)) == 2
@@ -0,0 +1,114 @@
+from collections import deque
+
+# Topology
+#
+# Road network graph of a way database. Each point where segments have a vertex is a node
+# with an integer id, and each node has the set of segments with a vertex there. Lookups are
+# exact (no snapping), same as GeometrySearch.find_all_connecting_ways(), but the graph can
+# be kept up to date when segments are modified, and walks run on node ids.
+#
+# Reversing a segment does not change the graph. When the points of a segment are changed
+# remove_way() must be called before and add_way() after the change.
+#
+class Topology:
+
+    def __init__(self, way_db=None):
+        self._node_ids = {} # point => node id
+        self._node_ways = [] # node id => set of segments
+        if way_db is not None:
+            for segs in way_db.values():
+                for seg in segs:
+                    self.add_way(seg)
+
+    def __len__(self):
+        return len(self._node_ways)
+
+    def _get_or_add_node(self, point):
+        node_id = self._node_ids.get(point, None)
+        if node_id is None:
+            node_id = len(self._node_ways)
+            self._node_ids[point] = node_id
+            self._node_ways.append(set())
+        return node_id
+
+    def add_way(self, way):
+        for p in way.way:
+            self._node_ways[self._get_or_add_node(p)].add(way)
+
+    # add_point()
+    #
+    # Register a point inserted in a segment
+    #
+    def add_point(self, way, point):
+        self._node_ways[self._get_or_add_node(point)].add(way)
+
+    def remove_way(self, way):
+        for p in way.way:
+            node_id = self._node_ids.get(p, None)
+            if node_id is not None:
+                self._node_ways[node_id].discard(way)
+
+    def node_id(self, point):
+        return self._node_ids.get(point, None)
+
+    # end_nodes()
+    #
+    # Get node ids of the first and last point of a segment
+    #
+    def end_nodes(self, way):
+        return self._node_ids[way.way[0]], self._node_ids[way.way[-1]]
+
+    def ways_at_node(self, node_id):
+        return self._node_ways[node_id]
+
+    # find_all_connecting_ways()
+    #
+    # Get segments with a vertex in the given point (or any of the points in a list), same
+    # as GeometrySearch.find_all_connecting_ways(). A new set is returned, so the caller can
+    # modify it without affecting the graph.
+    #
+    def find_all_connecting_ways(self, point_or_list_of_points):
+        if isinstance(point_or_list_of_points, list):
+            ways = set()
+            for point in point_or_list_of_points:
+                node_id = self._node_ids.get(point, None)
+                if node_id is not None:
+                    ways.update(self._node_ways[node_id])
+            return ways
+        node_id = self._node_ids.get(point_or_list_of_points, None)
+        if node_id is None:
+            return set()
+        return set(self._node_ways[node_id])
+
+    # connected_via_endpoints()
+    #
+    # Breadth-first search from a segment, following segments connected at their endpoints
+    # that fulfill criteria_fun. Returns the set of reached segments, including the start.
+    #
+    def connected_via_endpoints(self, start_way, criteria_fun):
+        reached = { start_way }
+        queue = deque([ start_way ])
+        while len(queue) > 0:
+            way = queue.popleft()
+            for node_id in self.end_nodes(way):
+                for w in self._node_ways[node_id]:
+                    if w not in reached and criteria_fun(w):
+                        reached.add(w)
+                        queue.append(w)
+        return reached
+
+    # connected_components()
+    #
+    # Group segments fulfilling criteria_fun into sets connected via endpoints. The
+    # components are in the order of their first segment in 'ways'.
+    #
+    def connected_components(self, ways, criteria_fun):
+        processed = set()
+        components = []
+        for way in ways:
+            if way in processed or not criteria_fun(way):
+                continue
+            component = self.connected_via_endpoints(way, criteria_fun)
+            processed.update(component)
+            components.append(component)
+        return components
@@ -3,11 +3,47 @@
 # Search data structure with range functions for two-dimensional points (x,y). Should ideally
 # be implemented with 2dtree (or kdtree), but this is acceptable fast, often faster than
 # non-native kdtrees it seems
+#
+# GridTwoDimSearch has the same API but stores the points in a hash of fixed size grid cells,
+# which makes range searches touch only the cells overlapping the search box rather than a
+# full x-band. Which backend to use is selected at runtime with set_search_backend(), and
+# new_two_dim_search() should be used to create search objects. TwoDimSearch is kept as the
+# reference implementation.
 
 import math
 from sortedcontainers import SortedDict
 from geometry_basics import Point
 
+SEARCH_BACKENDS = [ "grid", "sorted" ]
+DEFAULT_GRID_CELL_SIZE = 10.0
+
+_search_backend = "grid"
+
+# set_search_backend()
+#
+# Select which implementation new_two_dim_search() returns, one of SEARCH_BACKENDS.
+#
+def set_search_backend(name):
+    global _search_backend # pylint: disable=global-statement
+    if name not in SEARCH_BACKENDS:
+        raise ValueError(f"Unknown search backend '{name}', must be one of {SEARCH_BACKENDS}")
+    _search_backend = name
+
+def get_search_backend():
+    return _search_backend
+
+# new_two_dim_search()
+#
+# Create a two-dimensional search object using the selected backend. 'cell_size' is a hint
+# of the typical search distance, used by the grid backend.
+#
+def new_two_dim_search(cell_size=None):
+    if _search_backend == "sorted":
+        return TwoDimSearch()
+    if cell_size is None:
+        cell_size = DEFAULT_GRID_CELL_SIZE
+    return GridTwoDimSearch(cell_size)
+
 class TwoDimSearch:
     def __init__(self):
         self.xmap = SortedDict({})
@@ -16,6 +52,14 @@ class TwoDimSearch:
         self._yit = None
         self._ymap = None
 
+    def __getstate__(self):
+        # iteration state cannot be pickled
+        state = self.__dict__.copy()
+        state["_xit"] = None
+        state["_yit"] = None
+        state["_ymap"] = None
+        return state
+
     @staticmethod
     def _calc_dist_sq(p, x, y):
         dx = p.x - x
@@ -168,3 +212,167 @@ class TwoDimSearch:
                 refs = ymap[y]
                 point_list.append((Point(x, y), refs))
         return point_list
+
+
+class GridTwoDimSearch:
+    def __init__(self, cell_size=DEFAULT_GRID_CELL_SIZE):
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive")
+        self._cell_size = float(cell_size)
+        self._cells = {} # (cell_x, cell_y) => { (x, y): set of refs }
+        self._len = 0
+
+    def _cell_idx(self, v):
+        return int(math.floor(v / self._cell_size))
+
+    def _cell_range(self, v, distance):
+        return range(self._cell_idx(v - distance), self._cell_idx(v + distance) + 1)
+
+    def _get_cell(self, point_x, point_y):
+        return self._cells.get((self._cell_idx(point_x), self._cell_idx(point_y)))
+
+    def _cells_within(self, point_x, point_y, distance):
+        cells = self._cells
+        for cx in self._cell_range(point_x, distance):
+            for cy in self._cell_range(point_y, distance):
+                cell = cells.get((cx, cy))
+                if cell is not None:
+                    yield cell
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        # same order as the reference implementation, sorted on x then y
+        keys = []
+        for cell in self._cells.values():
+            keys += [ (xy, cell) for xy in cell ]
+        keys.sort(key=lambda k: k[0])
+        for xy, cell in keys:
+            yield cell[xy]
+
+    def insert(self, point, ref):
+        point_x = point[0]
+        point_y = point[1]
+        cell_key = (self._cell_idx(point_x), self._cell_idx(point_y))
+        cell = self._cells.get(cell_key)
+        if cell is None:
+            cell = {}
+            self._cells[cell_key] = cell
+        xy = (point_x, point_y)
+        refs = cell.get(xy)
+        if refs is None:
+            cell[xy] = {ref}
+            self._len += 1
+        else:
+            refs.add(ref)
+
+    def _remove_xy(self, cell, xy):
+        del cell[xy]
+        self._len -= 1
+        if len(cell) == 0:
+            del self._cells[(self._cell_idx(xy[0]), self._cell_idx(xy[1]))]
+
+    def remove(self, point, ref):
+        xy = (point[0], point[1])
+        cell = self._get_cell(xy[0], xy[1])
+        if cell is not None and xy in cell:
+            refs = cell[xy]
+            try:
+                refs.remove(ref)
+                if len(refs) == 0:
+                    self._remove_xy(cell, xy)
+            except KeyError as e:
+                raise IndexError('ref does not exist for point') from e
+            return
+        raise IndexError('point does not exist')
+
+    # removes the point and all references associated to it
+    def remove_set(self, point):
+        xy = (point[0], point[1])
+        cell = self._get_cell(xy[0], xy[1])
+        if cell is not None and xy in cell:
+            self._remove_xy(cell, xy)
+            return
+        raise IndexError('point does not exist')
+
+    # traverses all points/sets and removes all occurances of ref. Warning: slow
+    def remove_ref(self, ref):
+        for cell_key, cell in list(self._cells.items()):
+            del_refs = []
+            for xy, refs in cell.items():
+                if ref in refs:
+                    refs.remove(ref)
+                    if len(refs) == 0:
+                        del_refs.append(xy)
+            for xy in del_refs:
+                del cell[xy]
+                self._len -= 1
+            if len(cell) == 0:
+                del self._cells[cell_key]
+
+    def find_nearest_within(self, point, distance, exclude_self = False):
+        point_x = point[0]
+        point_y = point[1]
+        min_x = point_x - distance
+        max_x = point_x + distance
+        min_y = point_y - distance
+        max_y = point_y + distance
+        distance_sq = distance * distance
+        min_dist = None
+        min_xy = None
+        min_refs = None
+        for cell in self._cells_within(point_x, point_y, distance):
+            for xy, refs in cell.items():
+                x, y = xy
+                if x < min_x or x > max_x or y < min_y or y > max_y:
+                    continue
+                if exclude_self and point_x == x and point_y == y:
+                    continue
+                dx = x - point_x
+                dy = y - point_y
+                dist = dx * dx + dy * dy
+                # on equal distance pick the lowest x,y, like the reference implementation
+                if min_dist is None or dist < min_dist or (dist == min_dist and xy < min_xy):
+                    min_dist = dist
+                    min_xy = xy
+                    min_refs = refs
+        if min_dist is None or min_dist > distance_sq:
+            return distance + 1, None, None
+        return math.sqrt(min_dist), Point(min_xy[0], min_xy[1]), min_refs
+
+    def __contains__(self, point):
+        cell = self._get_cell(point[0], point[1])
+        return cell is not None and (point[0], point[1]) in cell
+
+    def __getitem__(self, point):
+        cell = self._get_cell(point[0], point[1])
+        if cell is not None:
+            refs = cell.get((point[0], point[1]))
+            if refs is not None:
+                return refs
+        raise IndexError('point does not exist')
+
+    def _find_all_within_items(self, point, distance):
+        point_x = point[0]
+        point_y = point[1]
+        min_x = point_x - distance
+        max_x = point_x + distance
+        min_y = point_y - distance
+        max_y = point_y + distance
+        for cell in self._cells_within(point_x, point_y, distance):
+            for xy, refs in cell.items():
+                if min_x <= xy[0] <= max_x and min_y <= xy[1] <= max_y:
+                    yield xy, refs
+
+    def find_all_within(self, point, distance):
+        refs = set()
+        for _, point_refs in self._find_all_within_items(point, distance):
+            refs.update(point_refs)
+        return refs
+
+    def find_all_within_list(self, point, distance):
+        items = list(self._find_all_within_items(point, distance))
+        # callers may depend on the order, sort on x then y like the reference implementation
+        items.sort(key=lambda item: item[0])
+        return [ (Point(xy[0], xy[1]), refs) for xy, refs in items ]
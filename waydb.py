@@ -1,10 +1,14 @@
+import bisect
 import logging
+import random
 from functools import cmp_to_key
 
-from twodimsearch import TwoDimSearch
+from twodimsearch import new_two_dim_search
 from geometry_search import GeometrySearch
+from topology import Topology
 from geometry_basics import *
 from merge_tags import merge_tags
+from nvdb_segment import intern_tags
 from proj_xy import latlon_str
 from shapely_utils import *
 from nseg_tools import *
@@ -12,6 +16,19 @@ from osmxml import *
 
 GEO_FILL_LENGTH = 50
 
+def _seg_end_dist(seg):
+    return seg.way[-1].dist
+
+def _point_dist(p):
+    return p.dist
+
+# Self test modes, for the tests made while merging:
+#  full:        test all segments after each layer
+#  incremental: only test segments of RLIDs modified since last test
+#  sampled:     as incremental, but only test a random fraction of the RLIDs
+#  off:         no self tests
+SELF_TEST_MODES = [ "full", "incremental", "sampled", "off" ]
+
 _log = logging.getLogger("waydb")
 
 # join_ways()
@@ -43,13 +60,13 @@ def join_ways(ways):
         for idx, w2 in enumerate(ways):
             if w1.way[-1] == w2.way[0]:
                 w1.way += w2.way[1:]
-                w1.tags["SLUTAVST"] = w2.tags["SLUTAVST"]
+                w1.mutable_tags()["SLUTAVST"] = w2.tags["SLUTAVST"]
                 match = True
                 del ways[idx]
                 break
             if w1.way[0] == w2.way[-1]:
                 w1.way = w2.way[:-1] + w1.way
-                w1.tags["STARTAVST"] = w2.tags["STARTAVST"]
+                w1.mutable_tags()["STARTAVST"] = w2.tags["STARTAVST"]
                 match = True
                 del ways[idx]
                 break
@@ -133,7 +150,7 @@ def join_ways_using_nvdb_tags(ways, snap_dist):
             new_ways.append(pw)
         elif pw.tags["SLUTAVST"] == w.tags["STARTAVST"]:
             # perfect join, extend 'pw' with 'w'
-            w.tags["STARTAVST"] = pw.tags["STARTAVST"]
+            w.mutable_tags()["STARTAVST"] = pw.tags["STARTAVST"]
             w.way = pw.way + w.way # we probably add a double point here, removed elsewhere
         elif pw.tags["SLUTAVST"] >= w.tags["SLUTAVST"]:
             # 'pw' spans the whole of 'w', discard 'w'
@@ -151,7 +168,7 @@ def join_ways_using_nvdb_tags(ways, snap_dist):
                     nw.append(p)
                 else:
                     break
-            w.tags["STARTAVST"] = pw.tags["STARTAVST"]
+            w.mutable_tags()["STARTAVST"] = pw.tags["STARTAVST"]
             w.way = nw + w.way
         pw = w
     new_ways += [ pw ]
@@ -334,18 +351,11 @@ class WayDatabase:
     MAX_SNAP_DISTANCE = 2
     EMERGENCY_SNAP_DISTANCE = 7
 
-    def __init__(self, reference_geometry, perform_self_testing=True):
+    def __init__(self, reference_geometry, perform_self_testing=True, self_test_mode="incremental", self_test_sample_fraction=1.0):
 
         _log.info("Setting up way database and cleaning reference geometry...")
 
-        self.way_db = {}
-        self.point_db = {}
-        self.gs = None
-        self._ref_gs = GeometrySearch(GEO_FILL_LENGTH, use_dist=True, perform_self_testing=perform_self_testing)
-        self._ref_way_db = {}
-        self._way_db_iter = None
-        self._way_db_sub_iter = None
-        self._perform_self_testing = perform_self_testing
+        self._init_empty(perform_self_testing, self_test_mode, self_test_sample_fraction)
 
         # Expected properties of 'reference_geometry':
         #
@@ -364,7 +374,7 @@ class WayDatabase:
 
         # group segments per RLID, and register all endpoints and midpoints (=non-endpoints) for searching
         rlid_ways = {}
-        endpoints = TwoDimSearch()
+        endpoints = new_two_dim_search()
         point_count = 0
         last_print = 0
         _log.info("Setting up endpoint 2D search data structures...")
@@ -391,7 +401,7 @@ class WayDatabase:
         ep_count = 0
         uc_count = 0
         second_pass = []
-        midpoints = TwoDimSearch()
+        midpoints = new_two_dim_search()
         for ways in rlid_ways.values():
             for way in ways:
                 for mp in way.way[1:-1]:
@@ -454,6 +464,169 @@ class WayDatabase:
         self._insert_into_reference_geometry(rlid_ways, endpoints)
         _log.info("done")
 
+    def _init_empty(self, perform_self_testing, self_test_mode, self_test_sample_fraction):
+        self.way_db = {}
+        self.point_db = {}
+        self.gs = None
+        self.topology = None
+        self._ref_gs = GeometrySearch(GEO_FILL_LENGTH, use_dist=True, perform_self_testing=perform_self_testing)
+        self._ref_way_db = {}
+        self._way_db_iter = None
+        self._way_db_sub_iter = None
+        self._perform_self_testing = perform_self_testing
+        self._self_test_mode = self_test_mode
+        self._self_test_sample_fraction = self_test_sample_fraction
+        self._self_test_random = random.Random(0) # fixed seed so runs are repeatable
+        self._dirty_rlids = set() # RLIDs with segments modified since last test_segments()
+        self._all_dirty = False
+        self._repair_count = 0
+        self._added_ref_rlids = set() # RLIDs added by insert_missing_reference_geometry_if_any()
+
+    # get_tile()
+    #
+    # Get the part of the database belonging to a tile, for stitching together with other
+    # tiles using from_tiles(). The tile owns the given RLIDs, and nodes placed on their
+    # reference geometry. RLIDs that were added to the reference geometry from other layers,
+    # and nodes not placed on any reference geometry, are owned if they start inside the tile's
+    # core bounding box (minx, miny, maxx, maxy), lower bounds inclusive.
+    #
+    def get_tile(self, owned_rlids, core_bounds):
+        def in_core(p):
+            return core_bounds[0] <= p.x < core_bounds[2] and core_bounds[1] <= p.y < core_bounds[3]
+
+        way_db = {}
+        ref_way_db = {}
+        owned_points = set()
+        ref_points = set()
+        for rlid, ways in self._ref_way_db.items():
+            for way in ways:
+                ref_points.update(way.way)
+            if rlid in owned_rlids or (rlid in self._added_ref_rlids and in_core(ways[0].way[0])):
+                ref_way_db[rlid] = ways
+                if rlid in self.way_db:
+                    way_db[rlid] = self.way_db[rlid]
+                for way in ways:
+                    owned_points.update(way.way)
+        point_db = {}
+        for p, nodes in self.point_db.items():
+            if p in owned_points:
+                point_db[p] = nodes
+            elif p not in ref_points and in_core(p):
+                point_db[p] = nodes
+        return way_db, point_db, ref_way_db
+
+    # from_tiles()
+    #
+    # Make a database from tiles made with get_tile(), with disjoint RLIDs. Reference way
+    # endpoints of different tiles that are not exactly at the same position but within snap
+    # distance are stitched together, by moving them to the position in the first tile.
+    # 'tiles' can be a generator, each tile is stitched in as it is received so that only the
+    # result and the current tile need to be kept in memory.
+    #
+    @classmethod
+    def from_tiles(cls, tiles, perform_self_testing=True, self_test_mode="incremental", self_test_sample_fraction=1.0):
+        _log.info("Stitching together tiles...")
+        db = cls.__new__(cls)
+        db._init_empty(perform_self_testing, self_test_mode, self_test_sample_fraction)
+
+        endpoints = new_two_dim_search()
+        stitch_count = 0
+        tile_count = 0
+        for tile_idx, (way_db, point_db, ref_way_db) in enumerate(tiles):
+            tile_count += 1
+            moves = {}
+            for ways in ref_way_db.values():
+                for way in ways:
+                    for ep in (way.way[0], way.way[-1]):
+                        _, p, tile_idxs = endpoints.find_nearest_within(ep, cls.POINT_SNAP_DISTANCE)
+                        if p is not None and p != ep and tile_idx not in tile_idxs:
+                            moves[(ep.x, ep.y)] = (p.x, p.y)
+                        else:
+                            endpoints.insert(ep, tile_idx)
+            if len(moves) > 0:
+                stitch_count += len(moves)
+                cls._move_tile_points(way_db, point_db, ref_way_db, moves)
+
+            for rlid, ways in ref_way_db.items():
+                if rlid in db._ref_way_db:
+                    raise RuntimeError(f"RLID {rlid} is in more than one tile")
+                db._ref_way_db[rlid] = ways
+                for way in ways:
+                    db._ref_gs.insert(way, keep_dist=True)
+            db.way_db.update(way_db)
+            for nodes in point_db.values():
+                # nodes may have been moved above, so the (new) node position is used as key
+                p = nodes[0].way
+                if p in db.point_db:
+                    _log.debug(f"Node at {latlon_str(p)} is in more than one tile, keeping the first")
+                    continue
+                db.point_db[p] = nodes
+        _log.info(f"done ({tile_count} tiles, {len(db._ref_way_db)} RLIDs, {stitch_count} endpoints stitched at tile seams)")
+
+        db.setup_geometry_search()
+        return db
+
+    # _move_tile_points()
+    #
+    # Move points of a tile from the positions in 'moves' to their new positions. Points are
+    # hash keys in point_db and search structures, so moved points are replaced with new Point
+    # objects rather than changed in place. Distances along reference ways with moved points
+    # are recalculated, and segment points get the new distance of their reference point.
+    #
+    @staticmethod
+    def _move_tile_points(way_db, point_db, ref_way_db, moves):
+        new_points = {} # id of replaced point => new point, so shared points stay shared
+
+        def new_point(p, dist):
+            if id(p) not in new_points:
+                x, y = moves.get((p.x, p.y), (p.x, p.y))
+                new_p = Point(x, y)
+                new_p.dist = dist
+                new_p.node_id = p.node_id
+                new_points[id(p)] = new_p
+            return new_points[id(p)]
+
+        for rlid, ways in ref_way_db.items():
+            ref_points = {} # (x, y, old dist) => new point
+            for way in ways:
+                if not any((p.x, p.y) in moves for p in way.way):
+                    continue
+                offset = 0
+                prev_moved = False
+                for idx, p in enumerate(way.way):
+                    moved = (p.x, p.y) in moves
+                    if moved or prev_moved or offset != 0:
+                        new_p = new_point(p, p.dist + offset)
+                        if idx > 0 and (moved or prev_moved):
+                            new_p.dist = way.way[idx-1].dist + dist2d(way.way[idx-1], new_p)
+                            offset = new_p.dist - p.dist
+                        ref_points[(p.x, p.y, p.dist)] = new_p
+                        way.way[idx] = new_p
+                    prev_moved = moved
+            for seg in way_db.get(rlid, []):
+                for idx, p in enumerate(seg.way):
+                    if (p.x, p.y, p.dist) in ref_points:
+                        seg.way[idx] = ref_points[(p.x, p.y, p.dist)]
+
+        # remaining points at moved positions, that is nodes and any segment points not found
+        # in the reference geometry
+        for ways in way_db.values():
+            for way in ways:
+                for idx, p in enumerate(way.way):
+                    if (p.x, p.y) in moves:
+                        way.way[idx] = new_point(p, p.dist)
+        for nodes in point_db.values():
+            for node in nodes:
+                if (node.way.x, node.way.y) in moves:
+                    node.way = new_point(node.way, node.way.dist)
+
+    def __getstate__(self):
+        # iteration state cannot be pickled
+        state = self.__dict__.copy()
+        state["_way_db_iter"] = None
+        state["_way_db_sub_iter"] = None
+        return state
+
     def __iter__(self):
         self._way_db_iter = iter(self.way_db.values())
         self._way_db_sub_iter = None
@@ -599,7 +772,7 @@ class WayDatabase:
             return False
 
         # snap endpoints to self
-        endpoints = TwoDimSearch()
+        endpoints = new_two_dim_search()
         rlids = []
         for ways in list(missing_ways.values()):
 
@@ -620,6 +793,7 @@ class WayDatabase:
         for rlid in rlids:
             if rlid in self._ref_way_db:
                 _log.warning(f"RLID {rlid} was not in reference geometry, inserted it.")
+                self._added_ref_rlids.add(rlid)
                 did_insert = True
         return did_insert
 
@@ -653,6 +827,7 @@ class WayDatabase:
         return did_snap
 
     def _add_node_into_way(self, rlid, point):
+        self._dirty_rlids.add(rlid)
         segs = self.way_db.get(rlid, [])
         for seg in segs:
             for idx, p in enumerate(seg.way):
@@ -662,6 +837,8 @@ class WayDatabase:
                 if is_between:
                     point.dist = seg.way[idx-1].dist + dist2d(seg.way[idx-1], point)
                     seg.way.insert(idx, point)
+                    if self.topology is not None:
+                        self.topology.add_point(seg, point)
                     return
         _log.warning(f"node {latlon_str(point)} not found in any way segment for RLID {rlid}")
 
@@ -671,6 +848,7 @@ class WayDatabase:
             # skipping (extremely short) ways that were reduced to one point
             return
 
+        self._dirty_rlids.add(way.rlid)
         if not way.rlid in self.way_db:
             # first segment for rlid
             self.way_db[way.rlid] = [ way ]
@@ -689,11 +867,11 @@ class WayDatabase:
 
         segs_idx = 0
         while segs_idx < len(segs): # we modify segs inside, so can't use for loop
+            # skip segs before way, segs are ordered on dist and don't overlap so we can use binary search
+            segs_idx = bisect.bisect_right(segs, way.way[0].dist, lo=segs_idx, key=_seg_end_dist)
+            if segs_idx == len(segs):
+                break
             seg = segs[segs_idx]
-            if seg.way[-1].dist <= way.way[0].dist:
-                # seg is before way
-                segs_idx += 1
-                continue
 
             if seg.way[0].dist >= way.way[-1].dist:
                 # seg is after way, no overlap
@@ -704,14 +882,10 @@ class WayDatabase:
             # way starts somewhere inside seg, scan to start of way
             #print("way         ", way)
             #print("matching seg", seg)
-            seg_idx = 0
-            while seg_idx < len(seg.way):
-                if seg.way[seg_idx].dist >= way.way[0].dist:
-                    if seg.way[seg_idx].dist > way.way[0].dist:
-                        # start of way is a new point, insert
-                        seg.way.insert(seg_idx, way.way[0])
-                    break
-                seg_idx += 1
+            seg_idx = bisect.bisect_left(seg.way, way.way[0].dist, key=_point_dist)
+            if seg_idx < len(seg.way) and seg.way[seg_idx].dist > way.way[0].dist:
+                # start of way is a new point, insert
+                seg.way.insert(seg_idx, way.way[0])
 
             if seg_idx > 0:
                 # split out segment which is before way
@@ -764,16 +938,24 @@ class WayDatabase:
             _log.debug(f"Skipping RLID {way.rlid} (not in reference geometry)")
             return
 
+        # adapting may change reference geometry of the RLID, and thus existing segments
+        self._dirty_rlids.add(way.rlid)
+        self._ref_gs.clear_modified_rlids()
         _, ways = self._adapt_way_into_reference_geometry(way, data_src_name)
         for w in ways:
             if debug_ways is not None:
                 debug_ways.append(w.make_copy_new_way(copy_way(w.way)))
             self._split_and_merge(w, data_src_name)
 
-        if self._perform_self_testing:
+        if self._perform_self_testing and self._sample_self_test():
             if way.rlid in self.way_db:
                 self._test_segment(self.way_db[way.rlid])
 
+    def _sample_self_test(self):
+        if self._self_test_mode != "sampled":
+            return True
+        return self._self_test_random.random() < self._self_test_sample_fraction
+
     def _test_segment(self, segs):
         it = iter(segs)
         prev = next(it)
@@ -1033,6 +1215,7 @@ class WayDatabase:
 
     def remove_short_sub_segments(self):
         _log.info("Removing short sub-segments...")
+        self._all_dirty = True
         # "Remove" in this context means merging with neighbor segment
         remove_count = 0
         for segs in list(self.way_db.values()):
@@ -1077,6 +1260,7 @@ class WayDatabase:
                 else:
                     self.way_db[segs[0].rlid] = new_segs
 
+        self._rebuild_topology_if_any()
         _log.info(f"done ({remove_count} short sub-segments were removed)")
 
         self.join_segments_with_same_tags()
@@ -1092,8 +1276,13 @@ class WayDatabase:
     def _fix_after_failed_adapt_geometry_way_insert(self):
         # we may now have more points in ref geometry than in actual segments.
         # This should be called rarely, easier to add in points than to clean up reference geometry.
-        for segs in self.way_db.values():
-            for seg in segs:
+        # Only RLIDs with reference ways that got new points since the insert started can be affected.
+        rlids = self._ref_gs.get_modified_rlids()
+        self._ref_gs.clear_modified_rlids()
+        self._repair_count += 1
+        insert_count = 0
+        for rlid in sorted(rlids, key=str):
+            for seg in self.way_db.get(rlid, []):
                 ref_way = self._ref_gs.find_reference_way(seg.way[0], seg.rlid)
                 ref_idx = 0
                 while ref_idx < len(ref_way.way) and ref_way.way[ref_idx] != seg.way[0]:
@@ -1102,19 +1291,76 @@ class WayDatabase:
                 while seg_idx < len(seg.way):
                     if seg.way[seg_idx].dist != ref_way.way[ref_idx].dist:
                         seg.way.insert(seg_idx, ref_way.way[ref_idx])
+                        self._dirty_rlids.add(seg.rlid)
+                        insert_count += 1
                         _log.info("Inserting extra point in geometry to compensate failed or reduced insert")
                     ref_idx += 1
                     seg_idx += 1
+        _log.info(f"Repair after failed or reduced insert #{self._repair_count}: checked {len(rlids)} RLIDs, inserted {insert_count} points")
 
+    # test_segments()
+    #
+    # Test that segments are consistent with the reference geometry. Depending on self test
+    # mode all segments are tested, or only those of RLIDs modified since the last call.
+    #
     def test_segments(self):
-        for segs in self.way_db.values():
+        if self._self_test_mode == "full" or self._all_dirty:
+            rlids = list(self.way_db.keys())
+        else:
+            rlids = sorted(self._dirty_rlids, key=str)
+        self._dirty_rlids = set()
+        self._all_dirty = False
+        test_count = 0
+        for rlid in rlids:
+            segs = self.way_db.get(rlid, None)
+            if segs is None or not self._sample_self_test():
+                continue
             self._test_segment(segs)
+            test_count += 1
+        _log.debug(f"Tested segments of {test_count} of {len(self.way_db)} RLIDs")
+
+    # get_stats()
+    #
+    # Get object counts, for statistics
+    #
+    def get_stats(self):
+        stats = {
+            "rlids": len(self.way_db),
+            "segments": 0,
+            "segment_points": 0,
+            "nodes": 0,
+            "reference_ways": 0,
+            "reference_points": 0
+        }
+        for segs in self.way_db.values():
+            stats["segments"] += len(segs)
+            for seg in segs:
+                stats["segment_points"] += len(seg.way)
+        for nodes in self.point_db.values():
+            stats["nodes"] += len(nodes)
+        for ways in self._ref_way_db.values():
+            stats["reference_ways"] += len(ways)
+            for way in ways:
+                stats["reference_points"] += len(way.way)
+        for k, v in self._ref_gs.get_stats().items():
+            stats["reference_index_" + k] = v
+        if self.gs is not None:
+            for k, v in self.gs.get_stats().items():
+                stats["index_" + k] = v
+        if self.topology is not None:
+            stats["topology_nodes"] = len(self.topology)
+        return stats
 
     def setup_geometry_search(self):
         _log.info("Setting up search data structure for all geometry...")
         self.gs = GeometrySearch(GEO_FILL_LENGTH, use_dist=False, perform_self_testing=self._perform_self_testing)
         self.gs.insert_waydb(self.way_db)
-        _log.info("done")
+        self.topology = Topology(self.way_db)
+        _log.info(f"done ({len(self.topology)} topology nodes)")
+
+    def _rebuild_topology_if_any(self):
+        if self.topology is not None:
+            self.topology = Topology(self.way_db)
 
     def get_endpoint_map(self):
         endpoints = {}
@@ -1144,7 +1390,7 @@ class WayDatabase:
                 p1 = w1.way[-2]
                 w1_start = False
             for w2 in ways:
-                if w1 == w2 or w1.tags != w2.tags:
+                if w1 == w2 or not w1.same_tags(w2):
                     continue
                 w2_closed = w2.way[0] == w2.way[-1]
                 if w2.way[0] == ep:
@@ -1259,6 +1505,8 @@ class WayDatabase:
             new_rlid.sort()
             new_rlid = ";".join(new_rlid)
             rlid_join_count += 1
+            if self.topology is not None:
+                self.topology.remove_way(join_way)
             if seg.way[0] == join_way.way[-1]:
                 seg.way.pop(0)
                 seg.way = join_way.way + seg.way
@@ -1270,6 +1518,8 @@ class WayDatabase:
                 _log.error(f"{join_way.rlid}, {join_way.way}")
                 raise RuntimeError("Disconnected segments cannot be joined")
             join_way.way = None
+            if self.topology is not None:
+                self.topology.add_way(seg)
 
             seg.rlid = new_rlid
             if new_rlid in self.way_db:
@@ -1282,12 +1532,30 @@ class WayDatabase:
 
         return rlid_join_count
 
+    # intern_tags()
+    #
+    # Make segments and nodes with equal tags share storage (copy-on-write, see NvdbSegment)
+    #
+    def intern_tags(self):
+        interned = {}
+        seg_count = 0
+        for segs in self.way_db.values():
+            intern_tags(segs, interned)
+            seg_count += len(segs)
+        for nodes in self.point_db.values():
+            intern_tags(nodes, interned)
+            seg_count += len(nodes)
+        tag_set_count = sum(1 for k in interned if k[0] == "tags")
+        _log.info(f"Segments and nodes share {tag_set_count} distinct tag sets ({seg_count} elements)")
+
     def join_segments_with_same_tags(self, join_rlid=False):
 
+        self.intern_tags()
         if join_rlid:
             _log.info("Joining segments with same tags even if different RLID...")
         else:
             _log.info("Joining RLID segments with same tags...")
+        self._all_dirty = True
         join_count = 0
         for segs in self.way_db.values():
             it = iter(segs)
@@ -1299,10 +1567,14 @@ class WayDatabase:
                     raise RuntimeError("Short way")
                 if len(seg.way) < 2:
                     raise RuntimeError("Short way %s %s" % (seg, segs))
-                if lastseg.way[-1] == seg.way[0] and lastseg.tags == seg.tags:
+                if lastseg.way[-1] == seg.way[0] and lastseg.same_tags(seg):
                     join_count += 1
+                    if self.topology is not None:
+                        self.topology.remove_way(seg)
                     seg.way.pop(0)
                     lastseg.way += seg.way
+                    if self.topology is not None:
+                        self.topology.add_way(lastseg)
                 else:
                     nsegs.append(seg)
                 prev = seg
@@ -1321,7 +1593,7 @@ class WayDatabase:
             #
             directional_nodes = get_directional_nodes(self.point_db)
             rlid_join_count = 0
-            endpoints = TwoDimSearch()
+            endpoints = new_two_dim_search()
             all_segs = set()
             for segs in self.way_db.values():
                 for seg in segs:
@@ -1358,7 +1630,7 @@ class WayDatabase:
         reverse_count = 0
         decided_count = 0
         not_oriented = set()
-        oriented_endpoints = TwoDimSearch()
+        oriented_endpoints = new_two_dim_search()
         directional_nodes = get_directional_nodes(self.point_db)
         for segs in self.way_db.values():
             for seg in segs:
@@ -1446,11 +1718,16 @@ class WayDatabase:
                 nway += simplify_way(seg.way[start:], epsilon)
                 old_point_count += len(seg.way)
                 new_point_count += len(nway)
+                if self.topology is not None:
+                    self.topology.remove_way(seg)
                 seg.way = nway
+                if self.topology is not None:
+                    self.topology.add_way(seg)
         _log.info(f"done ({old_point_count} => {new_point_count} points)")
 
     def remove_segments_outside_area(self, geometry):
         _log.info("Remove all segments completely outside reference area...")
+        self._all_dirty = True
         remove_count = 0
         remove_rlid = []
         for rlid, segs in self.way_db.items():
@@ -1470,4 +1747,5 @@ class WayDatabase:
                 remove_rlid.append(rlid)
         for rlid in remove_rlid:
             del self.way_db[rlid]
+        self._rebuild_topology_if_any()
         _log.info(f"done ({remove_count} segments removed)")